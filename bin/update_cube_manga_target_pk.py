@@ -13,15 +13,89 @@ from __future__ import absolute_import
 import argparse
 import os
 import sys
+import warnings
 
 from mangaSampleDB.utils import create_connection
 
+import sqlalchemy as sql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 
+# Updates a range of cube pks. If a mangaid is repeated in manga_target, the
+# lowest pk is used. Rows that already have the right value are not touched.
+_update_sql = sql.text("""
+    UPDATE mangadatadb.cube AS cube
+    SET manga_target_pk = target.pk
+    FROM (SELECT mangaid, min(pk) AS pk
+          FROM mangasampledb.manga_target GROUP BY mangaid) AS target
+    WHERE target.mangaid = cube.mangaid
+        AND cube.pk >= :start AND cube.pk < :stop
+        AND cube.manga_target_pk IS DISTINCT FROM target.pk
+""")
+
+_unmatched_sql = sql.text("""
+    SELECT DISTINCT cube.mangaid
+    FROM mangadatadb.cube AS cube
+    LEFT JOIN mangasampledb.manga_target AS target
+        ON target.mangaid = cube.mangaid
+    WHERE target.pk IS NULL
+    ORDER BY cube.mangaid
+""")
+
+
+def _report(n_updated, unmatched):
+    """Prints the number of updated cubes and the unmatched mangaids."""
+
+    print('INFO: updated manga_target_pk for {0} cubes.'.format(n_updated))
+
+    if len(unmatched) > 0:
+        warnings.warn('{0} mangaids in mangadatadb.cube have no match in '
+                      'mangasampledb.manga_target: {1}'
+                      .format(len(unmatched), ', '.join(unmatched)),
+                      UserWarning)
+
+
+def update_cube_manga_target_pk_bulk(engine, chunk_size=10000):
+    """Matches mangadatadb.cube.manga_target_pk using set-based updates.
+
+    The match is done with one ``UPDATE ... FROM mangasampledb.manga_target``
+    for each range of ``chunk_size`` cube pks. Each range is committed
+    independently to keep locks short.
+
+    Returns a tuple with the number of updated cubes and the list of mangaids
+    in mangadatadb.cube that are not in mangasampledb.manga_target.
+
+    """
+
+    with engine.connect() as connection:
+        min_pk, max_pk = connection.execute(
+            'SELECT min(pk), max(pk) FROM mangadatadb.cube').fetchone()
+
+    n_updated = 0
+
+    if min_pk is not None:
+        for start in range(min_pk, max_pk + 1, chunk_size):
+            with engine.begin() as connection:
+                result = connection.execute(
+                    _update_sql, start=start, stop=start + chunk_size)
+                n_updated += result.rowcount
+
+    with engine.connect() as connection:
+        unmatched = [row[0] for row in connection.execute(_unmatched_sql)]
+
+    _report(n_updated, unmatched)
+
+    return n_updated, unmatched
+
+
 def update_cube_manga_target_pk(engine):
-    """Matches mangadatadb.cube.manga_target_pk with mangasampledb.manga_target.pk."""
+    """Matches mangadatadb.cube.manga_target_pk with mangasampledb.manga_target.pk.
+
+    Uses the ORM to update each cube independently. See
+    `update_cube_manga_target_pk_bulk` for a faster, set-based version.
+
+    """
 
     # Creates DB session
 
@@ -38,11 +112,23 @@ def update_cube_manga_target_pk(engine):
         __tablename__ = 'cube'
         __table_args__ = {'autoload': True, 'schema': 'mangadatadb'}
 
+    n_updated = 0
+    unmatched = set()
+
     with session.begin():
         for cc in session.query(Cube).all():
             target = session.query(MangaTarget).filter(
                 MangaTarget.mangaid == cc.mangaid).scalar()
+            if target is None:
+                unmatched.add(cc.mangaid)
+                continue
             cc.manga_target_pk = target.pk
+            n_updated += 1
+
+    unmatched = sorted(unmatched)
+    _report(n_updated, unmatched)
+
+    return n_updated, unmatched
 
 
 if __name__ == '__main__':
@@ -51,6 +137,15 @@ if __name__ == '__main__':
         prog=os.path.basename(sys.argv[0]),
         description=('Updated mangadatadb.cube.manga_target_pk'))
 
+    parser.add_argument('--orm', dest='orm', action='store_true',
+                        default=False,
+                        help='Updates each cube using the ORM instead of '
+                             'set-based updates.')
+    parser.add_argument('-c', '--chunk-size', dest='chunk_size', type=int,
+                        default=10000,
+                        help='Number of cube pks updated in each '
+                             'transaction.')
+
     parser_db = parser.add_argument_group(title='Database connect arguments')
     parser_db.add_argument('-d', '--database', dest='database', type=str,
                            default='manga', help='The database name.')
@@ -71,4 +166,7 @@ if __name__ == '__main__':
                                host=args.host,
                                port=args.port)
 
-    update_cube_manga_target_pk(engine)
+    if args.orm:
+        update_cube_manga_target_pk(engine)
+    else:
+        update_cube_manga_target_pk_bulk(engine, chunk_size=args.chunk_size)
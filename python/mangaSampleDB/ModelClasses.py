@@ -21,20 +21,28 @@ from sqlalchemy.orm import relationship, configure_mappers, backref
 from sqlalchemy.inspection import inspect
 from sqlalchemy import case
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
-from sqlalchemy import ForeignKeyConstraint, func
+from sqlalchemy import ForeignKeyConstraint, Table, func, text
 import shutil
 import re
 import math
 import itertools
+import threading
 
-try:
-    import cStringIO as StringIO
-except ImportError:
-    from io import StringIO
+from io import BytesIO
+
+from mangaSampleDB.metadata_cache import loadCachedMetadata, saveCachedMetadata
 
 db = DatabaseConnection()
 Base = db.Base
 
+# If the reflected tables have been cached for the current schema, copies
+# them to the metadata. The classes below use keep_existing, so they pick up
+# the cached tables instead of reflecting them again.
+cachedMetadata, cachePath = loadCachedMetadata(db.engine)
+if cachedMetadata is not None:
+    for cachedTable in cachedMetadata.tables.values():
+        cachedTable.tometadata(Base.metadata)
+
 
 def cameliseClassname(tableName):
     """Produce a camelised class name."""
@@ -45,7 +53,8 @@ def cameliseClassname(tableName):
 
 
 def ClassFactory(name, tableName, BaseClass=db.Base, fks=None):
-    tableArgs = [{'autoload': True, 'schema': 'mangasampledb'}]
+    tableArgs = [{'autoload': True, 'schema': 'mangasampledb',
+                  'keep_existing': True}]
     if fks:
         for fk in fks:
             tableArgs.insert(0, ForeignKeyConstraint([fk[0]], [fk[1]]))
@@ -60,7 +69,8 @@ def ClassFactory(name, tableName, BaseClass=db.Base, fks=None):
 
 class MangaTarget(Base):
     __tablename__ = 'manga_target'
-    __table_args__ = {'autoload': True, 'schema': 'mangasampledb'}
+    __table_args__ = {'autoload': True, 'schema': 'mangasampledb',
+                      'keep_existing': True}
 
     def __repr__(self):
         return '<MangaTarget (pk={0}, mangaid={1})>'.format(self.pk,
@@ -69,7 +79,8 @@ class MangaTarget(Base):
 
 class Anime(Base):
     __tablename__ = 'anime'
-    __table_args__ = {'autoload': True, 'schema': 'mangasampledb'}
+    __table_args__ = {'autoload': True, 'schema': 'mangasampledb',
+                      'keep_existing': True}
 
     def __repr__(self):
         return '<Anime (pk={0}, anime={1})>'.format(self.pk, self.anime)
@@ -77,7 +88,8 @@ class Anime(Base):
 
 class Character(Base):
     __tablename__ = 'character'
-    __table_args__ = {'autoload': True, 'schema': 'mangasampledb'}
+    __table_args__ = {'autoload': True, 'schema': 'mangasampledb',
+                      'keep_existing': True}
 
     target = relationship(MangaTarget, backref='character', uselist=False)
     anime = relationship(Anime, backref='characters')
@@ -86,10 +98,23 @@ class Character(Base):
         return '<Character (pk={0}, name={1})>'.format(self.pk, self.name)
 
     def savePicture(self, path):
-        """Saves the picture blob to disk."""
+        """Saves the picture blob to disk.
+
+        If the picture has been deduplicated, it is read from the
+        mangasampledb.character_picture table.
+
+        """
 
-        buf = StringIO(self.picture)
-        with open(path, 'w') as fd:
+        picture = self.picture
+        if picture is None and getattr(self, 'picture_pk', None) is not None:
+            # The sharedPicture relationship is created with CharacterPicture.
+            with _lazyLock:
+                if 'CharacterPicture' not in globals():
+                    _createCharacterPictureClass()
+            picture = self.sharedPicture.picture
+
+        buf = BytesIO(picture)
+        with open(path, 'wb') as fd:
             buf.seek(0)
             shutil.copyfileobj(buf, fd)
 
@@ -98,7 +123,8 @@ class Character(Base):
 
 class Catalogue(Base):
     __tablename__ = 'catalogue'
-    __table_args__ = {'autoload': True, 'schema': 'mangasampledb'}
+    __table_args__ = {'autoload': True, 'schema': 'mangasampledb',
+                      'keep_existing': True}
 
     @property
     def isCurrent(self):
@@ -112,7 +138,8 @@ class Catalogue(Base):
 
 class CurrentCatalogue(Base):
     __tablename__ = 'current_catalogue'
-    __table_args__ = {'autoload': True, 'schema': 'mangasampledb'}
+    __table_args__ = {'autoload': True, 'schema': 'mangasampledb',
+                      'keep_existing': True}
 
     catalogue = relationship(
         'Catalogue', backref=backref('currentCatalogue', uselist=False))
@@ -123,7 +150,8 @@ class CurrentCatalogue(Base):
 
 class MangaTargetToMangaTarget(Base):
     __tablename__ = 'manga_target_to_manga_target'
-    __table_args__ = {'autoload': True, 'schema': 'mangasampledb'}
+    __table_args__ = {'autoload': True, 'schema': 'mangasampledb',
+                      'keep_existing': True}
 
     def __repr__(self):
         return '<MangaTargetToMangaTarget (pk={0})>'.format(self.pk)
@@ -133,7 +161,8 @@ class NSA(Base):
     __tablename__ = 'nsa'
     __table_args__ = (
         ForeignKeyConstraint(['catalogue_pk'], ['mangasampledb.catalogue.pk']),
-        {'autoload': True, 'schema': 'mangasampledb'})
+        {'autoload': True, 'schema': 'mangasampledb',
+         'keep_existing': True})
 
     def __repr__(self):
         return '<NSA (pk={0}, nsaid={1})>'.format(self.pk, self.nsaid)
@@ -145,7 +174,8 @@ class MangaTargetToNSA(Base):
         ForeignKeyConstraint(['manga_target_pk'],
                              ['mangasampledb.manga_target.pk']),
         ForeignKeyConstraint(['nsa_pk'], ['mangasampledb.nsa.pk']),
-        {'autoload': True, 'schema': 'mangasampledb'})
+        {'autoload': True, 'schema': 'mangasampledb',
+         'keep_existing': True})
 
     def __repr__(self):
         return '<MangaTargetToNSA (pk={0})>'.format(self.pk)
@@ -154,40 +184,225 @@ class MangaTargetToNSA(Base):
 NSA.mangaTargets = relationship(
     MangaTarget, backref='NSA_objects', secondary=MangaTargetToNSA.__table__)
 
-# Now we create the remaining tables.
-insp = inspect(db.engine)
+# The remaining catalogues (and their MangaTargetTo<X> relational classes),
+# and the Current<X> classes for the current views of the catalogues, are
+# only created when they are first accessed, through the module __getattr__.
+# So is CharacterPicture, whose table only exists in databases in which the
+# characters have been loaded with dedupe=True.
 schemaName = 'mangasampledb'
-allTables = insp.get_table_names(schema=schemaName)
 
-done_names = db.Base.metadata.tables.keys()
-for tableName in allTables:
-    if schemaName + '.' + tableName in done_names:
-        continue
+_explicitTables = set(
+    [model.__tablename__
+     for model in [MangaTarget, Anime, Character, Catalogue,
+                   CurrentCatalogue, MangaTargetToMangaTarget, NSA,
+                   MangaTargetToNSA]] + ['character_picture'])
+
+_allTables = None
+_currentViews = None
+_lazyLock = threading.RLock()
+
+# The names of the classes that can be created on first access.
+_lazyNamePattern = re.compile(r'^(MangaTargetTo|Current)?[A-Z0-9][A-Z0-9_]*$')
+
+
+def _getTableNames():
+    """Returns the names of all the tables in mangasampledb."""
+
+    global _allTables
+
+    if _allTables is None:
+        if cachedMetadata is not None and \
+                cachedMetadata.info.get('tableNames') is not None:
+            _allTables = cachedMetadata.info['tableNames']
+        else:
+            _allTables = inspect(db.engine).get_table_names(schema=schemaName)
+
+    return _allTables
+
+
+def _getCurrentViews():
+    """Returns the names of the current views in mangasampledb."""
+
+    global _currentViews
+
+    if _currentViews is None:
+        if cachedMetadata is not None and \
+                cachedMetadata.info.get('viewNames') is not None:
+            _currentViews = cachedMetadata.info['viewNames']
+        else:
+            _currentViews = [
+                row[0] for row in db.engine.execute(
+                    text('SELECT matviewname FROM pg_matviews '
+                         'WHERE schemaname = :schema AND '
+                         'matviewname LIKE :pattern'),
+                    schema=schemaName, pattern='current\\_%')]
+
+    return _currentViews
+
+
+def _getLazyClassNames():
+    """Returns a dictionary of lazy class names to catalogue tables."""
+
+    lazyClassNames = {}
+    for tableName in _getTableNames():
+        if tableName in _explicitTables or \
+                tableName.startswith('manga_target_to_'):
+            continue
+        lazyClassNames[str(tableName).upper()] = tableName
+        if 'manga_target_to_' + tableName in _getTableNames():
+            lazyClassNames['MangaTargetTo' + tableName.upper()] = tableName
+
+    return lazyClassNames
+
+
+def _getLazyViewClassNames():
+    """Returns a dictionary of lazy class names to catalogue views."""
+
+    return dict(('Current' + viewName[len('current_'):].upper(), viewName)
+                for viewName in _getCurrentViews())
+
+
+def _createCatalogueClasses(tableName):
+    """Creates the model classes for a catalogue and its relational table."""
+
     className = str(tableName).upper()
+    newTables = ['{0}.{1}'.format(schemaName, tableName)]
 
     newClass = ClassFactory(
         className, tableName,
         fks=[('catalogue_pk', 'mangasampledb.catalogue.pk')])
     newClass.catalogue = relationship(
         Catalogue, backref='{0}_objects'.format(tableName))
-    locals()[className] = newClass
-    done_names.append(schemaName + '.' + tableName)
+    globals()[className] = newClass
 
-    if 'manga_target_to_' + tableName in allTables:
-        relationalTableName = 'manga_target_to_' + tableName
+    relationalTableName = 'manga_target_to_' + tableName
+    if relationalTableName in _getTableNames():
+        newTables.append('{0}.{1}'.format(schemaName, relationalTableName))
         relationalClassName = 'MangaTargetTo' + tableName.upper()
         newRelationalClass = ClassFactory(
             relationalClassName, relationalTableName,
             fks=[('manga_target_pk', 'mangasampledb.manga_target.pk'),
-                 ('nsa_pk', 'mangasampledb.nsa.pk')])
-
-        locals()[relationalClassName] = newRelationalClass
-        done_names.append(schemaName + '.' + relationalTableName)
+                 ('{0}_pk'.format(tableName),
+                  'mangasampledb.{0}.pk'.format(tableName))])
+        globals()[relationalClassName] = newRelationalClass
 
         newClass.mangaTargets = relationship(
             MangaTarget, backref='{0}_objects'.format(tableName),
             secondary=newRelationalClass.__table__)
 
+    # Only configures the mappers that have not been configured yet.
+    configure_mappers()
+
+    # If the tables were not in the cache, adds them to it.
+    if cachedMetadata is None or \
+            any(table not in cachedMetadata.tables for table in newTables):
+        saveCachedMetadata(Base.metadata, cachePath,
+                           tableNames=_getTableNames(),
+                           viewNames=_getCurrentViews())
+
+
+class _CharacterPictureBase(Base):
+    __abstract__ = True
+
+    def __repr__(self):
+        return '<CharacterPicture (pk={0}, sha256={1})>'.format(
+            self.pk, self.sha256)
+
+
+def _createCharacterPictureClass():
+    """Creates CharacterPicture and the Character.sharedPicture relationship.
+
+    Does nothing if mangasampledb.character_picture does not exist.
+
+    """
+
+    if 'character_picture' not in _getTableNames():
+        return
+
+    newClass = ClassFactory('CharacterPicture', 'character_picture',
+                            BaseClass=_CharacterPictureBase)
+    globals()['CharacterPicture'] = newClass
+
+    Character.sharedPicture = relationship(newClass, backref='characters')
+
+    configure_mappers()
+
+    pictureKey = '{0}.character_picture'.format(schemaName)
+    if cachedMetadata is None or pictureKey not in cachedMetadata.tables:
+        saveCachedMetadata(Base.metadata, cachePath,
+                           tableNames=_getTableNames(),
+                           viewNames=_getCurrentViews())
+
+
+def _createCurrentViewClass(viewName):
+    """Creates the model class for the current view of a catalogue.
+
+    The view has no primary key, so the class is mapped using the
+    ``(manga_target_pk, pk)`` columns, which are unique in the view.
+
+    """
+
+    className = 'Current' + viewName[len('current_'):].upper()
+
+    viewTable = Table(
+        viewName, Base.metadata,
+        ForeignKeyConstraint(['manga_target_pk'],
+                             ['mangasampledb.manga_target.pk']),
+        autoload=True, autoload_with=db.engine, schema=schemaName,
+        keep_existing=True)
+
+    newClass = type(
+        className, (Base,),
+        {'__table__': viewTable,
+         '__mapper_args__': {'primary_key': [viewTable.c.manga_target_pk,
+                                             viewTable.c.pk]}})
+    newClass.mangaTarget = relationship(MangaTarget, viewonly=True)
+    globals()[className] = newClass
+
+    configure_mappers()
+
+    viewKey = '{0}.{1}'.format(schemaName, viewName)
+    if cachedMetadata is None or viewKey not in cachedMetadata.tables:
+        saveCachedMetadata(Base.metadata, cachePath,
+                           tableNames=_getTableNames(),
+                           viewNames=_getCurrentViews())
+
+
+def __getattr__(name):
+    """Creates the model classes for catalogues on first access."""
+
+    # Names that cannot be a lazy class are rejected straight away. The names
+    # of the tables and views are read (or loaded from the cache) on import,
+    # so other unknown names do not query the DB either.
+    if name != 'CharacterPicture' and not _lazyNamePattern.match(name):
+        raise AttributeError('module {0!r} has no attribute {1!r}'
+                             .format(__name__, name))
+
+    with _lazyLock:
+        if name not in globals():
+            if name == 'CharacterPicture':
+                _createCharacterPictureClass()
+            elif name.startswith('Current'):
+                viewName = _getLazyViewClassNames().get(name)
+                if viewName is not None:
+                    _createCurrentViewClass(viewName)
+            else:
+                tableName = _getLazyClassNames().get(name)
+                if tableName is not None:
+                    _createCatalogueClasses(tableName)
+        if name not in globals():
+            raise AttributeError('module {0!r} has no attribute {1!r}'
+                                 .format(__name__, name))
+
+    return globals()[name]
+
+
+def __dir__():
+    pictureClass = (set(['CharacterPicture'])
+                    if 'character_picture' in _getTableNames() else set())
+    return sorted(set(globals()) | set(_getLazyClassNames()) |
+                  set(_getLazyViewClassNames()) | pictureClass)
+
 
 def HybridProperty(parameter, index=None):
 
@@ -285,3 +500,8 @@ setattr(NSA, 'petro_logmass_el', logmass('petro_mass_el'))
 setattr(NSA, 'sersic_logmass', logmass('sersic_mass'))
 
 configure_mappers()
+
+# Caches the reflected tables, including the foreign keys defined above.
+if cachedMetadata is None:
+    saveCachedMetadata(Base.metadata, cachePath, tableNames=_getTableNames(),
+                       viewNames=_getCurrentViews())
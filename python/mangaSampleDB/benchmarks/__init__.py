@@ -0,0 +1,5 @@
+from __future__ import absolute_import
+
+from .synthetic import makeDataset
+from .runner import (TemporaryPostgres, runBenchmarks, compareReports,
+                     formatReport, formatComparison)
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+runner.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Runs the loaders against a scratch database and reports the wall time, rows
+per second, and peak memory of each stage.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+import sqlalchemy as sql
+from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.orm import sessionmaker
+
+import astropy
+from astropy import table
+
+from mangaSampleDB.utils.connection import create_connection
+from mangaSampleDB.utils.table_to_db import table_to_db, _execute_autocommit
+from mangaSampleDB.utils.catalogue import (ingestCatalogue,
+                                           _createRelationalTable,
+                                           _reflectModel)
+from mangaSampleDB.utils.targets import loadMangaTargets
+from mangaSampleDB.utils.characters import loadMangaCharacters
+
+
+__all__ = ('TemporaryPostgres', 'runBenchmarks', 'compareReports',
+           'formatReport', 'formatComparison')
+
+
+defaultSchemaFile = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '../../../schemas/mangaSampleDB.sql'))
+
+benchmarkCatalogue = 'benchmark_catalogue'
+
+
+def _stageTargets(engine, paths, options):
+    loadMangaTargets(paths['targets'], paths['drpall'], engine,
+                     upsert=options.get('upsert', True))
+    return engine.execute(
+        'SELECT count(*) FROM mangasampledb.manga_target;').scalar()
+
+
+def _stageCharacters(engine, paths, options):
+    loadMangaCharacters(paths['characters'], paths['images'], engine,
+                        bulk=True, dedupe=options.get('dedupe', False))
+    return engine.execute(
+        'SELECT count(*) FROM mangasampledb.character;').scalar()
+
+
+def _stageTableToDB(engine, paths, options):
+    catalogue = table.Table.read(paths['catalogue'], format='fits',
+                                 memmap=options.get('stream', False))
+    table_to_db(catalogue, engine.url.database, 'mangasampledb',
+                benchmarkCatalogue, engine=engine, overwrite=True,
+                chunk_size=options.get('step', 20000),
+                workers=options.get('workers', 1), indexes=['nsaid'])
+    return len(catalogue)
+
+
+def _stageRelational(engine, paths, options):
+    metadata = sql.MetaData(schema='mangasampledb')
+    metadata.reflect(engine)
+    Base = automap_base(metadata=metadata)
+    Base.prepare()
+    session = sessionmaker(engine, autocommit=True)()
+
+    matchCat = table.Table.read(paths['match'])
+    NewCatTable = _reflectModel(engine, benchmarkCatalogue)
+
+    _createRelationalTable(Base, engine, session, metadata, matchCat,
+                           NewCatTable, overwrite=True,
+                           serverJoin=options.get('serverJoin', False),
+                           catName=benchmarkCatalogue)
+    return len(matchCat)
+
+
+def _stageIngest(engine, paths, options):
+    ingestCatalogue(paths['catalogue'], 'benchmark_ingest',
+                    datetime.datetime.now().isoformat(), engine,
+                    match=(paths['match'], paths['matchDescription']),
+                    step=options.get('step', 20000), overwrite=True,
+                    stream=options.get('stream', False),
+                    workers=options.get('workers', 1),
+                    server_join=options.get('serverJoin', False))
+    return engine.execute(
+        'SELECT count(*) FROM mangasampledb.benchmark_ingest;').scalar()
+
+
+# The stages, in the order in which they must run. Each function returns the
+# number of rows loaded.
+stages = [('loadMangaTargets', _stageTargets),
+          ('loadMangaCharacters', _stageCharacters),
+          ('table_to_db', _stageTableToDB),
+          ('_createRelationalTable', _stageRelational),
+          ('ingestCatalogue', _stageIngest)]
+
+
+def _peakRSS():
+    """Returns the peak resident memory of this process, in MB.
+
+    Child processes that have finished, such as the workers of a parallel
+    load, are included. The result is the peak of the largest process, not
+    the sum of the processes that ran at the same time.
+
+    """
+
+    maxRSS = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                 resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    if sys.platform == 'darwin':
+        return maxRSS / 1024. ** 2
+
+    return maxRSS / 1024.
+
+
+def _runStage(stage, connection, paths, options, queue):
+    """Runs a stage in a child process and puts the results in a queue."""
+
+    try:
+        engine = create_connection(**connection)
+        baselineRSS = _peakRSS()
+
+        t0 = time.time()
+        nRows = dict(stages)[stage](engine, paths, options)
+        wallTime = time.time() - t0
+
+        queue.put({'rows': int(nRows), 'wall_time': wallTime,
+                   'peak_rss_mb': _peakRSS(),
+                   'baseline_rss_mb': baselineRSS})
+
+    except Exception:
+        queue.put({'error': traceback.format_exc()})
+
+
+def _runStageProcess(stage, connection, paths, options):
+    """Runs a stage in a new process, so its peak memory can be measured."""
+
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+
+    process = context.Process(target=_runStage,
+                              args=(stage, connection, paths, options, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    if 'error' in result:
+        raise RuntimeError('stage {0} failed:\n{1}'
+                           .format(stage, result['error']))
+
+    return result
+
+
+def _findPostgresBin(pgBin=None):
+    """Returns the directory with the PostgreSQL server binaries."""
+
+    if pgBin is not None:
+        return pgBin
+
+    pgCtl = shutil.which('pg_ctl')
+    if pgCtl is not None:
+        return os.path.dirname(pgCtl)
+
+    pgConfig = shutil.which('pg_config')
+    if pgConfig is not None:
+        return subprocess.check_output([pgConfig, '--bindir']).decode().strip()
+
+    raise RuntimeError('cannot find pg_ctl. Set pgBin or add it to PATH.')
+
+
+class TemporaryPostgres(object):
+    """A throwaway PostgreSQL server.
+
+    The cluster is created with ``initdb`` in a temporary directory and the
+    server only listens on a Unix socket in that directory. Everything is
+    removed when the server is stopped. It can be used as a context manager.
+
+    Parameters:
+        pgBin (str):
+            The directory with ``initdb`` and ``pg_ctl``. Defaults to the one
+            in the ``PATH`` or the one returned by ``pg_config --bindir``.
+        workDir (str):
+            The directory in which the temporary directory is created.
+        settings (dict):
+            Server configuration parameters, e.g., ``{'shared_buffers':
+            '1GB'}``.
+
+    """
+
+    def __init__(self, pgBin=None, workDir=None, settings=None):
+
+        self.pgBin = _findPostgresBin(pgBin)
+        self.workDir = workDir
+
+        self.settings = {'max_prepared_transactions': 64,
+                         'listen_addresses': "''"}
+        self.settings.update(settings or {})
+
+        self.directory = None
+        self.port = None
+
+    @property
+    def connection(self):
+        """The parameters for `.create_connection`."""
+
+        return dict(username='manga', host=self.directory, port=self.port)
+
+    def start(self):
+
+        self.directory = tempfile.mkdtemp(prefix='mangasampledb_pg_',
+                                          dir=self.workDir)
+        dataDir = os.path.join(self.directory, 'data')
+
+        # Reserves a port number, which also sets the name of the socket.
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            self.port = sock.getsockname()[1]
+
+        try:
+            subprocess.check_call(
+                [os.path.join(self.pgBin, 'initdb'), '-D', dataDir, '-U',
+                 'manga', '--auth=trust', '-E', 'UTF8'],
+                stdout=subprocess.DEVNULL)
+
+            options = '-p {0} -k {1} '.format(self.port, self.directory) + \
+                ' '.join('-c {0}={1}'.format(key, value)
+                         for key, value in self.settings.items())
+
+            subprocess.check_call(
+                [os.path.join(self.pgBin, 'pg_ctl'), '-D', dataDir, '-l',
+                 os.path.join(self.directory, 'postgresql.log'), '-o', options,
+                 '-w', 'start'], stdout=subprocess.DEVNULL)
+        except Exception:
+            # Removes the directory if the server could not be started.
+            self.stop()
+            raise
+
+        print('INFO: started temporary PostgreSQL server in {0}'
+              .format(self.directory))
+
+    def stop(self):
+
+        if self.directory is None:
+            return
+
+        dataDir = os.path.join(self.directory, 'data')
+        if os.path.exists(os.path.join(dataDir, 'postmaster.pid')):
+            subprocess.call(
+                [os.path.join(self.pgBin, 'pg_ctl'), '-D', dataDir, '-m',
+                 'fast', '-w', 'stop'], stdout=subprocess.DEVNULL)
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def _createScratchDatabase(connection, dbName, schemaFile):
+    """Creates an empty database with the mangasampledb schema."""
+
+    adminEngine = create_connection(db_name='postgres', **connection)
+    _execute_autocommit(adminEngine, 'DROP DATABASE IF EXISTS {0};'
+                        .format(dbName))
+    _execute_autocommit(adminEngine, 'CREATE DATABASE {0} ENCODING {1} '
+                        'TEMPLATE template0;'.format(dbName, "'UTF8'"))
+    adminEngine.dispose()
+
+    engine = create_connection(db_name=dbName, **connection)
+    dbConnection = engine.raw_connection()
+    try:
+        cursor = dbConnection.cursor()
+        cursor.execute(open(schemaFile, 'r').read())
+        dbConnection.commit()
+        version = engine.dialect.server_version_info
+    finally:
+        dbConnection.close()
+        engine.dispose()
+
+    return '.'.join(map(str, version))
+
+
+def _dropScratchDatabase(connection, dbName):
+
+    adminEngine = create_connection(db_name='postgres', **connection)
+    _execute_autocommit(adminEngine, 'DROP DATABASE IF EXISTS {0};'
+                        .format(dbName))
+    adminEngine.dispose()
+
+
+def runBenchmarks(paths, connection=None, stageNames=None, repeat=1,
+                  schemaFile=defaultSchemaFile, pgBin=None,
+                  dbName='mangasampledb_benchmark', parameters=None,
+                  **options):
+    """Runs the loaders and returns a report.
+
+    Each stage runs in a new process, in a new database created for each
+    repetition, so that the peak resident memory of the stage can be
+    measured and repetitions do not affect each other.
+
+    Parameters:
+        paths (dict):
+            The input files, as returned by `.makeDataset`.
+        connection (dict or None):
+            The parameters for `.create_connection` to an existing server, in
+            which the user can create databases. If ``None``, a
+            `.TemporaryPostgres` server is used.
+        stageNames (list or None):
+            The stages to run. Defaults to all of them (the characters stage
+            only if ``paths`` has characters). ``_createRelationalTable``
+            requires ``loadMangaTargets`` and ``table_to_db``.
+        repeat (int):
+            The number of times each stage is run. The report contains the
+            minimum wall time and the maximum peak memory.
+        schemaFile (str):
+            The SQL file with the mangasampledb schema.
+        pgBin (str):
+            The directory with the PostgreSQL binaries, if ``connection`` is
+            ``None``.
+        dbName (str):
+            The name of the scratch database.
+        parameters (dict):
+            Information about the dataset to add to the report.
+        options:
+            Options for the stages: ``step``, ``workers``, ``stream``,
+            ``serverJoin``, ``upsert``, and ``dedupe``.
+
+    Returns:
+        result (dict):
+            The report, which can be serialised as JSON. The rows per second
+            of a stage are ``None`` if its fastest run took no measurable
+            time.
+
+    """
+
+    if stageNames is None:
+        stageNames = [name for name, __ in stages
+                      if name != 'loadMangaCharacters' or
+                      'characters' in paths]
+
+    unknown = set(stageNames) - set(dict(stages))
+    if len(unknown) > 0:
+        raise ValueError('unknown stages {0}'.format(', '.join(unknown)))
+
+    # Runs the stages in their dependency order.
+    stageNames = [name for name, __ in stages if name in stageNames]
+
+    server = None
+    if connection is not None:
+        # The database is replaced by dbName.
+        connection = dict(connection)
+        connection.pop('db_name', None)
+    else:
+        server = TemporaryPostgres(pgBin=pgBin)
+        server.start()
+        connection = server.connection
+
+    results = dict((name, []) for name in stageNames)
+    serverVersion = None
+
+    try:
+        for ii in range(repeat):
+            serverVersion = _createScratchDatabase(connection, dbName,
+                                                   schemaFile)
+            stageConnection = dict(connection, db_name=dbName)
+            for name in stageNames:
+                print('INFO: running {0} ({1}/{2})'.format(name, ii + 1,
+                                                           repeat))
+                results[name].append(_runStageProcess(
+                    name, stageConnection, paths, options))
+            _dropScratchDatabase(connection, dbName)
+
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        'created': datetime.datetime.now().isoformat(),
+        'environment': {'python': platform.python_version(),
+                        'platform': platform.platform(),
+                        'numpy': np.__version__,
+                        'sqlalchemy': sql.__version__,
+                        'astropy': astropy.__version__,
+                        'postgresql': serverVersion},
+        'parameters': dict(parameters or {}, repeat=repeat, **options),
+        'stages': {}}
+
+    for name in stageNames:
+        if len(results[name]) == 0:
+            continue
+        wallTimes = [result['wall_time'] for result in results[name]]
+        nRows = results[name][0]['rows']
+        report['stages'][name] = {
+            'rows': nRows,
+            'wall_time': min(wallTimes),
+            'wall_times': wallTimes,
+            'rows_per_second': (nRows / min(wallTimes)
+                                if min(wallTimes) > 0 else None),
+            'peak_rss_mb': max(result['peak_rss_mb']
+                               for result in results[name]),
+            'baseline_rss_mb': min(result['baseline_rss_mb']
+                                   for result in results[name])}
+
+    return report
+
+
+def formatReport(report):
+    """Returns a report as a human readable table."""
+
+    lines = ['{0:<24s} {1:>10s} {2:>10s} {3:>12s} {4:>10s}'.format(
+        'stage', 'rows', 'time (s)', 'rows/s', 'RSS (MB)')]
+
+    for name, stage in report['stages'].items():
+        rate = ('n/a' if stage['rows_per_second'] is None
+                else '{0:.1f}'.format(stage['rows_per_second']))
+        lines.append('{0:<24s} {1:>10d} {2:>10.3f} {3:>12s} {4:>10.1f}'
+                     .format(name, stage['rows'], stage['wall_time'],
+                             rate, stage['peak_rss_mb']))
+
+    return '\n'.join(lines)
+
+
+def _relativeChange(baseline, new):
+    """Returns the relative change of a value, or None if undefined."""
+
+    if baseline is None or new is None:
+        return None
+
+    if baseline == 0:
+        return 0. if new == 0 else None
+
+    return (new - baseline) / baseline
+
+
+def _formatChange(change):
+    """Formats a relative change for `.formatComparison`."""
+
+    if change is None:
+        return '{0:>8s}'.format('n/a')
+
+    return '{0:>+8.1%}'.format(change)
+
+
+def compareReports(baseline, new, threshold=0.1):
+    """Compares two reports.
+
+    Parameters:
+        baseline, new (dict or str):
+            The reports, or the paths to their JSON files.
+        threshold (float):
+            The relative change in wall time or peak memory above which a
+            stage is flagged as a regression.
+
+    Returns:
+        result (list):
+            A list of dictionaries, one for each stage in both reports, with
+            the values of ``wall_time``, ``rows_per_second``, and
+            ``peak_rss_mb`` in both reports, their relative changes, and
+            ``regression`` (``True`` if the time or the memory has
+            increased by more than ``threshold``). If the value in
+            ``baseline`` is zero, the change is ``None`` (or zero, if the
+            new value is also zero) and does not count as a regression. So
+            is it if either value is ``None``.
+
+    """
+
+    if not isinstance(baseline, dict):
+        baseline = json.load(open(baseline, 'r'))
+    if not isinstance(new, dict):
+        new = json.load(open(new, 'r'))
+
+    comparison = []
+
+    for name, baseStage in baseline['stages'].items():
+
+        if name not in new['stages']:
+            continue
+
+        newStage = new['stages'][name]
+
+        result = {'stage': name}
+        for metric in ['wall_time', 'rows_per_second', 'peak_rss_mb']:
+            result[metric] = (baseStage[metric], newStage[metric])
+            result[metric + '_change'] = _relativeChange(baseStage[metric],
+                                                         newStage[metric])
+
+        result['regression'] = any(
+            result[metric + '_change'] is not None and
+            result[metric + '_change'] > threshold
+            for metric in ['wall_time', 'peak_rss_mb'])
+
+        comparison.append(result)
+
+    return comparison
+
+
+def formatComparison(comparison):
+    """Returns the output of `.compareReports` as a human readable table."""
+
+    lines = ['{0:<24s} {1:>19s} {2:>8s} {3:>19s} {4:>8s}'.format(
+        'stage', 'time (s)', 'change', 'RSS (MB)', 'change')]
+
+    for result in comparison:
+        lines.append(
+            '{0:<24s} {1[0]:>9.3f}{1[1]:>10.3f} {2} '
+            '{3[0]:>9.1f}{3[1]:>10.1f} {4}{5}'.format(
+                result['stage'], result['wall_time'],
+                _formatChange(result['wall_time_change']),
+                result['peak_rss_mb'],
+                _formatChange(result['peak_rss_mb_change']),
+                '  REGRESSION' if result['regression'] else ''))
+
+    return '\n'.join(lines)
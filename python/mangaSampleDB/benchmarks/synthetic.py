@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+synthetic.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Generates synthetic input files for the loaders: FITS catalogues shaped like
+the NSA, MaNGA targets and drpall files, match files, and character lists
+with their images.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+
+from astropy import table
+
+from mangaSampleDB.utils.crawler import columnNames, columnTypes
+
+
+__all__ = ('makeCatalogue', 'makeTargets', 'makeMatch', 'makeCharacters',
+           'makeDataset')
+
+
+def makeCatalogue(path, nRows, nScalar=20, nArray1D=5, arrayLength=7,
+                  nArray2D=1, array2DShape=(15, 7), seed=0, overwrite=True):
+    """Writes a FITS catalogue with the structure of the NSA.
+
+    The catalogue has the identifier column ``NSAID``, the columns
+    ``IAUNAME``, ``RA``, ``DEC``, and ``Z``, and the requested number of
+    float scalar columns (``SCALAR<N>``, alternating ``float32`` and
+    ``float64``), 1-D array columns (``ARRAY<N>``, like ``ELPETRO_FLUX``) and
+    2-D array columns (``PROFILE<N>``, like ``PROFMEAN``).
+
+    Parameters:
+        path (str):
+            The path of the output FITS file.
+        nRows (int):
+            The number of rows.
+        nScalar, nArray1D, nArray2D (int):
+            The number of scalar, 1-D array, and 2-D array columns.
+        arrayLength (int):
+            The length of the 1-D array columns.
+        array2DShape (tuple):
+            The shape of each cell of the 2-D array columns.
+        seed (int):
+            The seed for the random number generator.
+        overwrite (bool):
+            If ``True``, overwrites ``path`` if it exists.
+
+    Returns:
+        result (astropy.table.Table):
+            The catalogue.
+
+    """
+
+    rng = np.random.RandomState(seed)
+
+    catalogue = table.Table()
+    catalogue['NSAID'] = np.arange(nRows, dtype=np.int32)
+
+    ra = rng.uniform(0, 360, nRows)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, nRows)))
+    catalogue['IAUNAME'] = np.array(
+        ['J{0:09.5f}{1:+09.5f}'.format(ra[ii], dec[ii])
+         for ii in range(nRows)], dtype='S19')
+    catalogue['RA'] = ra
+    catalogue['DEC'] = dec
+    catalogue['Z'] = rng.uniform(0.01, 0.15, nRows).astype(np.float32)
+
+    for ii in range(nScalar):
+        dtype = np.float32 if ii % 2 == 0 else np.float64
+        catalogue['SCALAR{0}'.format(ii)] = rng.normal(
+            size=nRows).astype(dtype)
+
+    for ii in range(nArray1D):
+        catalogue['ARRAY{0}'.format(ii)] = rng.normal(
+            size=(nRows, arrayLength)).astype(np.float32)
+
+    for ii in range(nArray2D):
+        catalogue['PROFILE{0}'.format(ii)] = rng.normal(
+            size=(nRows, ) + tuple(array2DShape)).astype(np.float32)
+
+    catalogue.write(path, format='fits', overwrite=overwrite)
+
+    return catalogue
+
+
+def makeTargets(targetsPath, drpallPath, nTargets, catalogue=None,
+                fractionObserved=0.1, seed=0, overwrite=True):
+    """Writes a MaNGA targets file and a drpall file.
+
+    The targets have mangaids ``1-<N>`` and, if ``catalogue`` is set, the
+    coordinates of random rows in it. A fraction of them also appear in the
+    drpall file, together with the same number of targets that are only in
+    the drpall file, as ancillary targets are.
+
+    Returns:
+        result (tuple):
+            The targets table and the indices of the catalogue rows of each
+            target (``None`` if ``catalogue`` is not set).
+
+    """
+
+    rng = np.random.RandomState(seed)
+
+    mangaids = np.array(['1-{0}'.format(ii) for ii in range(nTargets)])
+
+    targets = table.Table()
+    targets['MANGAID'] = mangaids.astype('S20')
+
+    indices = None
+    if catalogue is not None:
+        indices = rng.choice(len(catalogue), nTargets,
+                             replace=nTargets > len(catalogue))
+        targets['RA'] = catalogue['RA'][indices]
+        targets['DEC'] = catalogue['DEC'][indices]
+    else:
+        targets['RA'] = rng.uniform(0, 360, nTargets)
+        targets['DEC'] = np.degrees(np.arcsin(rng.uniform(-1, 1, nTargets)))
+
+    targets.write(targetsPath, format='fits', overwrite=overwrite)
+
+    nObserved = int(nTargets * fractionObserved)
+    observed = rng.choice(nTargets, nObserved, replace=False)
+    ancillary = np.array(['1-{0}'.format(nTargets + ii)
+                          for ii in range(nObserved)])
+
+    drpall = table.Table()
+    drpall['mangaid'] = np.concatenate(
+        [mangaids[observed], ancillary]).astype('S20')
+    drpall.write(drpallPath, format='fits', overwrite=overwrite)
+
+    return targets, indices
+
+
+def makeMatch(matchPath, descriptionPath, mangaids, identifiers,
+              idCol='nsaid', overwrite=True):
+    """Writes a match file and its description, as ingestCatalogue takes."""
+
+    match = table.Table()
+    match['mangaid'] = np.char.strip(np.asarray(mangaids).astype(str)).astype(
+        'S50')
+    match[idCol] = identifiers
+    match.write(matchPath, format='fits', overwrite=overwrite)
+
+    with open(descriptionPath, 'w') as unit:
+        unit.write('Synthetic match of {0} targets for benchmarking.\n'
+                   .format(len(match)))
+
+    return match
+
+
+def makeCharacters(listPath, imageDir, nCharacters, nAnime=None,
+                   imageSize=20000, nDistinctImages=None, seed=0):
+    """Writes a list of characters and their images.
+
+    The list has the format written by ``parseMaNGACharacters``. The images
+    contain ``imageSize`` random bytes. If ``nDistinctImages`` is set, only
+    that many different images are used, so that deduplication can be
+    measured.
+
+    """
+
+    rng = np.random.RandomState(seed)
+
+    nAnime = nAnime or max(1, nCharacters // 10)
+    nDistinctImages = nDistinctImages or nCharacters
+
+    if not os.path.exists(imageDir):
+        os.makedirs(imageDir)
+
+    images = []
+    for ii in range(nDistinctImages):
+        imageName = 'image{0}.jpg'.format(ii)
+        with open(os.path.join(imageDir, imageName), 'wb') as unit:
+            unit.write(rng.bytes(imageSize))
+        images.append(imageName)
+
+    rows = []
+    for ii in range(nCharacters):
+        rows.append((ii + 1, 'character-{0}'.format(ii),
+                     'Character {0}'.format(ii),
+                     'Anime {0}'.format(rng.randint(nAnime)),
+                     images[ii % nDistinctImages],
+                     '/characters/character-{0}'.format(ii), 1))
+
+    characters = table.Table(rows=rows, names=columnNames, dtype=columnTypes)
+    characters.write(listPath, format='ascii.fixed_width', delimiter='|',
+                     overwrite=True)
+
+    return characters
+
+
+def makeDataset(outputDir, nRows, nTargets, nCharacters=0, seed=0,
+                **catalogueKwargs):
+    """Writes all the synthetic input files to a directory.
+
+    The targets are drawn from the catalogue, and each of them is matched to
+    the catalogue row from which it was drawn.
+
+    Returns:
+        result (dict):
+            The paths of the files: ``catalogue``, ``targets``, ``drpall``,
+            ``match``, ``matchDescription``, and, if ``nCharacters > 0``,
+            ``characters`` and ``images``.
+
+    """
+
+    if not os.path.exists(outputDir):
+        os.makedirs(outputDir)
+
+    paths = dict(
+        catalogue=os.path.join(outputDir, 'catalogue.fits'),
+        targets=os.path.join(outputDir, 'targets.fits'),
+        drpall=os.path.join(outputDir, 'drpall.fits'),
+        match=os.path.join(outputDir, 'match.fits'),
+        matchDescription=os.path.join(outputDir, 'match.txt'))
+
+    catalogue = makeCatalogue(paths['catalogue'], nRows, seed=seed,
+                              **catalogueKwargs)
+
+    targets, indices = makeTargets(paths['targets'], paths['drpall'],
+                                   nTargets, catalogue=catalogue, seed=seed)
+
+    makeMatch(paths['match'], paths['matchDescription'], targets['MANGAID'],
+              catalogue['NSAID'][indices])
+
+    if nCharacters > 0:
+        paths['characters'] = os.path.join(outputDir, 'characters.dat')
+        paths['images'] = os.path.join(outputDir, 'images')
+        makeCharacters(paths['characters'], paths['images'], nCharacters,
+                       seed=seed)
+
+    return paths
@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+columnar.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Fetches catalogue rows directly into Numpy arrays or astropy tables, using
+``COPY (SELECT ...) TO STDOUT`` instead of building an ORM object per row.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import re
+
+import numpy as np
+
+import sqlalchemy as sql
+from sqlalchemy.sql import sqltypes
+from sqlalchemy.dialects import postgresql
+
+from astropy import table
+
+
+__all__ = ('fetchTable')
+
+
+def _columnDtype(sqlType):
+    """Returns the Numpy dtype for a SQLAlchemy type, or None."""
+
+    if isinstance(sqlType, sqltypes.Boolean):
+        return np.dtype(bool)
+    elif isinstance(sqlType, sqltypes.SmallInteger):
+        return np.dtype('i2')
+    elif isinstance(sqlType, sqltypes.BigInteger):
+        return np.dtype('i8')
+    elif isinstance(sqlType, sqltypes.Integer):
+        return np.dtype('i4')
+    elif isinstance(sqlType, (sqltypes.REAL, postgresql.REAL)):
+        return np.dtype('f4')
+    elif isinstance(sqlType, (sqltypes.Float, sqltypes.Numeric)):
+        return np.dtype('f8')
+    elif isinstance(sqlType, sqltypes.String):
+        return np.dtype('U')
+
+    # Types that cannot be determined (e.g., some function results) are
+    # parsed as floats if possible.
+    return None
+
+
+def _unescape(value):
+    """Decodes the backslash escapes of the COPY text format."""
+
+    if '\\' not in value:
+        return value
+
+    return value.encode('latin-1', 'backslashreplace').decode(
+        'unicode_escape')
+
+
+def _parseScalars(values, dtype):
+    """Parses a list of COPY text fields. Returns the array and NULL mask."""
+
+    values = np.array(values)
+    mask = values == '\\N'
+    hasNulls = mask.any()
+
+    if dtype is None:
+        try:
+            return _parseScalars(values.tolist(), np.dtype('f8'))
+        except ValueError:
+            dtype = np.dtype('U')
+
+    if dtype.kind == 'U':
+        data = np.array(['' if isNull else _unescape(value)
+                         for value, isNull in zip(values.tolist(),
+                                                  mask.tolist())])
+        return data, mask
+
+    if hasNulls:
+        # np.where widens the strings, which can be shorter than 'nan' if
+        # the block only has NULLs.
+        values = np.where(mask, 'nan' if dtype.kind == 'f' else '0', values)
+
+    if dtype.kind == 'b':
+        return values == 't', mask
+
+    return values.astype(dtype), mask
+
+
+def _literalShape(structure):
+    """Returns the shape of a PG array from its braces and commas.
+
+    ``structure`` is the array literal with the elements removed, e.g.,
+    ``'{{,},{,}}'`` for ``'{{1,2},{3,4}}'``. Raises a `ValueError` if the
+    array is not rectangular.
+
+    """
+
+    if structure == '{}':
+        return (0, )
+
+    ndim = len(structure) - len(structure.lstrip('{'))
+
+    shape = []
+    for dim in range(ndim):
+        # Counts the items of the first sub-array at this depth.
+        depth = 0
+        nItems = 1
+        for char in structure[dim:]:
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+            elif char == ',' and depth == 1:
+                nItems += 1
+        shape.append(nItems)
+
+    expected = '{' + ',' * (shape[-1] - 1) + '}'
+    for size in shape[-2::-1]:
+        expected = '{' + ','.join([expected] * size) + '}'
+
+    if expected != structure:
+        raise ValueError('{0!r} is not a valid rectangular array.'
+                         .format(structure))
+
+    return tuple(shape)
+
+
+def _parseArrayLiteral(literal):
+    """Parses a PG array literal that can contain quoted elements.
+
+    Returns a flat list of the elements, in which NULL elements are
+    ``None``, and the shape of the array.
+
+    """
+
+    elements = []
+    structure = []
+
+    ii = 0
+    while ii < len(literal):
+        char = literal[ii]
+        if char in '{},':
+            structure.append(char)
+            ii += 1
+        elif char == '"':
+            ii += 1
+            chars = []
+            while literal[ii] != '"':
+                if literal[ii] == '\\':
+                    ii += 1
+                chars.append(literal[ii])
+                ii += 1
+            elements.append(''.join(chars))
+            ii += 1
+        else:
+            end = ii
+            while end < len(literal) and literal[end] not in ',}':
+                end += 1
+            element = literal[ii:end]
+            elements.append(None if element == 'NULL' else element)
+            ii = end
+
+    return elements, _literalShape(''.join(structure))
+
+
+def _fillArray(nRows, shape, dtype):
+    """Returns an array of NULL array cells (NaN, zero, or empty)."""
+
+    data = np.zeros((nRows, ) + tuple(shape), dtype=dtype)
+    if data.dtype.kind == 'f':
+        data[:] = np.nan
+
+    return data
+
+
+def _parseArrays(values, dtype, shape=None):
+    """Parses a list of PG arrays into an array with one row per value.
+
+    Arrays of any number of dimensions (e.g., ``{{1,2},{3,4}}``) are
+    supported, and all of them must have the same shape. NULL arrays are
+    filled with NaN (or zeros) and masked. If all the arrays are NULL, the
+    shape of their cells cannot be known and ``shape`` is used instead; if
+    it is ``None``, the returned data is ``None``.
+
+    """
+
+    values = np.array(values)
+    mask = values == '\\N'
+    valid = values[~mask]
+
+    if len(valid) == 0:
+        if shape is None:
+            return None, mask
+        return _fillArray(len(values), shape, dtype or 'f8'), mask
+
+    quoted = dtype is None and np.any(np.char.count(valid, '"') > 0)
+
+    if (dtype is not None and dtype.kind == 'U') or quoted:
+        parsed, cellShape = _parseStringArrays(valid)
+    else:
+        # Numeric arrays have no quotes, so the structure is what remains
+        # after removing everything but braces and commas, and the elements
+        # can be split in one go.
+        structures = np.unique([re.sub('[^{},]', '', value)
+                                for value in valid.tolist()])
+        if len(structures) > 1:
+            raise ValueError('array columns must have the same shape in all '
+                             'the rows.')
+        cellShape = _literalShape(structures[0])
+
+        if cellShape == (0, ):
+            elements = []
+        else:
+            elements = re.sub('[{}]', '', ','.join(valid.tolist())).split(',')
+
+        nullValue = '0' if dtype is not None and dtype.kind in 'iub' \
+            else 'nan'
+        elements = [nullValue if element == 'NULL' else element
+                    for element in elements]
+
+        if dtype is not None and dtype.kind == 'b':
+            parsed = np.array(elements) == 't'
+        elif dtype is not None:
+            try:
+                parsed = np.array(elements, dtype=dtype)
+            except ValueError:
+                raise ValueError('cannot parse array elements as {0}.'
+                                 .format(dtype))
+        else:
+            # Unknown item types are parsed as floats if possible.
+            try:
+                parsed = np.array(elements, dtype='f8')
+            except ValueError:
+                parsed, cellShape = _parseStringArrays(valid)
+
+    if shape is not None and tuple(shape) != tuple(cellShape):
+        raise ValueError('array columns must have the same shape in all the '
+                         'rows.')
+
+    parsed = parsed.reshape((len(valid), ) + tuple(cellShape))
+
+    data = _fillArray(len(values), cellShape, parsed.dtype)
+    data[~mask] = parsed
+
+    return data, mask
+
+
+def _parseStringArrays(values):
+    """Parses PG arrays of strings. Returns the elements and cell shape."""
+
+    elements = []
+    cellShape = None
+
+    for value in values.tolist():
+        cellElements, valueShape = _parseArrayLiteral(_unescape(value))
+        if cellShape is not None and valueShape != cellShape:
+            raise ValueError('array columns must have the same shape in all '
+                             'the rows.')
+        cellShape = valueShape
+        elements += ['' if element is None else element
+                     for element in cellElements]
+
+    return np.array(elements, dtype='U'), cellShape
+
+
+class _CopySink(object):
+    """A file-like object that parses COPY text output as it arrives.
+
+    The output is parsed in blocks of at least ``blockSize`` bytes, so only
+    the parsed columns and one block of text are kept in memory.
+
+    """
+
+    def __init__(self, columnTypes, blockSize=1 << 24):
+
+        self.columnTypes = columnTypes
+        self.blockSize = blockSize
+
+        self._buffer = []
+        self._bufferSize = 0
+        self.blocks = [[] for __ in columnTypes]
+
+        # The shape of the cells of each array column, once it is known.
+        self.shapes = [None for __ in columnTypes]
+
+    def write(self, data):
+
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        self._buffer.append(data)
+        self._bufferSize += len(data)
+
+        if self._bufferSize >= self.blockSize:
+            self._parseBuffer(final=False)
+
+    def _parseBuffer(self, final=True):
+
+        data = b''.join(self._buffer)
+
+        if final:
+            rest = b''
+        else:
+            # Keeps the last incomplete line for the next block.
+            lastNewLine = data.rfind(b'\n')
+            data, rest = data[:lastNewLine + 1], data[lastNewLine + 1:]
+
+        self._buffer = [rest]
+        self._bufferSize = len(rest)
+
+        lines = data.decode('utf-8').split('\n')
+        if lines[-1] == '':
+            lines = lines[:-1]
+        if len(lines) == 0:
+            return
+
+        columns = list(zip(*[line.split('\t') for line in lines]))
+
+        for ii, (isArray, dtype) in enumerate(self.columnTypes):
+            if isArray:
+                block = _parseArrays(list(columns[ii]), dtype,
+                                     shape=self.shapes[ii])
+                if block[0] is not None:
+                    self.shapes[ii] = block[0].shape[1:]
+            else:
+                block = _parseScalars(list(columns[ii]), dtype)
+            self.blocks[ii].append(block)
+
+    def close(self):
+        """Parses the remaining data and returns the columns and masks."""
+
+        self._parseBuffer(final=True)
+
+        result = []
+        for ii, (isArray, dtype) in enumerate(self.columnTypes):
+            blocks = self.blocks[ii]
+            if len(blocks) == 0:
+                shape = (0, 0) if isArray else (0, )
+                result.append((np.zeros(shape, dtype=dtype or 'f8'),
+                               np.zeros(0, dtype=bool)))
+                continue
+            if isArray:
+                # Blocks in which all the arrays are NULL are filled with
+                # the shape of the other blocks.
+                shape = self.shapes[ii] or (0, )
+                blocks = [(_fillArray(len(mask), shape, dtype or 'f8')
+                           if data is None else data, mask)
+                          for data, mask in blocks]
+            result.append((np.concatenate([data for data, __ in blocks]),
+                           np.concatenate([mask for __, mask in blocks])))
+
+        return result
+
+
+def _getColumns(entity, columns):
+    """Returns a list of (name, expression) for the columns to fetch."""
+
+    if columns is None:
+        return [(column.name, column) for column in entity.__table__.columns]
+
+    result = []
+    for ii, column in enumerate(columns):
+        if isinstance(column, str):
+            result.append((column, getattr(entity, column)))
+        else:
+            name = getattr(column, 'key', None) or \
+                getattr(column, 'name', None) or 'col{0}'.format(ii)
+            result.append((name, column))
+
+    return result
+
+
+def fetchTable(entity, *filters, **kwargs):
+    """Fetches rows of a model class into a Numpy array or astropy table.
+
+    The query is run as ``COPY (SELECT ...) TO STDOUT`` and the output is
+    parsed into Numpy arrays as it is received, without creating a Python
+    object for each row. Postgres array columns (e.g., ``petroth50_el`` or
+    the 2-D ``profmean``) are returned as fixed-shape multidimensional
+    columns.
+
+    Parameters:
+        entity (model class):
+            The model class to query, e.g., ``ModelClasses.NSA``.
+        filters:
+            SQLAlchemy filter expressions, which can include hybrid
+            properties, e.g., ``NSA.petroth50_el_g_r > 0.5``. They are
+            combined with ``AND``.
+        columns (list):
+            The columns to return, as attribute names of ``entity`` or
+            SQLAlchemy expressions. Hybrid properties can be used.
+            Defaults to all the columns in the table of ``entity``.
+        engine (SQLAlchemy |engine|):
+            The engine to use. Defaults to the engine bound to the metadata
+            of ``entity``.
+        orderBy (list):
+            Expressions by which the rows are ordered.
+        limit (int):
+            The maximum number of rows to return.
+        asTable (bool):
+            If ``True`` (the default), returns an astropy table in which
+            columns with NULL values are masked. Otherwise, returns a Numpy
+            structured array in which NULL values are NaN for float columns
+            and zero or an empty string for other columns.
+        blockSize (int):
+            The number of bytes of COPY output parsed at a time.
+
+    Returns:
+        result (astropy.table.Table or numpy.ndarray):
+            The rows that match the filters.
+
+    .. |engine| replace:: Engine `<http://docs.sqlalchemy.org/en/latest/core/connections.html#sqlalchemy.engine.Engine>`_
+
+    """
+
+    columns = kwargs.pop('columns', None)
+    engine = kwargs.pop('engine', None)
+    orderBy = kwargs.pop('orderBy', None)
+    limit = kwargs.pop('limit', None)
+    asTable = kwargs.pop('asTable', True)
+    blockSize = kwargs.pop('blockSize', 1 << 24)
+
+    if len(kwargs) > 0:
+        raise TypeError('unexpected keyword arguments {0}'
+                        .format(', '.join(kwargs)))
+
+    engine = engine or entity.__table__.metadata.bind
+    if engine is None:
+        raise ValueError('no engine given and the metadata is not bound.')
+
+    columns = _getColumns(entity, columns)
+
+    query = sql.select([expression.label(name)
+                        for name, expression in columns])
+    if len(filters) > 0:
+        query = query.where(sql.and_(*filters))
+    if orderBy is not None:
+        query = query.order_by(*orderBy)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return _copyColumns(engine, query, columns, asTable=asTable,
+                        blockSize=blockSize)
+
+
+def _copyColumns(engine, query, columns, asTable=True, blockSize=1 << 24,
+                 prepare=None):
+    """Runs a select with COPY and returns a table or structured array.
+
+    ``columns`` is a list of ``(name, expression)`` in the same order as the
+    columns of ``query``, whose types are used to parse the output. If set,
+    ``prepare`` is called with the cursor before the COPY is run, in the
+    same transaction.
+
+    """
+
+    columnTypes = []
+    for name, expression in columns:
+        sqlType = expression.type
+        if isinstance(sqlType, sqltypes.ARRAY):
+            columnTypes.append((True, _columnDtype(sqlType.item_type)))
+        else:
+            columnTypes.append((False, _columnDtype(sqlType)))
+
+    compiled = query.compile(dialect=engine.dialect)
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        if prepare is not None:
+            prepare(cursor)
+
+        selectSQL = cursor.mogrify(str(compiled), compiled.params)
+        if isinstance(selectSQL, bytes):
+            selectSQL = selectSQL.decode('utf-8')
+
+        sink = _CopySink(columnTypes, blockSize=blockSize)
+        cursor.copy_expert('COPY ({0}) TO STDOUT'.format(selectSQL), sink)
+        connection.commit()
+
+    finally:
+        cursor.close()
+        connection.close()
+
+    parsed = sink.close()
+    names = [name for name, __ in columns]
+
+    if asTable:
+        newTable = table.Table()
+        for name, (data, mask) in zip(names, parsed):
+            if mask.any():
+                fullMask = np.broadcast_to(
+                    mask.reshape(mask.shape + (1, ) * (data.ndim - 1)),
+                    data.shape).copy()
+                newTable[name] = table.MaskedColumn(data, mask=fullMask)
+            else:
+                newTable[name] = data
+        return newTable
+
+    dtype = [(name, data.dtype, data.shape[1:])
+             for name, (data, __) in zip(names, parsed)]
+    nRows = len(parsed[0][0]) if len(parsed) > 0 else 0
+
+    result = np.zeros(nRows, dtype=dtype)
+    for name, (data, __) in zip(names, parsed):
+        result[name] = data
+
+    return result
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+lookup.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Batched and cached lookups of the catalogue rows matched to mangaids.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import io
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import sqlalchemy as sql
+from sqlalchemy.dialects import postgresql
+
+from astropy import table
+
+from mangaSampleDB.columnar import _copyColumns
+
+
+__all__ = ('CatalogueCache', 'invalidateCaches', 'getTargets')
+
+
+# Incremented by invalidateCaches. Caches compare it with the value they saw
+# last to know that they must check the current catalogue again.
+_generation = 0
+
+_reflectedTables = {}
+_reflectLock = threading.Lock()
+
+
+def invalidateCaches():
+    """Makes all the caches in this process check the current catalogues.
+
+    Called by ``ingestCatalogue`` when it changes the current version of a
+    catalogue or reloads it. Caches in other processes notice the change
+    after at most ``checkInterval`` seconds. The tables reflected by
+    `getTargets` are also dropped, since a reload can change their columns.
+
+    """
+
+    global _generation
+    _generation += 1
+
+    with _reflectLock:
+        _reflectedTables.clear()
+
+
+def _checkCatalogueName(catalogue):
+    """Checks that a catalogue name is a valid, unquoted identifier."""
+
+    if not re.match(r'^[a-z_][a-z0-9_]*$', catalogue):
+        raise ValueError('invalid catalogue name {0!r}.'.format(catalogue))
+
+    return catalogue
+
+
+def _getTables(engine, catalogue):
+    """Returns the reflected tables needed to look up a catalogue.
+
+    Returns the ``manga_target``, ``current_catalogue``, catalogue, and
+    relational tables. They are reflected once per engine and catalogue, and
+    again after `invalidateCaches`.
+
+    """
+
+    key = (str(engine.url), catalogue)
+
+    with _reflectLock:
+        if key not in _reflectedTables:
+            metadata = sql.MetaData(schema='mangasampledb')
+            _reflectedTables[key] = tuple(
+                sql.Table(tableName, metadata, autoload=True,
+                          autoload_with=engine)
+                for tableName in ['manga_target', 'current_catalogue',
+                                  catalogue,
+                                  'manga_target_to_{0}'.format(catalogue)])
+
+    return _reflectedTables[key]
+
+
+def getTargets(mangaids, catalogue='nsa', columns=None, engine=None,
+               asTable=True, copyThreshold=100000):
+    """Returns the targets and catalogue rows for a list of mangaids.
+
+    All the mangaids are sent to the server in a single statement, as an
+    array (or, for lists longer than ``copyThreshold``, in a temporary table
+    filled with ``COPY``), and the rows are received with
+    ``COPY (SELECT ...) TO STDOUT`` and parsed into Numpy columns, so the
+    number of queries does not depend on the number of mangaids.
+
+    The output has a row for each input mangaid, in the same order. If a
+    mangaid is matched to more than one row in the catalogue, it appears in
+    several consecutive rows. Only catalogue rows that belong to the current
+    version of the catalogue are returned.
+
+    Parameters:
+        mangaids (list):
+            The mangaids to look up.
+        catalogue (str):
+            The name of the catalogue, e.g., ``'nsa'``.
+        columns (list or None):
+            The catalogue columns to return. Defaults to all of them.
+        engine (SQLAlchemy |engine|):
+            The engine to use to connect to the DB.
+        asTable (bool):
+            If ``True`` (the default), returns an astropy table in which NULL
+            values (including all the catalogue columns of unmatched
+            mangaids) are masked. Otherwise, returns a Numpy structured
+            array. See `.fetchTable`.
+        copyThreshold (int):
+            The number of mangaids above which they are sent to the server
+            with ``COPY`` instead of as an array.
+
+    Returns:
+        result (astropy.table.Table or numpy.ndarray):
+            A table with the columns ``mangaid``, ``found`` (``True`` if the
+            mangaid is in mangasampledb.manga_target), ``matched`` (``True``
+            if it is matched to a row in the current catalogue),
+            ``manga_target_pk``, and the catalogue columns. Catalogue
+            columns with the same name as one of the former are renamed
+            ``catalogue_<column>``, or skipped if that name is taken.
+
+    Example:
+        Getting the redshifts of some targets
+          >>> getTargets(['1-209232', '1-1234'], columns=['nsaid', 'z'],
+          ...            engine=engine)
+
+    .. |engine| replace:: Engine `<http://docs.sqlalchemy.org/en/latest/core/connections.html#sqlalchemy.engine.Engine>`_
+
+    """
+
+    if engine is None:
+        raise ValueError('an engine is required.')
+
+    catalogue = _checkCatalogueName(catalogue)
+    mangaids = [str(mangaid).strip() for mangaid in np.atleast_1d(mangaids)]
+
+    target, current, catTable, relTable = _getTables(engine, catalogue)
+
+    if columns is None:
+        catColumns = list(catTable.columns)
+    else:
+        catColumns = [catTable.columns[column] for column in columns]
+
+    useCopy = len(mangaids) > copyThreshold
+
+    if useCopy:
+        ids = sql.table('target_ids', sql.column('ordinal', sql.BigInteger),
+                        sql.column('mangaid', sql.Text))
+    else:
+        ids = sql.func.unnest(
+            sql.bindparam('mangaids', mangaids,
+                          type_=postgresql.ARRAY(sql.Text))).table_valued(
+            sql.column('mangaid', sql.Text),
+            with_ordinality='ordinal').render_derived(name='ids')
+
+    # The catalogue rows are joined to the targets only if they belong to the
+    # current version of the catalogue.
+    currentRows = relTable.join(
+        catTable,
+        catTable.c.pk == relTable.c['{0}_pk'.format(catalogue)]).join(
+        current, current.c.catalogue_pk == catTable.c.catalogue_pk)
+
+    columns = [('mangaid', ids.c.mangaid),
+               ('found', target.c.pk.isnot(None)),
+               ('matched', catTable.c.pk.isnot(None)),
+               ('manga_target_pk', target.c.pk)]
+    # Catalogue columns named like the columns above are renamed, or skipped
+    # if the new name is taken, as in the current views.
+    names = set(name for name, __ in columns)
+    catNames = set(column.name for column in catColumns)
+    for column in catColumns:
+        name = column.name
+        if name in names:
+            name = 'catalogue_' + name
+            if name in catNames:
+                continue
+        columns.append((name, column))
+
+    query = sql.select([expression.label(name)
+                        for name, expression in columns]).select_from(
+        ids.outerjoin(target, target.c.mangaid == ids.c.mangaid).outerjoin(
+            currentRows, relTable.c.manga_target_pk == target.c.pk)).order_by(
+        ids.c.ordinal, catTable.c.pk)
+
+    def prepare(cursor):
+        # Creates the temporary table with the mangaids and their order.
+        # Imported here because mangaSampleDB.utils imports this module.
+        from mangaSampleDB.utils.table_to_db import encode_text_chunk
+        cursor.execute('CREATE TEMPORARY TABLE target_ids '
+                       '(ordinal bigint, mangaid text) ON COMMIT DROP;')
+        idsText = encode_text_chunk(table.Table([mangaids],
+                                                names=['mangaid']))
+        cursor.copy_expert('COPY target_ids FROM STDIN',
+                           io.StringIO(idsText))
+
+    return _copyColumns(engine, query, columns, asTable=asTable,
+                        prepare=prepare if useCopy else None)
+
+
+class CatalogueCache(object):
+    """A cache of the rows of a catalogue matched to each mangaid.
+
+    Returns the rows of the current version of a catalogue joined to a
+    mangaid through its ``manga_target_to_<catalogue>`` table, as a list of
+    dictionaries. Results are kept in an in-process LRU cache and,
+    optionally, in a SQLite file that can be shared by several processes.
+
+    Entries are keyed by the ``pk`` of the current version of the
+    catalogue in mangasampledb.current_catalogue and by the version of that
+    row, which ``ingestCatalogue`` updates every time the catalogue is
+    loaded. When a different version is made current, or the current one is
+    reloaded, old entries are not returned anymore and are removed.
+    The current version is checked at most every ``checkInterval`` seconds,
+    and immediately after a catalogue record is created in this process.
+
+    Parameters:
+        engine (SQLAlchemy |engine|):
+            The engine to use to connect to the DB.
+        catalogue (str):
+            The name of the catalogue, e.g., ``'nsa'``.
+        maxSize (int or None):
+            The maximum number of mangaids in the in-process cache. If
+            ``None``, the size is not limited.
+        ttl (float or None):
+            The number of seconds after which an entry expires. If ``None``,
+            entries only expire when the current catalogue changes.
+        cacheFile (str or None):
+            The path of a SQLite file used as a shared on-disk cache. If
+            ``None``, only the in-process cache is used.
+        checkInterval (float):
+            The maximum number of seconds between checks of the current
+            version of the catalogue.
+
+    Example:
+        Getting the NSA rows for a mangaid
+          >>> cache = CatalogueCache(engine, 'nsa', maxSize=50000, ttl=3600)
+          >>> cache.get('1-209232')
+          [{'pk': 1234, 'nsaid': 1234, ...}]
+
+    .. |engine| replace:: Engine `<http://docs.sqlalchemy.org/en/latest/core/connections.html#sqlalchemy.engine.Engine>`_
+
+    """
+
+    def __init__(self, engine, catalogue='nsa', maxSize=10000, ttl=None,
+                 cacheFile=None, checkInterval=10.):
+
+        self.engine = engine
+        self.catalogue = _checkCatalogueName(catalogue)
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.cacheFile = cacheFile
+        self.checkInterval = checkInterval
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+        self._state = None
+        self._lastCheck = None
+        self._generation = None
+
+        url = engine.url
+        self._database = '{0}:{1}/{2}'.format(url.host, url.port,
+                                              url.database)
+
+        self._disk = None
+        if cacheFile is not None:
+            self._openDiskCache()
+
+    def _openDiskCache(self):
+        """Opens (and creates, if needed) the on-disk cache."""
+
+        cacheDir = os.path.dirname(os.path.abspath(self.cacheFile))
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+
+        self._disk = sqlite3.connect(self.cacheFile, timeout=30.,
+                                     check_same_thread=False)
+        self._disk.execute('PRAGMA journal_mode=WAL;')
+        self._disk.execute(
+            'CREATE TABLE IF NOT EXISTS lookup ('
+            'database TEXT, catalogue TEXT, state TEXT, mangaid TEXT, '
+            'created REAL, value BLOB, '
+            'PRIMARY KEY (database, catalogue, state, mangaid));')
+        self._disk.commit()
+
+    def _getState(self):
+        """Returns the pk and row version of the current catalogue record.
+
+        The row version (``xmin``) changes every time the catalogue is
+        reloaded, even if the current version is the same.
+
+        """
+
+        query = sql.text(
+            'SELECT current.catalogue_pk || \':\' || current.xmin::text '
+            'FROM mangasampledb.current_catalogue AS current '
+            'JOIN mangasampledb.catalogue AS cat '
+            'ON cat.pk = current.catalogue_pk '
+            'WHERE cat.catalogue_name = :catalogue')
+
+        with self.engine.connect() as connection:
+            state = connection.execute(query,
+                                       catalogue=self.catalogue).scalar()
+
+        return str(state)
+
+    def _checkState(self):
+        """Drops the entries if the current catalogue has changed."""
+
+        now = time.time()
+
+        if self._generation == _generation and self._lastCheck is not None \
+                and now - self._lastCheck < self.checkInterval:
+            return
+
+        state = self._getState()
+        self._lastCheck = now
+        self._generation = _generation
+
+        if state == self._state:
+            return
+
+        self._entries.clear()
+        self._state = state
+
+        if self._disk is not None:
+            self._disk.execute(
+                'DELETE FROM lookup WHERE database = ? AND catalogue = ? '
+                'AND state != ?;', (self._database, self.catalogue, state))
+            self._disk.commit()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _getMemory(self, mangaid):
+        """Returns the rows from the in-process cache, or None."""
+
+        entry = self._entries.get(mangaid)
+        if entry is None:
+            return None
+
+        created, rows = entry
+        if self._expired(created):
+            del self._entries[mangaid]
+            return None
+
+        self._entries.move_to_end(mangaid)
+
+        return rows
+
+    def _setMemory(self, mangaid, rows, created=None):
+        """Adds rows to the in-process cache, evicting the oldest entries."""
+
+        self._entries[mangaid] = (created or time.time(), rows)
+        self._entries.move_to_end(mangaid)
+
+        if self.maxSize is not None:
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    def _getDisk(self, mangaid):
+        """Returns the rows and creation time from the disk cache, or None."""
+
+        if self._disk is None:
+            return None
+
+        row = self._disk.execute(
+            'SELECT created, value FROM lookup WHERE database = ? AND '
+            'catalogue = ? AND state = ? AND mangaid = ?;',
+            (self._database, self.catalogue, self._state,
+             mangaid)).fetchone()
+
+        if row is None or self._expired(row[0]):
+            return None
+
+        return row[0], pickle.loads(row[1])
+
+    def _setDisk(self, mangaid, rows):
+        """Adds rows to the disk cache."""
+
+        if self._disk is None:
+            return
+
+        self._disk.execute(
+            'INSERT OR REPLACE INTO lookup VALUES (?, ?, ?, ?, ?, ?);',
+            (self._database, self.catalogue, self._state, mangaid,
+             time.time(), pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)))
+        self._disk.commit()
+
+    def _fetch(self, mangaid):
+        """Queries the DB for the rows matched to a mangaid."""
+
+        query = sql.text(
+            'SELECT cat.* FROM mangasampledb.manga_target AS target '
+            'JOIN mangasampledb.manga_target_to_{0} AS rel '
+            'ON rel.manga_target_pk = target.pk '
+            'JOIN mangasampledb.{0} AS cat ON cat.pk = rel.{0}_pk '
+            'JOIN mangasampledb.current_catalogue AS current '
+            'ON current.catalogue_pk = cat.catalogue_pk '
+            'WHERE target.mangaid = :mangaid ORDER BY cat.pk'
+            .format(self.catalogue))
+
+        with self.engine.connect() as connection:
+            result = connection.execute(query, mangaid=mangaid)
+            return [dict(row) for row in result]
+
+    def get(self, mangaid):
+        """Returns a list with the catalogue rows matched to a mangaid.
+
+        Each row is a dictionary of column names to values. The list is
+        empty if the mangaid is not matched to the current version of the
+        catalogue. The returned list must not be modified, since it is the
+        one stored in the cache.
+
+        """
+
+        mangaid = str(mangaid).strip()
+
+        with self._lock:
+
+            self._checkState()
+
+            rows = self._getMemory(mangaid)
+            if rows is not None:
+                self.hits += 1
+                return rows
+
+            diskEntry = self._getDisk(mangaid)
+            if diskEntry is not None:
+                self.hits += 1
+                self._setMemory(mangaid, diskEntry[1], created=diskEntry[0])
+                return diskEntry[1]
+
+            self.misses += 1
+
+            rows = self._fetch(mangaid)
+            self._setMemory(mangaid, rows)
+            self._setDisk(mangaid, rows)
+
+            return rows
+
+    def clear(self):
+        """Removes all the entries for this catalogue and database."""
+
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute(
+                    'DELETE FROM lookup WHERE database = ? AND '
+                    'catalogue = ?;', (self._database, self.catalogue))
+                self._disk.commit()
+
+    def close(self):
+        """Closes the on-disk cache."""
+
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, mangaid):
+        with self._lock:
+            return self._getMemory(str(mangaid).strip()) is not None
+
+    def __repr__(self):
+        return '<CatalogueCache (catalogue={0}, entries={1})>'.format(
+            self.catalogue, len(self))
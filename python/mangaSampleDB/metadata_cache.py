@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+metadata_cache.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+An on-disk cache of the reflected SQLAlchemy metadata for mangasampledb, so
+that importing the model classes does not need to reflect every table.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import warnings
+
+import sqlalchemy as sql
+
+
+__all__ = ('schemaFingerprint', 'loadCachedMetadata', 'saveCachedMetadata')
+
+
+# The cache can be moved with MANGASAMPLEDB_CACHE_DIR or disabled by setting
+# MANGASAMPLEDB_NO_METADATA_CACHE.
+defaultCacheDir = os.path.join(os.path.expanduser('~'), '.cache',
+                               'mangaSampleDB')
+
+# Changes when the format of the cache file changes.
+_cacheVersion = 3
+
+
+_fingerprintSQL = """
+SELECT md5(coalesce(string_agg(item, ',' ORDER BY item), ''))
+FROM (
+    SELECT table_name || '.' || column_name || ':' || data_type || ':' ||
+           udt_name || ':' || is_nullable || ':' || ordinal_position AS item
+    FROM information_schema.columns WHERE table_schema = :schema
+    UNION ALL
+    SELECT conrelid::regclass::text || '.' || conname || ':' ||
+           pg_get_constraintdef(con.oid) AS item
+    FROM pg_constraint AS con
+    JOIN pg_namespace AS nsp ON nsp.oid = con.connamespace
+    WHERE nsp.nspname = :schema
+    UNION ALL
+    SELECT 'matview.' || matviewname AS item
+    FROM pg_matviews WHERE schemaname = :schema) AS items;
+"""
+
+
+def _cacheEnabled():
+    return not os.environ.get('MANGASAMPLEDB_NO_METADATA_CACHE', False)
+
+
+def _cacheDir():
+    return os.environ.get('MANGASAMPLEDB_CACHE_DIR', defaultCacheDir)
+
+
+def schemaFingerprint(engine, schema='mangasampledb'):
+    """Returns a hash of the columns, constraints, and views of a schema.
+
+    The hash changes whenever a table, column, or materialized view is added,
+    dropped, or altered, or a constraint changes, so it can be used to
+    invalidate the cached metadata.
+
+    """
+
+    with engine.connect() as connection:
+        return connection.execute(sql.text(_fingerprintSQL),
+                                  schema=schema).scalar()
+
+
+def _cachePath(engine, schema, fingerprint):
+    """Returns the path of the cache file for an engine and fingerprint."""
+
+    url = engine.url
+    key = hashlib.md5('{0}:{1}:{2}:{3}:{4}:{5}:{6}:{7}'.format(
+        url.host, url.port, url.database, schema, fingerprint,
+        sql.__version__, pickle.HIGHEST_PROTOCOL,
+        _cacheVersion).encode()).hexdigest()
+
+    return os.path.join(_cacheDir(), 'metadata_{0}.pickle'.format(key))
+
+
+def _isPrivate(path):
+    """Returns True if only the current user could have written the file.
+
+    The cache is unpickled, so it is only trusted if it is a regular file
+    owned by the current user that nobody else can read or write, as
+    written by `saveCachedMetadata`.
+
+    """
+
+    if not hasattr(os, 'getuid'):
+        return True
+
+    status = os.lstat(path)
+
+    return (stat.S_ISREG(status.st_mode) and
+            status.st_uid == os.getuid() and
+            status.st_mode & 0o077 == 0)
+
+
+def loadCachedMetadata(engine, schema='mangasampledb'):
+    """Returns the cached metadata for a schema, or None.
+
+    Returns a tuple with the cached ``MetaData`` (or ``None`` if there is no
+    valid cache for the current schema fingerprint) and the path of the cache
+    file, which can be passed to `saveCachedMetadata`. If they were saved,
+    the names of all the tables in the schema, which may not all be in the
+    cached metadata, are available as ``metadata.info['tableNames']``, and
+    those of the materialized views as ``metadata.info['viewNames']``.
+    A cache file that is not owned by the current user, or that other users
+    can read or write, is ignored.
+
+    """
+
+    if not _cacheEnabled():
+        return None, None
+
+    path = _cachePath(engine, schema, schemaFingerprint(engine, schema))
+
+    if not os.path.exists(path):
+        return None, path
+
+    if not _isPrivate(path):
+        warnings.warn('ignoring cached metadata {0}: the file must be owned '
+                      'by the current user with permissions 0600'
+                      .format(path), UserWarning)
+        return None, path
+
+    try:
+        with open(path, 'rb') as unit:
+            cache = pickle.load(unit)
+        metadata = cache['metadata']
+        metadata.info['tableNames'] = cache['tableNames']
+        metadata.info['viewNames'] = cache['viewNames']
+        return metadata, path
+    except Exception as ee:
+        warnings.warn('failed reading cached metadata {0}: {1}'
+                      .format(path, ee), UserWarning)
+        return None, path
+
+
+def saveCachedMetadata(metadata, path, schema='mangasampledb',
+                       tableNames=None, viewNames=None):
+    """Saves the tables of a schema in ``metadata`` to the cache file.
+
+    ``tableNames`` can be the list of all the tables in the schema, if not
+    all of them are in ``metadata``, and ``viewNames`` that of the
+    materialized views. The file is written atomically, so
+    several processes can save and load the cache at the same time.
+
+    """
+
+    if path is None:
+        return
+
+    cacheMetadata = sql.MetaData()
+    for table in metadata.tables.values():
+        if table.schema == schema:
+            table.tometadata(cacheMetadata)
+
+    try:
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), mode=0o700)
+        # mkstemp creates the file with permissions 0600.
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as unit:
+            pickle.dump({'metadata': cacheMetadata,
+                         'tableNames': tableNames,
+                         'viewNames': viewNames},
+                        unit, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, path)
+    except Exception as ee:
+        warnings.warn('failed saving cached metadata {0}: {1}'
+                      .format(path, ee), UserWarning)
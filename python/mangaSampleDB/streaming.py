@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+streaming.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Iterates over the results of large queries using server-side cursors, so
+that the rows are received in batches instead of all at once.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+from sqlalchemy.orm import Query, sessionmaker
+
+
+__all__ = ('streamQuery')
+
+
+def _streamObjects(query, batchSize):
+    """Yields ORM objects from a query executed with a server-side cursor."""
+
+    iterator = iter(query.yield_per(batchSize).execution_options(
+        stream_results=True, max_row_buffer=batchSize))
+
+    try:
+        for instance in iterator:
+            yield instance
+    finally:
+        # Closes the result (and the cursor) if the consumer stops early.
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+
+def _streamTuples(query, batchSize):
+    """Yields plain tuples from a query executed with a server-side cursor."""
+
+    connection = query.session.connection().execution_options(
+        stream_results=True, max_row_buffer=batchSize)
+    result = connection.execute(query.statement)
+
+    try:
+        while True:
+            rows = result.fetchmany(batchSize)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+    finally:
+        result.close()
+
+
+def streamQuery(query, *filters, **kwargs):
+    """Iterates over the results of a query using a server-side cursor.
+
+    The query is executed with a named cursor and the rows are fetched from
+    the server in batches of ``batchSize``, so the first rows are available
+    as soon as the first batch has been sent and the memory used does not
+    depend on the size of the result. If the consumer stops iterating
+    before the end (e.g., with ``break``), the cursor is closed when the
+    iterator is closed or garbage collected.
+
+    Parameters:
+        query (Query or model class):
+            An ORM ``Query`` (e.g., ``session.query(NSA).filter(...)``) or a
+            model class. In the latter case, a new session bound to the
+            engine of the model is used and closed at the end.
+        filters:
+            Filter expressions applied to the query.
+        batchSize (int):
+            The number of rows fetched from the server at a time.
+        tuples (bool):
+            If ``True``, yields plain tuples of column values instead of ORM
+            objects. This avoids creating an object per row.
+
+    Returns:
+        result (generator):
+            A generator that yields ORM objects or tuples.
+
+    Example:
+        Iterating over the NSA catalogue
+          >>> for nsa in streamQuery(NSA, NSA.z < 0.05, batchSize=5000):
+          ...     process(nsa)
+
+    """
+
+    batchSize = kwargs.pop('batchSize', 1000)
+    tuples = kwargs.pop('tuples', False)
+
+    if len(kwargs) > 0:
+        raise TypeError('unexpected keyword arguments {0}'
+                        .format(', '.join(kwargs)))
+
+    session = None
+    if not isinstance(query, Query):
+        session = sessionmaker(bind=query.__table__.metadata.bind)()
+        query = session.query(query)
+
+    if len(filters) > 0:
+        query = query.filter(*filters)
+
+    if tuples:
+        rows = _streamTuples(query, batchSize)
+    else:
+        rows = _streamObjects(query, batchSize)
+
+    try:
+        for row in rows:
+            yield row
+    finally:
+        rows.close()
+        if session is not None:
+            session.close()
@@ -1,8 +1,10 @@
 from __future__ import absolute_import
 
-from .connection import create_connection
+from .connection import create_connection, create_async_connection
 
+from .instrumentation import Metrics, addMetricsCallback
 from .table_to_db import table_to_db
 from .catalogue import ingestCatalogue
+from .crossmatch import createMatchFile
 from .characters import loadMangaCharacters
 from .targets import loadMangaTargets
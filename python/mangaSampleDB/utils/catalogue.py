@@ -19,6 +19,11 @@ from __future__ import print_function
 import os
 import warnings
 
+try:
+    from cStringIO.StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 import sqlalchemy as sql
 from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy.orm import sessionmaker
@@ -28,7 +33,13 @@ from sqlalchemy.orm import mapper, configure_mappers
 from astropy import table
 import numpy as np
 
-from mangaSampleDB.utils.table_to_db import table_to_db
+from mangaSampleDB.lookup import invalidateCaches
+from mangaSampleDB.utils.instrumentation import Metrics
+from mangaSampleDB.utils.table_to_db import (table_to_db, encode_text_chunk,
+                                             create_indexes, analyze_table)
+from mangaSampleDB.utils.views import (createCurrentView, currentViewSQL,
+                                       getCatalogueColumns,
+                                       refreshCurrentViews)
 
 
 def _warning(message, category, *args, **kwargs):
@@ -41,8 +52,14 @@ __all__ = ('ingestCatalogue')
 
 
 def _createCatalogueRecord(Base, session, catname, version,
-                           match=None, current=True):
-    """Adds a new row to the mangasampledb.catalogue table."""
+                           match=None, current=True, refreshViews=True):
+    """Adds a new row to the mangasampledb.catalogue table.
+
+    If the new version is made current and ``refreshViews=True``, the current
+    view of the catalogue, if any, is refreshed. The lookup caches in this
+    process are told to check the current catalogues again.
+
+    """
 
     Catalogue = Base.classes.catalogue
     CurrentCatalogue = Base.classes.current_catalogue
@@ -70,11 +87,14 @@ def _createCatalogueRecord(Base, session, catname, version,
             if currentCheck:
                 currentToRemove = session.query(CurrentCatalogue).get(
                     currentCheck)
+                # The name of the automap relationship depends on the
+                # SQLAlchemy version, so we query the catalogue directly.
+                catalogueToRemove = session.query(Catalogue).get(
+                    currentToRemove.catalogue_pk)
                 warnings.warn(
                     'removing {0} {1} as current catalogue'
-                    .format(
-                        currentToRemove.mangasampledb_catalogue.catalogue_name,
-                        currentToRemove.mangasampledb_catalogue.version),
+                    .format(catalogueToRemove.catalogue_name,
+                            catalogueToRemove.version),
                     UserWarning)
                 session.delete(currentToRemove)
 
@@ -84,16 +104,191 @@ def _createCatalogueRecord(Base, session, catname, version,
             print('INFO: added {0} {1} as current catalogue'
                   .format(catname, version))
 
+        invalidateCaches()
+
+        if refreshViews:
+            refreshCurrentViews(session.bind, catname)
+
     return newCatalogue.pk
 
 
+def _asComparable(values):
+    """Returns an array in which byte strings have been decoded."""
+
+    values = np.asarray(values)
+    if values.dtype.kind == 'S':
+        return np.char.decode(values, 'utf-8')
+    elif values.dtype.kind == 'O' and len(values) > 0 and \
+            isinstance(values[0], str):
+        return values.astype(str)
+
+    return values
+
+
+def _unzipColumns(rows):
+    """Returns a list of query rows as two arrays."""
+
+    if len(rows) == 0:
+        return np.array([], dtype=int), np.array([])
+
+    return tuple(np.array(column) for column in zip(*rows))
+
+
+def _getMatchColumns(matchCat):
+    """Returns the names of the mangaid and match columns of a match table."""
+
+    mangaIdCol = [col for col in matchCat.colnames
+                  if col.lower() == 'mangaid'][0]
+    matchCol = [col for col in matchCat.colnames
+                if col.lower() != 'mangaid'][0]
+
+    return mangaIdCol, matchCol
+
+
+def firstMatchIndices(keys, values):
+    """Returns the index of the first occurrence of each value in ``keys``.
+
+    Uses a sorted index of the unique ``keys`` so that the cost scales as
+    ``O((N + M) log N)`` instead of scanning ``keys`` for each value. Values
+    that are not found in ``keys`` get an index of -1.
+
+    """
+
+    keys = _asComparable(keys)
+    values = _asComparable(values)
+
+    if len(keys) == 0 or len(values) == 0:
+        return np.full(len(values), -1, dtype=int)
+
+    # np.unique returns the index of the first occurrence of each unique key.
+    uniqueKeys, firstIndices = np.unique(keys, return_index=True)
+
+    positions = np.searchsorted(uniqueKeys, values)
+    positions[positions == len(uniqueKeys)] = 0
+    found = uniqueKeys[positions] == values
+
+    return np.where(found, firstIndices[positions], -1)
+
+
+def _insertRelationalDataServerSide(engine, matchCat, NewCatTable,
+                                    relationalTable, matchCol, catName,
+                                    step=5000):
+    """Fills the relational table with a join executed in the server.
+
+    The match catalogue is copied into a temporary staging table and the
+    relational table is populated with a single ``INSERT ... SELECT``, so
+    neither manga_target nor the catalogue table are read by the client. If
+    a mangaid or match value is repeated, the row with the lowest pk is used.
+
+    """
+
+    matchCatMangaIdCol, matchCatCol = _getMatchColumns(matchCat)
+
+    newCatTable = NewCatTable.__table__
+    matchColType = newCatTable.c[matchCol].type.compile(dialect=engine.dialect)
+
+    staging = table.Table(
+        [matchCat[matchCatMangaIdCol], matchCat[matchCatCol]],
+        names=['mangaid', 'match_value'])
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        # The pk added by the encoder keeps the order of the match catalogue.
+        cursor.execute('CREATE TEMPORARY TABLE match_staging '
+                       '(row_order INTEGER, mangaid TEXT, match_value {0}) '
+                       'ON COMMIT DROP;'.format(matchColType))
+
+        for start in range(0, len(staging), step):
+            chunk = encode_text_chunk(staging[start:start + step],
+                                      first_pk=start + 1)
+            cursor.copy_expert('COPY match_staging FROM STDIN',
+                               StringIO(chunk))
+
+        cursor.execute(
+            'INSERT INTO {relTable} (manga_target_pk, {catName}_pk) '
+            'SELECT DISTINCT ON (staging.row_order) target.pk, cat.pk '
+            'FROM match_staging AS staging '
+            'JOIN mangasampledb.manga_target AS target '
+            'ON target.mangaid = staging.mangaid '
+            'JOIN {catTable} AS cat ON cat.{matchCol} = staging.match_value '
+            'ORDER BY staging.row_order, target.pk, cat.pk;'
+            .format(relTable=relationalTable.fullname, catName=catName,
+                    catTable=newCatTable.fullname, matchCol=matchCol))
+
+        connection.commit()
+
+    except Exception:
+        connection.rollback()
+        raise
+
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def _finaliseRelationalTable(engine, relationalTableName, catName,
+                             newCatTableName, indexWorkers=1,
+                             concurrently=False):
+    """Adds the foreign keys and indexes to a loaded relational table.
+
+    Adding the constraints once the data are in the table validates all the
+    rows in a single pass, instead of checking each row as it is inserted.
+    The constraints are the same that the table had when it was created with
+    them, with the default names and no referential actions.
+
+    """
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        for column, target in [
+                ('manga_target_pk', 'mangasampledb.manga_target'),
+                ('{0}_pk'.format(catName),
+                 'mangasampledb.{0}'.format(newCatTableName))]:
+            cursor.execute(
+                'ALTER TABLE ONLY mangasampledb.{table} '
+                'ADD CONSTRAINT {table}_{column}_fkey '
+                'FOREIGN KEY ({column}) REFERENCES {target}(pk);'.format(
+                    table=relationalTableName, column=column, target=target))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+
+    create_indexes(engine, 'mangasampledb', relationalTableName,
+                   ['manga_target_pk', '{0}_pk'.format(catName)],
+                   workers=indexWorkers, concurrently=concurrently)
+    analyze_table(engine, 'mangasampledb', relationalTableName)
+
+
 def _createRelationalTable(Base, engine, session, metadata,
-                           matchCat, NewCatTable, overwrite=False):
-    """Created a relation table between `NewTable` and manga_target."""
+                           matchCat, NewCatTable, overwrite=False,
+                           serverJoin=False, indexWorkers=1,
+                           concurrently=False, catName=None,
+                           relationalTableName=None, unlogged=False):
+    """Created a relation table between `NewTable` and manga_target.
+
+    If ``serverJoin=True``, the join between the match catalogue,
+    manga_target, and the new catalogue table is executed in the server.
+    The foreign keys and indexes are added after the table has been filled.
+
+    By default the relational table is called ``manga_target_to_<table>``
+    and its column ``<table>_pk``, where ``<table>`` is the name of the
+    catalogue table. ``catName`` and ``relationalTableName`` can be used to
+    override them when the catalogue table will be renamed later.
+
+    """
 
     MangaTarget = Base.classes.manga_target
 
     newCatTableName = NewCatTable.__table__.name.lower()
+    catName = catName or newCatTableName
 
     # Checks if table exists
     inspector = Inspector.from_engine(engine)
@@ -102,7 +297,8 @@ def _createRelationalTable(Base, engine, session, metadata,
     matchCol = [col.lower() for col in matchCat.colnames
                 if col.lower() != 'mangaid'][0]
 
-    relationalTableName = 'manga_target_to_{0}'.format(newCatTableName)
+    relationalTableName = (relationalTableName or
+                           'manga_target_to_{0}'.format(catName))
 
     if relationalTableName in tables:
 
@@ -121,13 +317,20 @@ def _createRelationalTable(Base, engine, session, metadata,
         connection.commit()
         cursor.close()
 
+    # Removes the reflected definition of the table, if it was dropped here
+    # or after ``metadata`` was reflected (e.g., the shadow table left by a
+    # failed swap). It cannot be extended with the new prefixes.
+    reflected = metadata.tables.get(
+        'mangasampledb.{0}'.format(relationalTableName))
+    if reflected is not None:
+        metadata.remove(reflected)
+
     relationalTable = sql.Table(
         relationalTableName, metadata,
         sql.Column('pk', sql.Integer, primary_key=True),
-        sql.Column('manga_target_pk', sql.Integer,
-                   sql.ForeignKey(MangaTarget.pk)),
-        sql.Column('{0}_pk'.format(newCatTableName), sql.Integer,
-                   sql.ForeignKey(NewCatTable.pk)), extend_existing=True)
+        sql.Column('manga_target_pk', sql.Integer),
+        sql.Column('{0}_pk'.format(catName), sql.Integer),
+        prefixes=['UNLOGGED'] if unlogged else [], extend_existing=True)
 
     metadata.create_all(engine)
 
@@ -141,40 +344,271 @@ def _createRelationalTable(Base, engine, session, metadata,
 
     print('INFO: loading data into {0} ...'.format(relationalTableName))
 
+    if serverJoin:
+        _insertRelationalDataServerSide(engine, matchCat, NewCatTable,
+                                        relationalTable, matchCol, catName)
+        _finaliseRelationalTable(engine, relationalTableName, catName,
+                                 newCatTableName, indexWorkers=indexWorkers,
+                                 concurrently=concurrently)
+        return RelationalTable
+
     # Gets information for pks and mangaids from MangaTarget
     mangaTargetData = session.query(MangaTarget.pk, MangaTarget.mangaid).all()
-    mangaIds = np.array(list(zip(*mangaTargetData))[1])
-    mangaTargetPks = np.array(list(zip(*mangaTargetData))[0])
+    mangaTargetPks, mangaIds = _unzipColumns(mangaTargetData)
 
     # Does the same with the new catalogue table, using the match column
     matchColData = session.query(
         NewCatTable.pk, getattr(NewCatTable, matchCol)).all()
+    newTableMatchPks, newTableMatchValues = _unzipColumns(matchColData)
+
+    # Joins the rows in the matching catalogue with both tables. As before,
+    # if a mangaid or match value is repeated, the first row is used.
+    matchCatMangaIdCol, matchCatCol = _getMatchColumns(matchCat)
+
+    mangaTargetIndx = firstMatchIndices(mangaIds, matchCat[matchCatMangaIdCol])
+    newTableIndx = firstMatchIndices(newTableMatchValues,
+                                     matchCat[matchCatCol])
+
+    valid = (mangaTargetIndx >= 0) & (newTableIndx >= 0)
 
-    newTableMatchValues = np.array(list(zip(*matchColData))[1])
-    newTableMatchPks = np.array(list(zip(*matchColData))[0])
-
-    # Builds the insert dictionary making sure we get information about both
-    # mangaid and new catalogue match column.
-    insertData = []
-    for mangaid, matchVal in matchCat:
-        if mangaid not in mangaIds or matchVal not in newTableMatchValues:
-            continue
-        mangaTargetPk = mangaTargetPks[np.where(mangaIds == mangaid)][0]
-        newTableMatchPk = newTableMatchPks[
-            np.where(newTableMatchValues == matchVal)][0]
-        insertData.append(
-            {'manga_target_pk': int(mangaTargetPk),
-             '{0}_pk'.format(newCatTableName): int(newTableMatchPk)})
+    insertData = [
+        {'manga_target_pk': int(mangaTargetPk),
+         '{0}_pk'.format(catName): int(newTableMatchPk)}
+        for mangaTargetPk, newTableMatchPk in
+        zip(mangaTargetPks[mangaTargetIndx[valid]],
+            newTableMatchPks[newTableIndx[valid]])]
 
     # Inserts the data
-    engine.execute(RelationalTable.__table__.insert(insertData))
+    if len(insertData) > 0:
+        engine.execute(RelationalTable.__table__.insert(insertData))
+
+    _finaliseRelationalTable(engine, relationalTableName, catName,
+                             newCatTableName, indexWorkers=indexWorkers,
+                             concurrently=concurrently)
 
     return RelationalTable
 
 
+def _renameShadowObjects(cursor, shadowName, tableName):
+    """Renames a shadow table and its indexes, constraints, and sequence.
+
+    Only the objects whose names start with ``shadowName`` are renamed, by
+    replacing that prefix with ``tableName``.
+
+    """
+
+    def newName(name):
+        return tableName + name[len(shadowName):]
+
+    # Primary key constraints are renamed with their index.
+    cursor.execute('SELECT indexname FROM pg_indexes '
+                   'WHERE schemaname = %s AND tablename = %s;',
+                   ('mangasampledb', shadowName))
+    for (indexName, ) in cursor.fetchall():
+        if indexName.startswith(shadowName):
+            cursor.execute('ALTER INDEX mangasampledb.{0} RENAME TO {1};'
+                           .format(indexName, newName(indexName)))
+
+    cursor.execute('SELECT conname FROM pg_constraint '
+                   'WHERE conrelid = %s::regclass AND contype = %s;',
+                   ('mangasampledb.' + shadowName, 'f'))
+    for (constraintName, ) in cursor.fetchall():
+        if constraintName.startswith(shadowName):
+            cursor.execute(
+                'ALTER TABLE mangasampledb.{0} RENAME CONSTRAINT {1} TO {2};'
+                .format(shadowName, constraintName, newName(constraintName)))
+
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s);',
+                   ('mangasampledb.' + shadowName, 'pk'))
+    sequenceName = cursor.fetchone()[0]
+    if sequenceName is not None:
+        sequenceName = sequenceName.split('.')[-1]
+        if sequenceName.startswith(shadowName):
+            cursor.execute('ALTER SEQUENCE mangasampledb.{0} RENAME TO {1};'
+                           .format(sequenceName, newName(sequenceName)))
+
+    cursor.execute('ALTER TABLE mangasampledb.{0} RENAME TO {1};'
+                   .format(shadowName, tableName))
+
+
+def _setCurrentCatalogue(cursor, catname, catPK):
+    """Makes ``catPK`` the current version of a catalogue.
+
+    Uses a DBAPI cursor, so that the change can be part of a larger
+    transaction. Returns the versions that were current before.
+
+    """
+
+    cursor.execute('SELECT cat.version '
+                   'FROM mangasampledb.current_catalogue AS current '
+                   'JOIN mangasampledb.catalogue AS cat '
+                   'ON cat.pk = current.catalogue_pk '
+                   'WHERE cat.catalogue_name = %s AND cat.pk != %s;',
+                   (catname, catPK))
+    removed = [version for (version, ) in cursor.fetchall()]
+
+    cursor.execute('DELETE FROM mangasampledb.current_catalogue AS current '
+                   'USING mangasampledb.catalogue AS cat '
+                   'WHERE cat.pk = current.catalogue_pk '
+                   'AND cat.catalogue_name = %s;', (catname, ))
+    cursor.execute('INSERT INTO mangasampledb.current_catalogue '
+                   '(catalogue_pk) VALUES (%s);', (catPK, ))
+
+    return removed
+
+
+def _reserveCataloguePK(engine):
+    """Returns a new pk for mangasampledb.catalogue without adding the row."""
+
+    return engine.execute(
+        'SELECT nextval(pg_get_serial_sequence(%s, %s));',
+        ('mangasampledb.catalogue', 'pk')).scalar()
+
+
+def _insertCatalogueRecord(cursor, catPK, catname, version, match=None):
+    """Adds a catalogue record with a reserved pk, using a DBAPI cursor."""
+
+    matchDescription = open(match[1], 'r').read() if match else None
+
+    cursor.execute('INSERT INTO mangasampledb.catalogue '
+                   '(pk, catalogue_name, version, match_description, '
+                   'matched) VALUES (%s, %s, %s, %s, %s);',
+                   (catPK, catname, version, matchDescription,
+                    bool(match)))
+
+
+def _touchCurrentCatalogue(cursor, catPK):
+    """Marks the current record of a catalogue as reloaded.
+
+    Rewrites the row of ``catPK`` in mangasampledb.current_catalogue, if
+    any, without changing it. The new row version (``xmin``) is part of the
+    state of `.CatalogueCache`, so caches in all the processes drop entries
+    for a version whose tables have been reloaded.
+
+    """
+
+    cursor.execute('UPDATE mangasampledb.current_catalogue '
+                   'SET catalogue_pk = catalogue_pk '
+                   'WHERE catalogue_pk = %s;', (catPK, ))
+
+
+def _swapShadowTables(engine, catname, shadowName, catPK, relational=False,
+                      makeCurrent=False, record=None):
+    """Replaces a catalogue table and its relational table by their shadows.
+
+    In a single transaction, the shadow tables are made ``LOGGED``, the
+    current tables are dropped, and the shadow tables, with their indexes and
+    constraints, are renamed to the final names. If ``record`` is a tuple
+    ``(version, match)``, the catalogue record, with the reserved pk
+    ``catPK``, is added in the same transaction, so a failed swap does not
+    leave it behind. If ``makeCurrent=True``, ``catPK`` is made the current
+    version of the catalogue in the same transaction; otherwise, its current
+    record is marked as reloaded.
+    If ``relational=True``, the current view of the catalogue, which is
+    dropped with the old tables, is then recreated. Readers see either the
+    old or the new catalogue, and its current version changes with it.
+
+    """
+
+    relationalName = 'manga_target_to_{0}'.format(catname)
+    shadowRelationalName = 'manga_target_to_{0}'.format(shadowName)
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        # The catalogue table must be logged before the relational table,
+        # which references it, can be.
+        cursor.execute('ALTER TABLE mangasampledb.{0} SET LOGGED;'
+                       .format(shadowName))
+        if relational:
+            cursor.execute('ALTER TABLE mangasampledb.{0} SET LOGGED;'
+                           .format(shadowRelationalName))
+
+        cursor.execute('DROP TABLE IF EXISTS mangasampledb.{0}, '
+                       'mangasampledb.{1} CASCADE;'
+                       .format(relationalName, catname))
+
+        _renameShadowObjects(cursor, shadowName, catname)
+        if relational:
+            _renameShadowObjects(cursor, shadowRelationalName,
+                                 relationalName)
+
+        if record is not None:
+            _insertCatalogueRecord(cursor, catPK, catname, *record)
+
+        removed = []
+        if makeCurrent:
+            removed = _setCurrentCatalogue(cursor, catname, catPK)
+        else:
+            _touchCurrentCatalogue(cursor, catPK)
+
+        if relational:
+            columns = getCatalogueColumns(cursor, catname)
+            for statement in currentViewSQL(catname, columns):
+                cursor.execute(statement)
+
+        connection.commit()
+
+    except Exception:
+        connection.rollback()
+        raise
+
+    finally:
+        cursor.close()
+        connection.close()
+
+    print('INFO: swapped {0} into {1}.'.format(shadowName, catname))
+
+    if makeCurrent:
+        for version in removed:
+            warnings.warn('removed {0} {1} as current catalogue'
+                          .format(catname, version), UserWarning)
+        print('INFO: made catalogue_pk={0} the current {1} catalogue.'
+              .format(catPK, catname))
+
+    # The caches must check the current catalogue even if it has not
+    # changed, since its tables have been replaced.
+    invalidateCaches()
+
+
+def _markReloaded(engine, catPK):
+    """Marks a catalogue as reloaded and invalidates the lookup caches."""
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        _touchCurrentCatalogue(cursor, catPK)
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+
+    invalidateCaches()
+
+
+def _reflectModel(engine, tableName):
+    """Returns a model class for an existing table in mangasampledb."""
+
+    metadata = sql.MetaData(schema='mangasampledb')
+    reflectedTable = sql.Table(tableName, metadata, autoload=True,
+                               autoload_with=engine)
+
+    class Model(object):
+        __table__ = reflectedTable
+
+    mapper(Model, reflectedTable)
+
+    return Model
+
+
 def ingestCatalogue(catfile, catname, version, engine, current=True,
                     match=None, step=500, limit=False, overwrite=False,
-                    verbose=False, **kwargs):
+                    stream=False, workers=1, server_join=False,
+                    indexes=None, index_workers=1, concurrently=False,
+                    swap=False, metrics_callback=None, verbose=False,
+                    **kwargs):
     """Runs the catalogue ingestion.
 
     Parameters:
@@ -198,6 +632,9 @@ def ingestCatalogue(catfile, catname, version, engine, current=True,
             matching was done. The matching catalogue must contain only two
             columns, ``mangaid`` and a column present in ``catfile`` that is
             a unique identifier of the targets in the ingested catalogue.
+            The view ``mangasampledb.current_<catname>``, which joins
+            mangasampledb.manga_target to the rows of the current version of
+            the catalogue, is created or refreshed at the end.
         step (int):
             The number of catalogue elements that must be inserted at a time.
         limit (bool):
@@ -206,6 +643,42 @@ def ingestCatalogue(catfile, catname, version, engine, current=True,
         overwrite (bool):
             If ``True``, removes any table that already exists before recreting
             it.
+        stream (bool):
+            If ``True``, the FITS binary table is memory mapped and read in
+            blocks of ``step`` rows while it is being loaded, so that the
+            memory used does not depend on the size of the catalogue.
+        workers (int):
+            The number of parallel processes and connections used to load
+            the catalogue data. See `.table_to_db`.
+        server_join (bool):
+            If ``True``, the match file is copied into a temporary table and
+            the relational table is built with a single ``INSERT ... SELECT``
+            in the server, instead of joining the data in Python.
+        indexes (list or None):
+            The indexes to build on the catalogue table once it has been
+            loaded, as a list of column names or tuples of column names. If
+            ``None``, indexes are created for ``catalogue_pk`` and, if
+            ``match`` is set, for the match column. Use an empty list to
+            skip them. The table is analysed after the indexes are built.
+        index_workers (int):
+            The number of indexes built at the same time.
+        concurrently (bool):
+            If ``True``, the indexes are built with
+            ``CREATE INDEX CONCURRENTLY``.
+        swap (bool):
+            If ``True``, the catalogue and its relational table are loaded
+            into ``UNLOGGED`` shadow tables (``<catname>_shadow``), next to
+            any existing ones, and indexed. Then, in a single transaction,
+            they are made ``LOGGED`` and replace the existing tables. Readers
+            never see a missing or partially loaded catalogue, and a failed
+            load leaves the current tables untouched. If ``current=True``,
+            the new version is made current in that transaction.
+        metrics_callback (callable or None):
+            A function that is called with the duration, rows, bytes, and
+            rows per second of each stage of the ingestion (see
+            `.addMetricsCallback`). The stages are also logged to the
+            ``mangaSampleDB.ingestion`` logger, and a summary is printed at
+            the end.
         verbose (bool):
             Sets the verbosity mode.
 
@@ -251,16 +724,28 @@ def ingestCatalogue(catfile, catname, version, engine, current=True,
     inspector = Inspector.from_engine(engine)
     tables = inspector.get_table_names(schema='mangasampledb')
 
-    if catname in tables:
+    if catname in tables and not overwrite and not swap:
         raise ValueError('table {0} already exists in mangasampledb. '
                          'Drop it before continuing.'.format(catname))
 
+    if swap:
+        # Removes the shadow tables left by a failed load, if any.
+        shadowName = '{0}_shadow'.format(catname)
+        engine.execute('DROP TABLE IF EXISTS mangasampledb.{0}, '
+                       'mangasampledb.manga_target_to_{0} CASCADE;'
+                       .format(shadowName))
+        tableName = shadowName
+    else:
+        tableName = catname
+
     # Checks if the catalogue name and version already exists. If not, adds it.
     with session.begin(subtransactions=True):
         catalogue = session.query(Catalogue.pk).filter(
             Catalogue.catalogue_name == catname,
             Catalogue.version == version).scalar()
 
+    newRecord = catalogue is None
+
     if catalogue is not None:
         catPK = catalogue
         warnings.warn('(CATNAME, VERSION)=({0}, {1}) '
@@ -270,38 +755,89 @@ def ingestCatalogue(catfile, catname, version, engine, current=True,
     else:
         print('INFO: creating record in mangasampledb.catalogue for '
               'CATNAME={0}, VERSION={1}.'.format(catname, version))
-        catPK = _createCatalogueRecord(Base, session, catname, version,
-                                       match=match, current=current)
+        if swap:
+            # The record is only added, and made current, when the tables
+            # of the new version replace the old ones. Readers never see it
+            # empty and a failed load does not leave it behind.
+            catPK = _reserveCataloguePK(engine)
+        else:
+            catPK = _createCatalogueRecord(Base, session, catname, version,
+                                           match=match, current=current)
+
+    metrics = Metrics('ingestCatalogue {0}'.format(catname),
+                      callback=metrics_callback)
 
-    # Reads the catalogue file
-    catData = table.Table.read(catfile, format='fits')
-    catData.add_column(table.Column(data=[catPK] * len(catData),
-                                    name='catalogue_pk', dtype=int))
+    # Reads the catalogue file. If stream=True the file is memory mapped and
+    # only read in blocks of step rows when the data are loaded.
+    with metrics.stage('Table.read', nbytes=os.path.getsize(catfile)) as stage:
+        catData = table.Table.read(catfile, format='fits', memmap=stream)
+        stage['rows'] = len(catData)
+
+    # The catalogue_pk column is generated by the encoder for each chunk.
+    catConstants = [('catalogue_pk', catPK)]
 
     # Reads matching file, if any
     if match:
-        matchCat = table.Table.read(match[0])
+        with metrics.stage('Table.read.match',
+                           nbytes=os.path.getsize(match[0])) as stage:
+            matchCat = table.Table.read(match[0])
+            stage['rows'] = len(matchCat)
         matchCol = [col.upper() for col in matchCat.colnames
                     if col.lower() != 'mangaid'][0]
     else:
         matchCat = None
 
+    if indexes is None:
+        indexes = ['catalogue_pk']
+        if match:
+            indexes.insert(0, matchCol.lower())
+
     if limit:
         validIndx = np.where(np.in1d(catData[matchCol],
                                      matchCat[matchCol.lower()]))[0]
         catData = catData[validIndx]
 
-    NewCatTable = table_to_db(catData, 'manga', 'mangasampledb', 'nsa',
+    NewCatTable = table_to_db(catData, 'manga', 'mangasampledb', tableName,
                               engine=engine, overwrite=overwrite,
-                              chunk_size=step, verbose=verbose)
+                              chunk_size=step, constant_columns=catConstants,
+                              workers=workers, indexes=indexes,
+                              index_workers=index_workers,
+                              concurrently=concurrently, unlogged=swap,
+                              metrics=metrics, verbose=verbose)
 
     # If there is a matching catalogue, we create the table relating
     # the new catalogue with mangasampledb.manga_target.
     if matchCat:
-        RelationalTable = _createRelationalTable(Base, engine, session,
-                                                 metadata, matchCat,
-                                                 NewCatTable,
-                                                 overwrite=overwrite)
+        with metrics.stage('_createRelationalTable', rows=len(matchCat)):
+            RelationalTable = _createRelationalTable(
+                Base, engine, session, metadata, matchCat, NewCatTable,
+                overwrite=overwrite, serverJoin=server_join,
+                indexWorkers=index_workers, concurrently=concurrently,
+                catName=catname,
+                relationalTableName='manga_target_to_{0}'.format(tableName),
+                unlogged=swap)
+
+    if swap:
+        with metrics.stage('_swapShadowTables'):
+            _swapShadowTables(engine, catname, tableName, catPK,
+                              relational=matchCat is not None,
+                              makeCurrent=newRecord and current,
+                              record=(version, match) if newRecord else None)
+        NewCatTable = _reflectModel(engine, catname)
+        if matchCat:
+            RelationalTable = _reflectModel(
+                engine, 'manga_target_to_{0}'.format(catname))
+    else:
+        if matchCat:
+            with metrics.stage('createCurrentView'):
+                createCurrentView(engine, catname)
+        _markReloaded(engine, catPK)
+
+    metrics.finish()
+    print('INFO: ingestion summary for {0}:\n{1}'.format(catname,
+                                                        metrics.report()))
+
+    if matchCat:
         return (NewCatTable, RelationalTable)
 
-    return RelationalTable
+    return NewCatTable
@@ -16,9 +16,14 @@ Revision history:
 from __future__ import division
 from __future__ import print_function
 
+import collections
+import hashlib
+import itertools
 import os
 import warnings
 
+from concurrent.futures import ThreadPoolExecutor
+
 try:
     import progressbar
 except ImportError:
@@ -40,7 +45,190 @@ def _warning(message, category, *args, **kwargs):
 warnings.showwarning = _warning
 
 
-def loadMangaCharacters(characterList, imageDir, engine):
+def _readImage(imagePath):
+    """Returns the contents of an image and their SHA-256 hex digest."""
+
+    with open(imagePath, 'rb') as imageFile:
+        image = imageFile.read()
+
+    return image, hashlib.sha256(image).hexdigest()
+
+
+def _readImagesAhead(imagePaths, nThreads=4, readAhead=64):
+    """Yields ``(image, sha256)`` for each path, in order.
+
+    The images are read by a pool of ``nThreads`` threads, up to
+    ``readAhead`` images ahead of the consumer, so that disk I/O overlaps
+    with whatever the consumer does with the images.
+
+    """
+
+    imagePaths = iter(imagePaths)
+
+    with ThreadPoolExecutor(max_workers=nThreads) as executor:
+
+        pending = collections.deque(
+            executor.submit(_readImage, imagePath)
+            for imagePath in itertools.islice(imagePaths, readAhead))
+
+        while len(pending) > 0:
+            future = pending.popleft()
+            for imagePath in itertools.islice(imagePaths, 1):
+                pending.append(executor.submit(_readImage, imagePath))
+            yield future.result()
+
+
+def _createPictureTable(engine):
+    """Creates the table of deduplicated pictures, if it does not exist."""
+
+    with engine.begin() as connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS mangasampledb.character_picture '
+            '(pk SERIAL PRIMARY KEY NOT NULL, '
+            'sha256 TEXT NOT NULL UNIQUE, picture BYTEA);')
+        connection.execute(
+            'ALTER TABLE mangasampledb.character '
+            'ADD COLUMN IF NOT EXISTS picture_pk INTEGER '
+            'REFERENCES mangasampledb.character_picture(pk) '
+            'ON UPDATE CASCADE ON DELETE SET NULL;')
+
+
+def _loadMangaCharactersBulk(characters, imageDir, engine, Character, Anime,
+                             batchSize=1000, CharacterPicture=None,
+                             nThreads=4):
+    """Loads characters using preloaded lookups and multi-row inserts.
+
+    The existing character names and the anime to pk map are queried once.
+    New anime are created in a single insert and the characters are inserted
+    in batches of ``batchSize`` rows. Each batch is committed on its own, so
+    if the load fails the batches already inserted are kept, and loading the
+    list again only inserts the remaining characters. The images are read
+    ahead by ``nThreads`` threads.
+
+    If ``CharacterPicture`` is not None, each distinct image is stored only
+    once in mangasampledb.character_picture, identified by its SHA-256 hash,
+    and the characters reference it through ``picture_pk``.
+
+    """
+
+    characterTable = Character.__table__
+    animeTable = Anime.__table__
+
+    with engine.connect() as connection:
+
+        if CharacterPicture is not None:
+            pictureTable = CharacterPicture.__table__
+            picturePks = dict(
+                (row[1], row[0]) for row in
+                connection.execute(sql.select([pictureTable.c.pk,
+                                               pictureTable.c.sha256])))
+
+        existingNames = set(
+            row[0] for row in
+            connection.execute(sql.select([characterTable.c.name])))
+
+        animePks = dict(
+            (row[1], row[0]) for row in
+            connection.execute(sql.select([animeTable.c.pk,
+                                           animeTable.c.anime])))
+
+        # Selects the characters to insert. Names that are already in the DB
+        # or that are repeated in the list are skipped.
+        newCharacters = []
+        for character in characters:
+
+            name = character['name'].strip()
+            imagePath = os.path.join(imageDir, character['imageName'])
+            animeName = character['manga']
+
+            if name in existingNames:
+                continue
+
+            if not os.path.exists(imagePath):
+                warnings.warn('image for {0} cannot be found. '
+                              'Skipping character.'.format(name))
+                continue
+
+            existingNames.add(name)
+            newCharacters.append((name, imagePath, animeName))
+
+        newAnime = sorted(set(animeName for __, __, animeName in newCharacters
+                              if animeName not in animePks))
+
+        if len(newAnime) > 0:
+            with connection.begin():
+                result = connection.execute(
+                    animeTable.insert()
+                    .values([{'anime': animeName} for animeName in newAnime])
+                    .returning(animeTable.c.pk, animeTable.c.anime))
+                animePks.update((row[1], row[0]) for row in result)
+
+        starts = range(0, len(newCharacters), batchSize)
+
+        # If the progressbar package is installed, uses it to create a
+        # progress bar
+        if progressbar:
+            bar = progressbar.ProgressBar()
+            iterable = bar(starts)
+        else:
+            iterable = starts
+
+        images = _readImagesAhead(
+            (imagePath for __, imagePath, __ in newCharacters),
+            nThreads=nThreads, readAhead=batchSize)
+
+        nNewPictures = 0
+
+        for start in iterable:
+
+            # Each batch, and its new pictures, is committed separately. If
+            # it fails, the transaction is rolled back when the connection
+            # is closed.
+            transaction = connection.begin()
+
+            batchCharacters = newCharacters[start:start + batchSize]
+            batchImages = list(itertools.islice(images, len(batchCharacters)))
+
+            if CharacterPicture is not None:
+                newPictures = dict((sha256, image)
+                                   for image, sha256 in batchImages
+                                   if sha256 not in picturePks)
+                if len(newPictures) > 0:
+                    result = connection.execute(
+                        pictureTable.insert()
+                        .values([{'sha256': sha256, 'picture': image}
+                                 for sha256, image in newPictures.items()])
+                        .returning(pictureTable.c.pk, pictureTable.c.sha256))
+                    picturePks.update((row[1], row[0]) for row in result)
+                    nNewPictures += len(newPictures)
+
+            batch = []
+            for (name, __, animeName), (image, sha256) in \
+                    zip(batchCharacters, batchImages):
+                row = {'name': name, 'manga_target_pk': None,
+                       'anime_pk': animePks[animeName]}
+                if CharacterPicture is not None:
+                    row.update({'picture': None,
+                                'picture_pk': picturePks[sha256]})
+                else:
+                    row['picture'] = image
+                batch.append(row)
+
+            connection.execute(characterTable.insert().values(batch))
+            transaction.commit()
+
+    print('INFO: inserted {0} characters and {1} anime.'
+          .format(len(newCharacters), len(newAnime)))
+
+    if CharacterPicture is not None:
+        print('INFO: inserted {0} new distinct pictures.'
+              .format(nNewPictures))
+
+    return True
+
+
+def loadMangaCharacters(characterList, imageDir, engine, bulk=False,
+                        batchSize=1000, dedupe=False, nThreads=4):
     """Loads a list of manga characters to mangasampledb.character.
 
     Parameters:
@@ -51,6 +239,21 @@ def loadMangaCharacters(characterList, imageDir, engine):
             The path where the downloaded images can be found.
         engine (SQLAlchemy |engine|):
             The engine to use to connect to the DB.
+        bulk (bool):
+            If ``True``, the existing characters and anime are queried only
+            once and the new rows are inserted in batches, instead of
+            querying the DB for each character.
+        batchSize (int):
+            The number of characters inserted, and committed, at a time if
+            ``bulk=True``.
+        dedupe (bool):
+            If ``True``, identical pictures are stored only once in
+            mangasampledb.character_picture, which is created if it does not
+            exist, and referenced from mangasampledb.character through
+            ``picture_pk``. Requires ``bulk=True``.
+        nThreads (int):
+            The number of threads used to read the images ahead of the
+            inserts.
 
     Return:
         result (bool):
@@ -63,6 +266,12 @@ def loadMangaCharacters(characterList, imageDir, engine):
     assert os.path.exists(characterList), 'file does not exit.'
     assert os.path.exists(imageDir), 'image dir does not exit.'
 
+    if dedupe and not bulk:
+        raise ValueError('dedupe=True requires bulk=True.')
+
+    if dedupe:
+        _createPictureTable(engine)
+
     # Bind the base to the current engine
     metadata = sql.MetaData()
     metadata.reflect(engine, schema='mangasampledb')
@@ -79,6 +288,18 @@ def loadMangaCharacters(characterList, imageDir, engine):
     characters = table.Table.read(characterList, format='ascii.fixed_width')
     nCharacter = len(characters)
 
+    if bulk:
+        CharacterPicture = (Base.classes.character_picture if dedupe
+                            else None)
+        return _loadMangaCharactersBulk(characters, imageDir, engine,
+                                        Character, Anime, batchSize=batchSize,
+                                        CharacterPicture=CharacterPicture,
+                                        nThreads=nThreads)
+
+    images = _readImagesAhead(
+        (os.path.join(imageDir, imageName)
+         for imageName in characters['imageName']), nThreads=nThreads)
+
     # If the progressbar package is installed, uses it to create a progress bar
     if progressbar:
         bar = progressbar.ProgressBar()
@@ -100,7 +321,7 @@ def loadMangaCharacters(characterList, imageDir, engine):
                 warnings.warn('image for {0} cannot be found. '
                               'Skipping character.'.format(name))
 
-            image = open(imagePath, 'rb').read()
+            image, __ = next(images)
 
             nameQuery = session.query(Character).filter(
                 Character.name == name).all()
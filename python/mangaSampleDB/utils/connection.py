@@ -10,21 +10,158 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import URL
 
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:
+    create_async_engine = None
 
-__all__ = ('create_connection')
+
+__all__ = ('create_connection', 'create_async_connection')
+
+
+def _create_url(driver, username, password, host, port, db_name):
+    """Returns the URL for a PostgreSQL database.
+
+    The password is not interpolated into a string, so it can contain any
+    character.
+
+    """
+
+    drivername = 'postgresql+{0}'.format(driver) if driver else 'postgresql'
+    url_parameters = dict(drivername=drivername, username=username or None,
+                          password=password or None, host=host, port=port,
+                          database=db_name)
+
+    if hasattr(URL, 'create'):
+        return URL.create(**url_parameters)
+
+    return URL(**url_parameters)
+
+
+def _pool_parameters(pool_size, max_overflow, pool_recycle, pool_pre_ping,
+                     pool_timeout):
+    """Returns the pool keyword arguments for create_engine."""
+
+    return dict(pool_size=pool_size, max_overflow=max_overflow,
+                pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping,
+                pool_timeout=pool_timeout)
 
 
 def create_connection(db_name='manga', username='', password='',
-                      host='localhost', port=5432):
-    """Creates a connection to the DB and returns the engine."""
+                      host='localhost', port=5432, driver='psycopg2',
+                      pool_size=5, max_overflow=10, pool_recycle=-1,
+                      pool_pre_ping=False, pool_timeout=30,
+                      statement_timeout=None, application_name='mangaSampleDB',
+                      executemany_mode=None, **engine_parameters):
+    """Creates a connection to the DB and returns the engine.
+
+    Parameters:
+        db_name, username, password, host, port:
+            The connection details.
+        driver (str):
+            The DBAPI driver, e.g., ``'psycopg2'`` or ``'pg8000'``. If
+            ``None``, uses the SQLAlchemy default.
+        pool_size, max_overflow, pool_recycle, pool_timeout (int):
+            The size of the connection pool, the number of connections that
+            can be opened above it, the number of seconds after which a
+            connection is replaced (-1 for never), and the number of seconds
+            to wait for a connection. See `sqlalchemy.create_engine`.
+        pool_pre_ping (bool):
+            If ``True``, connections are tested when they are taken from the
+            pool, and replaced if the server has closed them.
+        statement_timeout (int or None):
+            If set, the server cancels statements that run for longer than
+            this number of milliseconds.
+        application_name (str):
+            The name shown for the connections in ``pg_stat_activity``.
+        executemany_mode (str or None):
+            For psycopg2, the ``executemany_mode`` of the dialect (e.g.,
+            ``'values_plus_batch'``), which sends ``executemany`` calls in
+            batches instead of one statement at a time.
+        engine_parameters:
+            Other parameters passed to `sqlalchemy.create_engine`.
+
+    """
+
+    url = _create_url(driver, username, password, host, port, db_name)
+
+    connect_args = engine_parameters.pop('connect_args', {})
+    if application_name is not None:
+        connect_args.setdefault('application_name', application_name)
 
-    connection_parameters = {'username': username, 'password': password,
-                             'host': host, 'port': port, 'db_name': db_name}
+    if executemany_mode is not None:
+        if driver != 'psycopg2':
+            raise ValueError('executemany_mode requires driver=psycopg2.')
+        engine_parameters['executemany_mode'] = executemany_mode
 
-    engine = create_engine(
-        'postgresql://{username:s}:{password:s}@{host:s}:{port:d}/{db_name:s}'
-        .format(**connection_parameters))
+    parameters = _pool_parameters(pool_size, max_overflow, pool_recycle,
+                                  pool_pre_ping, pool_timeout)
+    parameters.update(engine_parameters)
+
+    engine = create_engine(url, connect_args=connect_args, **parameters)
+
+    if statement_timeout is not None:
+
+        # Set on each new DBAPI connection, so it works with any driver.
+        @event.listens_for(engine, 'connect')
+        def set_statement_timeout(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('SET statement_timeout = {0:d};'
+                           .format(int(statement_timeout)))
+            cursor.close()
+            dbapi_connection.commit()
 
     return engine
+
+
+def create_async_connection(db_name='manga', username='', password='',
+                            host='localhost', port=5432, driver='asyncpg',
+                            pool_size=5, max_overflow=10, pool_recycle=-1,
+                            pool_pre_ping=False, pool_timeout=30,
+                            statement_timeout=None,
+                            application_name='mangaSampleDB',
+                            **engine_parameters):
+    """Creates an asyncio engine for the DB.
+
+    Returns a SQLAlchemy ``AsyncEngine`` that can be used with ``await``
+    without blocking the event loop. Requires SQLAlchemy 1.4 or newer and
+    an asyncio driver (by default, asyncpg). The parameters are the same as
+    for `.create_connection`.
+
+    Example:
+        Querying the targets from a coroutine
+          >>> engine = create_async_connection(username='manga')
+          >>> async with engine.connect() as connection:
+          ...     result = await connection.execute(
+          ...         sqlalchemy.text('SELECT count(*) FROM '
+          ...                         'mangasampledb.manga_target'))
+          ...     print(result.scalar())
+
+    """
+
+    if create_async_engine is None:
+        raise ImportError('create_async_connection requires SQLAlchemy>=1.4.')
+
+    url = _create_url(driver, username, password, host, port, db_name)
+
+    connect_args = engine_parameters.pop('connect_args', {})
+
+    if driver == 'asyncpg':
+        # asyncpg takes the runtime parameters as server_settings.
+        server_settings = connect_args.setdefault('server_settings', {})
+        if application_name is not None:
+            server_settings.setdefault('application_name', application_name)
+        if statement_timeout is not None:
+            server_settings.setdefault('statement_timeout',
+                                       str(int(statement_timeout)))
+    elif statement_timeout is not None:
+        raise ValueError('statement_timeout requires driver=asyncpg.')
+
+    parameters = _pool_parameters(pool_size, max_overflow, pool_recycle,
+                                  pool_pre_ping, pool_timeout)
+    parameters.update(engine_parameters)
+
+    return create_async_engine(url, connect_args=connect_args, **parameters)
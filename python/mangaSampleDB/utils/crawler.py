@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+crawler.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Asynchronous crawler that grabs the character names and pictures from
+http://www.anime-planet.com to build the list of characters that can be
+assigned to MaNGA targets.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import json
+import os
+import re
+import sys
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+from astropy import table
+
+
+__all__ = ('crawlCharacters', 'parseCharacterPage')
+
+
+defaultBaseUrl = 'http://www.anime-planet.com'
+
+defaultExclude = ['hitler', 'lenin', 'stalin']
+
+columnNames = ['ID', 'identifier', 'name', 'manga', 'imageName', 'url', 'page']
+columnTypes = [int, 'S50', 'S100', 'S100', 'S100', 'S500', int]
+
+
+def _cleanTitle(td):
+    """Returns the anime or manga title in a table cell, or None."""
+
+    link = td.find('a')
+    if not link:
+        return None
+
+    title = link.get_text()
+
+    return re.sub(r'\W\([0-9]+\)', '', title[title.find('>') + 1:])
+
+
+def parseCharacterPage(html, baseUrl=defaultBaseUrl, exclude=defaultExclude):
+    """Returns the valid characters in a page of the character list.
+
+    Only the checks that depend on the character itself are applied here.
+    Whether the name or the identifier are already in the database is checked
+    by `crawlCharacters`.
+
+    Parameters:
+        html (str):
+            The HTML of a page of ``<baseUrl>/characters/all``.
+        baseUrl (str):
+            The base URL used to build the image and character URLs.
+        exclude (list):
+            Characters whose name contains any of these strings (case
+            insensitive) are skipped.
+
+    Returns:
+        result (list):
+            A list of dictionaries with keys ``identifier``, ``name``,
+            ``manga``, ``imageUrl``, ``imageName``, and ``url``, in the order
+            in which the characters appear in the page.
+
+    """
+
+    if BeautifulSoup is None:
+        raise ImportError('parsing the character list requires bs4.')
+
+    bs = BeautifulSoup(html, 'html.parser')
+    rows = bs.find('table').find('tbody').find_all('tr')
+
+    characters = []
+
+    for row in rows:
+
+        tds = row.find_all('td')
+
+        try:
+            imageSrc = tds[0].find('img').get('src')
+            imageUrl = baseUrl + '/' + imageSrc.lstrip('/')
+            characterUrl = tds[0].find('a').get('href')
+            name = tds[1].find('a').get_text()
+            url = baseUrl + tds[1].find('a').get('href')
+
+            anime = _cleanTitle(tds[2])
+            manga = _cleanTitle(tds[3])
+        except (AttributeError, IndexError, TypeError):
+            continue
+
+        if not anime and not manga:
+            continue
+
+        if anime and not manga:
+            manga = anime
+
+        if re.match(r'^[\w|\s]+$', manga) is None:
+            continue
+
+        if name[0] in '0123456789':
+            continue
+        elif len(name) < 3:
+            continue
+        elif re.match(r'^[\w|\s]+$', name) is None:
+            continue
+
+        if any(ex in name.lower() for ex in exclude):
+            continue
+
+        imageName = os.path.basename(imageUrl)
+        if 'blank_main.jpg' in imageName:
+            continue
+        if len(imageName) > 100 or len(name) > 100:
+            continue
+
+        if not all(ord(cc) < 128 for cc in name):
+            continue
+
+        identifier = characterUrl.split('/')[-1]
+
+        characters.append({'identifier': identifier, 'name': name,
+                           'manga': manga, 'imageUrl': imageUrl,
+                           'imageName': imageName, 'url': url})
+
+    return characters
+
+
+class _CharacterIndex(object):
+    """In-memory rows of the character database and their lookup indexes."""
+
+    def __init__(self):
+
+        self.rows = []
+        self.lowNames = set()
+        self.identifiers = set()
+        self.pages = set()
+        self.maxID = 0
+
+    def add(self, row):
+        """Adds a row, as a list in the order of ``columnNames``."""
+
+        ID, identifier, name = row[0:3]
+
+        self.rows.append(list(row))
+        self.lowNames.add(name.lower())
+        self.identifiers.add(identifier)
+        self.maxID = max(self.maxID, ID)
+
+    def select(self, characters):
+        """Returns the characters in a page that are not in the index.
+
+        Only the first character with each name or identifier is returned.
+        The characters are not added to the index, which `accept` does once
+        their images have been downloaded.
+
+        """
+
+        selected = []
+        lowNames = set()
+        identifiers = set()
+
+        for character in characters:
+            lowName = character['name'].lower()
+            if lowName in self.lowNames or lowName in lowNames:
+                continue
+            elif character['identifier'] in self.identifiers or \
+                    character['identifier'] in identifiers:
+                continue
+            lowNames.add(lowName)
+            identifiers.add(character['identifier'])
+            selected.append(character)
+
+        return selected
+
+    def accept(self, character, page):
+        """Returns a new row for a parsed character or None if it exists."""
+
+        if character['name'].lower() in self.lowNames:
+            return None
+        elif character['identifier'] in self.identifiers:
+            return None
+
+        row = [self.maxID + 1, character['identifier'], character['name'],
+               character['manga'], character['imageName'], character['url'],
+               page]
+        self.add(row)
+
+        return row
+
+    def loadDatabase(self, databaseName):
+        """Adds the rows in a fixed-width database file."""
+
+        database = table.Table.read(databaseName, format='ascii.fixed_width',
+                                    delimiter='|')
+
+        columns = [database[col].tolist() for col in columnNames]
+        for row in zip(*columns):
+            self.add(row)
+            self.pages.add(row[-1])
+
+    def loadCheckpoint(self, checkpoint):
+        """Adds the rows of the completed pages in a checkpoint log."""
+
+        with open(checkpoint, 'r') as log:
+            for line in log:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # An incomplete line left by an interrupted run.
+                    continue
+                if entry['page'] in self.pages:
+                    continue
+                for row in entry['rows']:
+                    self.add(row)
+                self.pages.add(entry['page'])
+
+    def write(self, databaseName):
+        """Writes the rows of the completed pages to a fixed-width file."""
+
+        rows = sorted([row for row in self.rows if row[-1] in self.pages],
+                      key=lambda row: row[0])
+        database = table.Table(rows=rows if rows else None,
+                               names=columnNames, dtype=columnTypes)
+        database.write(databaseName, format='ascii.fixed_width',
+                       delimiter='|', overwrite=True)
+
+
+async def _fetch(session, url, retries=3, retryDelay=1.):
+    """Returns the response body of a URL, retrying on errors.
+
+    The delay before each retry is doubled, starting at ``retryDelay``
+    seconds.
+
+    """
+
+    for attempt in range(retries):
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == retries - 1:
+                raise
+            await asyncio.sleep(retryDelay * 2 ** attempt)
+
+
+async def _downloadImage(session, semaphore, imageUrl, path, retries=3,
+                         retryDelay=1.):
+    """Downloads an image. Returns False if it could not be downloaded."""
+
+    try:
+        async with semaphore:
+            data = await _fetch(session, imageUrl, retries=retries,
+                                retryDelay=retryDelay)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as ee:
+        print('WARNING: failed to download {0}: {1}'.format(imageUrl, ee),
+              file=sys.stderr)
+        return False
+
+    with open(path, 'wb') as handler:
+        handler.write(data)
+
+    return True
+
+
+async def crawlCharacters(databaseName='characterDatabase.dat',
+                          imagesDir='./images', checkpoint=None,
+                          baseUrl=defaultBaseUrl, nPages=5905,
+                          concurrency=8, exclude=defaultExclude,
+                          retries=3, retryDelay=1., verbose=True):
+    """Crawls the character list and writes the database of characters.
+
+    Pages are fetched by a pool of ``concurrency`` workers but processed in
+    page order, so the result is the same as crawling the pages one by one.
+    The images of the new characters in a page are downloaded concurrently,
+    and the characters whose image cannot be downloaded are skipped without
+    using an ID. The rows of the page are then appended to a checkpoint log.
+    When the crawler is restarted, the pages in the log (and in an existing
+    ``databaseName``) are not fetched again, while pages that could not be
+    fetched are.
+
+    Parameters:
+        databaseName (str):
+            The fixed-width file in which the character database is written
+            at the end of the crawl.
+        imagesDir (str):
+            The directory where the images are saved.
+        checkpoint (str):
+            The append-only checkpoint log. Defaults to ``databaseName``
+            with the extension ``.log``.
+        baseUrl (str):
+            The base URL of the site. Can point to a local server for testing.
+        nPages (int):
+            The number of pages in the character list.
+        concurrency (int):
+            The maximum number of concurrent requests.
+        exclude (list):
+            Characters whose name contains any of these strings are skipped.
+        retries (int):
+            The number of times each page or image is requested before
+            giving up.
+        retryDelay (float):
+            The number of seconds before the first retry. The delay is
+            doubled for each subsequent retry.
+        verbose (bool):
+            If ``True``, prints the pages processed.
+
+    Returns:
+        result (int):
+            The number of characters in the database.
+
+    """
+
+    if aiohttp is None:
+        raise ImportError('crawling the character list requires aiohttp.')
+
+    checkpoint = checkpoint or os.path.splitext(databaseName)[0] + '.log'
+
+    if not os.path.exists(imagesDir):
+        os.makedirs(imagesDir)
+
+    index = _CharacterIndex()
+
+    if os.path.exists(databaseName):
+        index.loadDatabase(databaseName)
+
+    if os.path.exists(checkpoint):
+        index.loadCheckpoint(checkpoint)
+
+    pagesToFetch = [page for page in range(1, nPages + 1)
+                    if page not in index.pages]
+
+    queue = asyncio.Queue()
+    for page in pagesToFetch:
+        queue.put_nowait(page)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    parsed = {}
+    pageReady = asyncio.Condition()
+
+    async def worker(session):
+        while True:
+            try:
+                page = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                async with semaphore:
+                    html = await _fetch(
+                        session,
+                        '{0}/characters/all?page={1}'.format(baseUrl, page),
+                        retries=retries, retryDelay=retryDelay)
+                characters = parseCharacterPage(html, baseUrl=baseUrl,
+                                                exclude=exclude)
+            except Exception as ee:
+                print('WARNING: failed to fetch page {0}: {1}'
+                      .format(page, ee), file=sys.stderr)
+                characters = None
+            async with pageReady:
+                parsed[page] = characters
+                pageReady.notify_all()
+
+    async with aiohttp.ClientSession() as session:
+
+        workers = [asyncio.ensure_future(worker(session))
+                   for __ in range(concurrency)]
+
+        try:
+            for page in pagesToFetch:
+
+                async with pageReady:
+                    await pageReady.wait_for(lambda: page in parsed)
+                    characters = parsed.pop(page)
+
+                # Failed pages are not logged, so they are retried on the
+                # next run.
+                if characters is None:
+                    continue
+
+                # IDs are only assigned to the characters whose image has
+                # been downloaded.
+                newCharacters = index.select(characters)
+                downloaded = await asyncio.gather(*[
+                    _downloadImage(session, semaphore, character['imageUrl'],
+                                   os.path.join(imagesDir,
+                                                character['imageName']),
+                                   retries=retries, retryDelay=retryDelay)
+                    for character in newCharacters])
+
+                rows = [index.accept(character, page)
+                        for character, success in zip(newCharacters,
+                                                      downloaded)
+                        if success]
+
+                with open(checkpoint, 'a') as log:
+                    log.write(json.dumps({'page': page, 'rows': rows}) + '\n')
+                    log.flush()
+                index.pages.add(page)
+
+                if verbose:
+                    sys.stdout.write('\rPage {0}'.format(page))
+                    sys.stdout.flush()
+
+        finally:
+            for task in workers:
+                task.cancel()
+            index.write(databaseName)
+
+    if verbose:
+        print()
+
+    return len(index.rows)
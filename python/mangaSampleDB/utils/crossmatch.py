@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+crossmatch.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Builds match files between MaNGA targets and a catalogue by cross-matching
+their coordinates. The output can be loaded with
+``ingestCatalogue(match=...)``.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+import warnings
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from astropy import table
+from astropy.io import fits
+
+
+def _warning(message, category, *args, **kwargs):
+    print('{0}: {1}'.format(category.__name__, message))
+
+
+warnings.showwarning = _warning
+
+__all__ = ('crossMatch', 'createMatchFile', 'readColumn')
+
+
+match_description = """
+Each MaNGA target was matched to the nearest object in {catalogue} within a
+radius of {radius} arcsec, using the {raCol}/{decCol} columns of the targets
+file and the {catRaCol}/{catDecCol} columns of the catalogue. The match was
+done with a KD-tree of the unit vectors of the targets, against which the
+catalogue was queried in chunks of {chunkSize} rows. The unique target in the
+catalogue is defined by its {idCol}.
+
+{nMatched} of {nTargets} targets were matched. The median separation was
+{median:.3f} arcsec and the maximum {maximum:.3f} arcsec.
+"""
+
+
+def _unitVectors(ra, dec):
+    """Returns the unit vectors for RA/Dec coordinates in degrees."""
+
+    ra = np.radians(np.asarray(ra, dtype=np.float64))
+    dec = np.radians(np.asarray(dec, dtype=np.float64))
+
+    cosDec = np.cos(dec)
+
+    return np.column_stack((cosDec * np.cos(ra), cosDec * np.sin(ra),
+                            np.sin(dec)))
+
+
+def _chordToArcsec(chord):
+    """Converts a chord length on the unit sphere to an angle in arcsec."""
+
+    return np.degrees(2 * np.arcsin(np.clip(chord / 2., 0, 1))) * 3600.
+
+
+def _arcsecToChord(radius):
+    """Converts an angle in arcsec to a chord length on the unit sphere."""
+
+    return 2 * np.sin(np.radians(radius / 3600.) / 2.)
+
+
+def crossMatch(ra, dec, catalogueRA, catalogueDec, radius=1.,
+               chunkSize=500000):
+    """Finds the nearest catalogue object within a radius for each target.
+
+    A KD-tree is built on the unit vectors of the targets. The catalogue is
+    processed in chunks of ``chunkSize`` rows, so the catalogue columns can
+    be memory mapped and the memory used does not grow with its size. For
+    each chunk, all the target-object pairs closer than ``radius`` are
+    found, and the nearest object of each target is kept.
+
+    Parameters:
+        ra, dec (array):
+            The coordinates of the targets, in degrees.
+        catalogueRA, catalogueDec (array):
+            The coordinates of the catalogue objects, in degrees.
+        radius (float):
+            The match radius, in arcsec.
+        chunkSize (int):
+            The number of catalogue rows processed at a time.
+
+    Returns:
+        result (tuple):
+            A tuple with two arrays of the same length as ``ra``. The first
+            one contains the index of the matched catalogue object, or -1 if
+            there is no object within ``radius``. The second one contains the
+            separation in arcsec (``inf`` if not matched). Ties are resolved
+            in favour of the first object in the catalogue.
+
+    """
+
+    if cKDTree is None:
+        raise ImportError('cross-matching requires scipy.')
+
+    nTargets = len(ra)
+    maxChord = _arcsecToChord(radius)
+
+    bestChord = np.full(nTargets, np.inf)
+    bestIndex = np.full(nTargets, -1, dtype=np.int64)
+
+    if nTargets == 0:
+        return bestIndex, bestChord
+
+    targetTree = cKDTree(_unitVectors(ra, dec))
+
+    for start in range(0, len(catalogueRA), chunkSize):
+
+        stop = start + chunkSize
+        chunkTree = cKDTree(_unitVectors(catalogueRA[start:stop],
+                                         catalogueDec[start:stop]))
+
+        pairs = targetTree.sparse_distance_matrix(chunkTree, maxChord,
+                                                  output_type='ndarray')
+        if len(pairs) == 0:
+            continue
+
+        # Keeps the nearest (and then first) object of each target.
+        pairs = pairs[np.lexsort((pairs['j'], pairs['v'], pairs['i']))]
+        pairs = pairs[np.unique(pairs['i'], return_index=True)[1]]
+
+        better = pairs['v'] < bestChord[pairs['i']]
+        targets = pairs['i'][better]
+        bestChord[targets] = pairs['v'][better]
+        bestIndex[targets] = pairs['j'][better] + start
+
+    # The conversion clips the chord, so unmatched targets are set apart.
+    separation = _chordToArcsec(bestChord)
+    separation[bestIndex < 0] = np.inf
+
+    return bestIndex, separation
+
+
+def readColumn(path, column):
+    """Reads a single column from the first extension of a FITS file.
+
+    The file is memory mapped, so only the requested column is read. String
+    columns are returned stripped and as unicode.
+
+    """
+
+    with fits.open(str(path), memmap=True) as hdulist:
+        data = np.array(hdulist[1].data[column])
+
+    if data.dtype.kind == 'S':
+        data = np.char.strip(np.char.decode(data, 'ascii'))
+    elif data.dtype.kind == 'U':
+        data = np.char.strip(data)
+
+    return data
+
+
+def createMatchFile(targetsFile, catalogueFile, idCol, output=None,
+                    radius=1., mangaidCol='MANGAID', raCol='RA', decCol='DEC',
+                    catalogueRaCol='RA', catalogueDecCol='DEC',
+                    chunkSize=500000, overwrite=False):
+    """Creates a match file by cross-matching targets and a catalogue.
+
+    Produces the same pair of files that ``ingestCatalogue(match=...)``
+    takes: a FITS file with the columns ``mangaid`` and ``idCol``, and a
+    plain text file describing how the match was done. Only the targets with
+    a catalogue object within ``radius`` are included.
+
+    Parameters:
+        targetsFile (str):
+            The path to a FITS file with the mangaids and coordinates of the
+            targets (e.g., MaNGA_targets_extNSA).
+        catalogueFile (str):
+            The path to the FITS catalogue to match. The coordinate columns
+            are memory mapped and read in chunks.
+        idCol (str):
+            The column in the catalogue that uniquely identifies an object.
+        output (str or None):
+            The path of the output FITS file. The description is written to
+            the same path with extension ``.txt``. Defaults to
+            ``<catalogue>_matched.fits`` in the current directory.
+        radius (float):
+            The match radius, in arcsec.
+        mangaidCol, raCol, decCol (str):
+            The names of the mangaid and coordinate columns in
+            ``targetsFile``.
+        catalogueRaCol, catalogueDecCol (str):
+            The names of the coordinate columns in ``catalogueFile``.
+        chunkSize (int):
+            The number of catalogue rows processed at a time.
+        overwrite (bool):
+            If ``True``, overwrites the output files if they exist.
+
+    Returns:
+        result (tuple):
+            The paths of the match and description files.
+
+    """
+
+    assert os.path.exists(targetsFile), 'targets file cannot be found.'
+    assert os.path.exists(catalogueFile), 'catalogue cannot be found.'
+
+    if output is None:
+        catalogueName = os.path.splitext(os.path.basename(catalogueFile))[0]
+        output = catalogueName + '_matched.fits'
+    description = os.path.splitext(output)[0] + '.txt'
+
+    for path in [output, description]:
+        if os.path.exists(path) and not overwrite:
+            raise ValueError('{0} already exists.'.format(path))
+
+    mangaids = readColumn(targetsFile, mangaidCol)
+    ra = readColumn(targetsFile, raCol)
+    dec = readColumn(targetsFile, decCol)
+
+    with fits.open(catalogueFile, memmap=True) as hdulist:
+
+        catalogue = hdulist[1].data
+
+        indices, separation = crossMatch(
+            ra, dec, catalogue[catalogueRaCol], catalogue[catalogueDecCol],
+            radius=radius, chunkSize=chunkSize)
+
+        matched = indices >= 0
+        objectIDs = np.array(catalogue[idCol][indices[matched]])
+
+    nMatched = int(np.sum(matched))
+    if nMatched == 0:
+        warnings.warn('no targets were matched.', UserWarning)
+
+    matchTable = table.Table([mangaids[matched].astype('S50'), objectIDs],
+                             names=['mangaid', idCol.lower()])
+    matchTable.write(output, format='fits', overwrite=overwrite)
+
+    with open(description, 'w') as unit:
+        title = '{0} to mangaid matching file'.format(
+            os.path.basename(catalogueFile))
+        unit.write(title + '\n')
+        unit.write('-' * len(title) + '\n\n')
+        unit.write('Input catalogues\n')
+        unit.write('----------------\n')
+        unit.write('{0}\n{1}\n\n\n'.format(os.path.basename(catalogueFile),
+                                           os.path.basename(targetsFile)))
+        unit.write('Description\n')
+        unit.write('------------')
+        unit.write(match_description.format(
+            catalogue=os.path.basename(catalogueFile), radius=radius,
+            raCol=raCol, decCol=decCol, catRaCol=catalogueRaCol,
+            catDecCol=catalogueDecCol, chunkSize=chunkSize, idCol=idCol,
+            nMatched=nMatched, nTargets=len(mangaids),
+            median=np.median(separation[matched]) if nMatched else np.nan,
+            maximum=np.max(separation[matched]) if nMatched else np.nan))
+        unit.write('\n\n')
+
+    print('INFO: matched {0} of {1} targets.'.format(nMatched, len(mangaids)))
+
+    return output, description
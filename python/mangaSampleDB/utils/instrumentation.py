@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+instrumentation.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Collects the duration, number of rows, and bytes sent of each stage of a
+load, and sends them to the ``mangaSampleDB.ingestion`` logger and to
+metrics callbacks.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import contextlib
+import logging
+import time
+
+
+__all__ = ('Metrics', 'addMetricsCallback', 'removeMetricsCallback',
+           'measure')
+
+
+logger = logging.getLogger('mangaSampleDB.ingestion')
+
+# Callbacks that receive the events of all the loads.
+_callbacks = []
+
+
+def addMetricsCallback(callback):
+    """Adds a function that is called with every metrics event.
+
+    The function receives a dictionary with the keys ``load`` (the name of
+    the load), ``event`` (``'stage'`` or ``'summary'``), and, for stage
+    events, ``stage``, ``duration`` (in seconds), ``rows``, ``bytes``, and
+    ``rows_per_second``. Some stages add other keys (e.g., the chunks of
+    ``load_data`` add ``encode_time``, ``copy_time``, and ``commit_time``).
+    Summary events have a ``stages`` key with the output of
+    `.Metrics.summary`.
+
+    """
+
+    if callback not in _callbacks:
+        _callbacks.append(callback)
+
+
+def removeMetricsCallback(callback):
+    """Removes a function added with `.addMetricsCallback`."""
+
+    if callback in _callbacks:
+        _callbacks.remove(callback)
+
+
+def _rate(rows, duration):
+    if rows is None or not duration:
+        return None
+    return rows / duration
+
+
+class Metrics(object):
+    """Collects the metrics of the stages of a load.
+
+    Each stage can be recorded several times (e.g., one for each chunk of
+    data). The summary adds their durations, rows, and bytes.
+
+    Parameters:
+        name (str):
+            The name of the load, added to all the events.
+        callback (callable or None):
+            A function called with each event, in addition to the ones added
+            with `.addMetricsCallback`.
+
+    Example:
+        Timing a stage
+          >>> metrics = Metrics('nsa')
+          >>> with metrics.stage('Table.read') as record:
+          ...     data = table.Table.read(path)
+          ...     record['rows'] = len(data)
+          >>> print(metrics.report())
+
+    """
+
+    def __init__(self, name, callback=None):
+
+        self.name = name
+        self.callback = callback
+
+        self.stages = collections.OrderedDict()
+        self.startTime = time.time()
+
+    def _emit(self, event, level=logging.INFO):
+
+        event = dict(event, load=self.name)
+
+        if event['event'] == 'stage' and logger.isEnabledFor(level):
+            logger.log(level,
+                       '%s: %s took %.3f s (rows=%s, bytes=%s, rows/s=%s)',
+                       self.name, event['stage'], event['duration'],
+                       event['rows'], event['bytes'],
+                       'n/a' if event['rows_per_second'] is None else
+                       '{0:.1f}'.format(event['rows_per_second']),
+                       extra={'metrics': event})
+        elif event['event'] == 'summary':
+            logger.log(level, '%s: summary\n%s', self.name, self.report(),
+                       extra={'metrics': event})
+
+        for callback in _callbacks + ([self.callback] if self.callback
+                                      else []):
+            callback(event)
+
+    def record(self, stage, duration, rows=None, nbytes=None,
+               level=logging.INFO, **extra):
+        """Records a stage that took ``duration`` seconds.
+
+        Events for stages that are recorded many times, like chunks, can be
+        sent with ``level=logging.DEBUG``.
+
+        """
+
+        summary = self.stages.setdefault(
+            stage, {'calls': 0, 'duration': 0., 'rows': None, 'bytes': None})
+        summary['calls'] += 1
+        summary['duration'] += duration
+        if rows is not None:
+            summary['rows'] = (summary['rows'] or 0) + rows
+        if nbytes is not None:
+            summary['bytes'] = (summary['bytes'] or 0) + nbytes
+
+        event = dict(extra, event='stage', stage=stage, duration=duration,
+                     rows=rows, bytes=nbytes,
+                     rows_per_second=_rate(rows, duration))
+        self._emit(event, level=level)
+
+    @contextlib.contextmanager
+    def stage(self, stage, rows=None, nbytes=None, level=logging.INFO):
+        """Times the code in a ``with`` block as a stage.
+
+        Yields a dictionary in which the keys ``rows`` and ``bytes`` can be
+        set inside the block. The stage is recorded even if the block raises
+        an exception.
+
+        """
+
+        record = {'rows': rows, 'bytes': nbytes}
+        t0 = time.time()
+
+        try:
+            yield record
+        finally:
+            extra = dict((key, value) for key, value in record.items()
+                         if key not in ('rows', 'bytes'))
+            self.record(stage, time.time() - t0, rows=record['rows'],
+                        nbytes=record['bytes'], level=level, **extra)
+
+    def summary(self):
+        """Returns the total duration, rows, bytes, and rows/s per stage."""
+
+        summary = collections.OrderedDict()
+        for stage, values in self.stages.items():
+            summary[stage] = dict(values, rows_per_second=_rate(
+                values['rows'], values['duration']))
+
+        return summary
+
+    def report(self):
+        """Returns the summary as a human readable table."""
+
+        lines = ['{0:<32s} {1:>6s} {2:>10s} {3:>10s} {4:>12s} {5:>12s}'
+                 .format('stage', 'calls', 'time (s)', 'rows', 'MB',
+                         'rows/s')]
+
+        for stage, values in self.summary().items():
+            lines.append(
+                '{0:<32s} {1:>6d} {2:>10.3f} {3:>10s} {4:>12s} {5:>12s}'
+                .format(stage, values['calls'], values['duration'],
+                        '-' if values['rows'] is None
+                        else str(values['rows']),
+                        '-' if values['bytes'] is None
+                        else '{0:.2f}'.format(values['bytes'] / 1024. ** 2),
+                        '-' if values['rows_per_second'] is None
+                        else '{0:.1f}'.format(values['rows_per_second'])))
+
+        lines.append('{0:<32s} {1:>6s} {2:>10.3f}'.format(
+            'total', '', time.time() - self.startTime))
+
+        return '\n'.join(lines)
+
+    def finish(self):
+        """Sends the summary event and returns the summary."""
+
+        summary = self.summary()
+        self._emit({'event': 'summary', 'stages': summary,
+                    'duration': time.time() - self.startTime})
+
+        return summary
+
+
+@contextlib.contextmanager
+def _noStage(rows=None, nbytes=None):
+    yield {'rows': rows, 'bytes': nbytes}
+
+
+def measure(metrics, stage, rows=None, nbytes=None, level=logging.INFO):
+    """Returns `.Metrics.stage` for a stage, or a no-op if ``metrics=None``.
+
+    Allows functions that take an optional ``metrics`` argument to time
+    their stages with a single ``with`` statement.
+
+    """
+
+    if metrics is None:
+        return _noStage(rows=rows, nbytes=nbytes)
+
+    return metrics.stage(stage, rows=rows, nbytes=nbytes, level=level)
@@ -15,8 +15,19 @@ try:
 except ImportError:
     from io import StringIO
 
+import io
+import logging
+import multiprocessing
+import os
+import re
+import socket
+import struct
+import time
+import uuid
 import warnings
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 try:
     import progressbar
 except ImportError:
@@ -28,6 +39,7 @@ from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import mapper, configure_mappers
 
 from .connection import create_connection
+from .instrumentation import measure
 
 import numpy as np
 
@@ -42,6 +54,9 @@ __all__ = ('table_to_db')
 
 _verbose = False
 
+_PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_PGCOPY_TRAILER = struct.pack('>h', -1)
+
 
 def print_verbose(text, level='INFO'):
     """Prints a log message if verbose is True."""
@@ -59,7 +74,7 @@ def getPSQLtype(numpyType, colShape):
         sqlType = sql.Integer
     elif numpyType in [np.float32, np.float64]:
         sqlType = sql.Float
-    elif numpyType in [np.string_, np.str_]:
+    elif numpyType in [np.bytes_, np.str_]:
         sqlType = sql.String
     else:
         raise RuntimeError('the data type {0} cannot be converted to '
@@ -79,7 +94,10 @@ def getPSQLtype(numpyType, colShape):
 
 def table_to_db(table, db_name, schema, table_name, engine=None,
                 connection_parameters=None, overwrite=False,
-                chunk_size=20000, verbose=False):
+                chunk_size=20000, format='text', constant_columns=None,
+                workers=1, indexes=None, index_workers=1,
+                concurrently=False, analyze=True, unlogged=False,
+                metrics=None, verbose=False):
     """Loads an Astropy table as a new table in a DB.
 
     Uses the COPY command in SQL to load an Astropy table efficiently into
@@ -99,13 +117,53 @@ def table_to_db(table, db_name, schema, table_name, engine=None,
             the default connection details, or alternatively
             ``connection_parameters``, will be used to create a new engine.
         connection_parameters (dict):
-            A dictionary with the parameters to connect to the db. For example,
-            ``database_parameters={'username': 'my_user',
+            A dictionary with the parameters to connect to the db, which are
+            passed to `.create_connection`. For example,
+            ``connection_parameters={'username': 'my_user',
             'password': 'my_pass', 'host': 'localhost', 'port': 5432}``.
         overwrite (bool):
             If the table already exists, drops it before recreating it.
         chunk_size (int):
             The frequency, in number of rows, for committing to the DB.
+        format (str):
+            The COPY format used to send the data, either ``'text'`` or
+            ``'binary'``. The binary format is built directly from the
+            Numpy buffers of the columns and avoids formatting and parsing
+            floats as decimal strings. Float32 values are stored with their
+            exact value in ``double precision`` columns, while the text
+            format rounds them to the shortest float32 representation.
+        constant_columns (list):
+            A list of ``(name, value)`` tuples. Each one is added as a column,
+            after the columns in ``table``, that has the same value for all
+            the rows. The values are generated while encoding each chunk so
+            the column is never materialised in memory.
+        workers (int):
+            The number of processes, each one with its own connection, used
+            to load the data. If larger than one, the data are loaded with
+            `load_data_parallel` and committed as a unit using two-phase
+            commit, which requires the ``max_prepared_transactions`` server
+            parameter to be at least ``workers`` (it is zero by default).
+            Otherwise, the data are loaded with a single connection.
+        indexes (list):
+            The indexes to create once all the data have been loaded. Each
+            element can be a column name or a tuple of column names for a
+            multicolumn index. See `create_indexes`.
+        index_workers (int):
+            The number of indexes built at the same time.
+        concurrently (bool):
+            If ``True``, the indexes are built with
+            ``CREATE INDEX CONCURRENTLY``.
+        analyze (bool):
+            If ``True``, runs ``ANALYZE`` on the new table after building the
+            indexes.
+        unlogged (bool):
+            If ``True``, the table is created as ``UNLOGGED``, which skips
+            writing the data to the WAL. The table can be made permanent
+            afterwards with ``ALTER TABLE ... SET LOGGED``.
+        metrics (`.Metrics` or None):
+            If set, the duration, rows, and bytes sent of each stage
+            (``create_new_table``, ``load_data`` and its chunks,
+            ``create_indexes``, and ``analyze_table``) are recorded in it.
         verbose (bool):
             Controls the level of verbosity.
 
@@ -131,7 +189,12 @@ def table_to_db(table, db_name, schema, table_name, engine=None,
     # Creates the connection to the DB.
     print_verbose('Creating connection to DB.')
     engine = engine or create_connection(
-        db_name, connection_parameters=connection_parameters)
+        db_name, **(connection_parameters or {}))
+
+    # Prepared transactions left by a failed parallel load would keep the
+    # table locked.
+    if workers > 1:
+        recover_prepared_transactions(engine, table_name=table_name)
 
     # Checks whether the table exists
     print_verbose('Checking if table {0} exists.'.format(table_name))
@@ -141,11 +204,37 @@ def table_to_db(table, db_name, schema, table_name, engine=None,
 
     # Creates the new table
     print_verbose('Creating table {0}.'.format(table_name))
-    NewTable = create_new_table(schema, table_name, table, engine)
+    with measure(metrics, 'create_new_table'):
+        NewTable = create_new_table(schema, table_name, table, engine,
+                                    constant_columns=constant_columns,
+                                    unlogged=unlogged)
 
     # Loads the data into the new table.
     print_verbose('Loading data ...')
-    load_data(table, schema, table_name, engine, chunk_size=chunk_size)
+    with measure(metrics, 'load_data', rows=len(table)) as stage:
+        if workers > 1:
+            stage['bytes'] = load_data_parallel(
+                table, schema, table_name, engine, workers,
+                chunk_size=chunk_size, format=format,
+                constant_columns=constant_columns, metrics=metrics)
+        else:
+            stage['bytes'] = load_data(
+                table, schema, table_name, engine, chunk_size=chunk_size,
+                format=format, constant_columns=constant_columns,
+                metrics=metrics)
+
+    # Indexes are built after the COPY, which is faster than updating them
+    # while the rows are inserted.
+    if indexes:
+        print_verbose('Creating indexes ...')
+        with measure(metrics, 'create_indexes'):
+            create_indexes(engine, schema, table_name, indexes,
+                           workers=index_workers, concurrently=concurrently)
+
+    if analyze:
+        print_verbose('Analysing table {0}.'.format(table_name))
+        with measure(metrics, 'analyze_table'):
+            analyze_table(engine, schema, table_name)
 
     return NewTable
 
@@ -175,9 +264,12 @@ def check_table_exists(engine, schema, table_name, drop=False):
     return False
 
 
-def create_new_table(schema, table_name, table_data, engine):
+def create_new_table(schema, table_name, table_data, engine,
+                     constant_columns=None, unlogged=False):
     """Creates a new empty table with the format of the table data.
 
+    Columns for ``constant_columns`` are added at the end of the table. If
+    ``unlogged=True``, the table is created as ``UNLOGGED``.
     Return a model for the new table.
 
     """
@@ -191,8 +283,13 @@ def create_new_table(schema, table_name, table_data, engine):
         sqlType = getPSQLtype(dtype, shape)
         columns.append(sql.Column(colName.lower(), sqlType))
 
+    for colName, value in constant_columns or []:
+        sqlType = getPSQLtype(np.asarray(value).dtype.type, (1, ))
+        columns.append(sql.Column(colName.lower(), sqlType))
+
     meta = sql.MetaData(schema=schema)
-    newTable = sql.Table(table_name, meta, *columns)
+    newTable = sql.Table(table_name, meta, *columns,
+                         prefixes=['UNLOGGED'] if unlogged else [])
     meta.create_all(engine)
 
     class NewTable(object):
@@ -204,50 +301,819 @@ def create_new_table(schema, table_name, table_data, engine):
     return NewTable
 
 
-def load_data(table, schema, table_name, engine, chunk_size=10000):
-    """Loads a table into a DB table using COPY."""
+def _index_columns(index):
+    """Returns the list of columns for an element of an index spec."""
+
+    if isinstance(index, str):
+        return [index.lower()]
+
+    return [column.lower() for column in index]
+
+
+def _execute_autocommit(engine, statement):
+    """Executes a statement outside a transaction block."""
+
+    connection = engine.raw_connection()
+
+    try:
+        connection.connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute(statement)
+        cursor.close()
+    finally:
+        connection.connection.autocommit = False
+        connection.close()
+
+
+def create_indexes(engine, schema, table_name, indexes, workers=1,
+                   concurrently=False):
+    """Creates indexes on a table.
+
+    Each element of ``indexes`` can be a column name or a tuple of column
+    names for a multicolumn index. The index for columns ``(a, b)`` is named
+    ``<table_name>_a_b_idx`` and is not created if it already exists. If
+    ``workers > 1``, the indexes are built at the same time using one
+    connection per index. If ``concurrently=True``, the indexes are built
+    with ``CREATE INDEX CONCURRENTLY``, which does not lock the table
+    against writes. Concurrent builds on the same table wait for each other
+    and would deadlock, so in that case they are always run one at a time.
+
+    """
+
+    statements = []
+    for index in indexes:
+        columns = _index_columns(index)
+        statements.append(
+            'CREATE INDEX {concurrently}IF NOT EXISTS {name} '
+            'ON {schema}.{table} ({columns});'.format(
+                concurrently='CONCURRENTLY ' if concurrently else '',
+                name='{0}_{1}_idx'.format(table_name, '_'.join(columns)),
+                schema=schema, table=table_name,
+                columns=', '.join(columns)))
+
+    for statement in statements:
+        print_verbose(statement)
+
+    if workers > 1 and not concurrently:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_execute_autocommit, engine, statement)
+                       for statement in statements]
+            for future in futures:
+                future.result()
+    else:
+        for statement in statements:
+            _execute_autocommit(engine, statement)
+
+    return
+
+
+def analyze_table(engine, schema, table_name):
+    """Runs ANALYZE on a table to update its planner statistics."""
+
+    _execute_autocommit(engine, 'ANALYZE {0}.{1};'.format(schema, table_name))
+
+    return
+
+
+def _encode_cells_legacy(column):
+    """Encodes a column cell by cell, as the original row-wise loader did."""
+
+    cells = []
+    for col_value in column:
+        if np.isscalar(col_value):
+            cells.append(str(col_value))
+        else:
+            cells.append(
+                str(col_value.tolist())
+                .replace('\n', '')
+                .replace('[', '{').replace(']', '}'))
+
+    return cells
+
+
+def encode_column_text(column):
+    """Returns the COPY text representation of each cell in a column.
+
+    Scalars are formatted with ``str`` and array cells with the string
+    representation of their ``tolist()``, using curly braces, so that the
+    result is identical to encoding each cell individually. Masked columns and
+    arrays of strings are encoded cell by cell.
+
+    """
+
+    mask = getattr(column, 'mask', None)
+    if mask is not None and np.any(mask):
+        return _encode_cells_legacy(column)
+
+    data = np.asarray(column)
+    kind = data.dtype.kind
+
+    if data.ndim == 1:
+        if kind == 'S':
+            return np.char.decode(data, 'utf-8').tolist()
+        elif data.dtype.type == np.float32:
+            # Numpy formats float32 scalars with float32 precision.
+            return data.astype(str).tolist()
+        elif kind in 'biufU':
+            return list(map(str, data.tolist()))
+        return _encode_cells_legacy(column)
+
+    if kind not in 'biuf':
+        return _encode_cells_legacy(column)
+
+    # Formats the whole column at once. Numeric cells never contain newlines
+    # or brackets, so the cells can be split back after the replacement.
+    text = '\n'.join(map(str, data.tolist()))
+
+    return text.replace('[', '{').replace(']', '}').split('\n')
+
+
+def encode_text_chunk(table, first_pk=1, constant_columns=None):
+    """Encodes a table as tab/newline-delimited text for COPY.
+
+    The table is encoded one column at a time. A ``pk`` column, starting at
+    ``first_pk``, is prepended to each row and the values of
+    ``constant_columns`` are appended to it.
+
+    """
+
+    n_rows = len(table)
+    if n_rows == 0:
+        return ''
+
+    columns = [list(map(str, range(first_pk, first_pk + n_rows)))]
+    for colname in table.colnames:
+        columns.append(encode_column_text(table[colname]))
+
+    for __, value in constant_columns or []:
+        columns.append(encode_column_text(np.asarray([value])) * n_rows)
+
+    return '\n'.join(map('\t'.join, zip(*columns)))
+
+
+def _binary_type(dtype, pg_type=None):
+    """Returns the big-endian dtype and the element OID for a Numpy dtype.
+
+    The binary representation must match the type of the column, so all
+    integers but ``uint8`` are sent as ``integer``, as in the tables created
+    with `getPSQLtype`. Floats are sent as ``real`` if ``pg_type`` (the type
+    of the column or of its elements, as in ``pg_type.typname``) is
+    ``float4``, and as ``double precision`` otherwise.
+
+    """
+
+    if dtype.type == np.uint8:
+        return np.dtype('>i2'), 21
+    elif dtype.type in [np.int16, np.int32, np.int64]:
+        return np.dtype('>i4'), 23
+    elif dtype.type in [np.float32, np.float64]:
+        if pg_type == 'float4':
+            return np.dtype('>f4'), 700
+        return np.dtype('>f8'), 701
+    elif dtype.kind in 'SU':
+        return None, 1043
+    else:
+        raise RuntimeError('the data type {0} cannot be converted to '
+                           'PosgreSQL.'.format(dtype.type))
+
+
+def _as_binary_values(data, value_dtype):
+    """Casts the data to ``value_dtype``, checking for integer overflows."""
+
+    if value_dtype.kind == 'i' and data.dtype.itemsize > value_dtype.itemsize:
+        info = np.iinfo(value_dtype)
+        if data.size > 0 and (data.min() < info.min or data.max() > info.max):
+            raise ValueError('integer values out of range for '
+                             'PostgreSQL integer.')
+
+    return data.astype(value_dtype, copy=False)
+
+
+def _encode_strings_binary(data):
+    """Returns the UTF-8 bytes matrix and the byte lengths for strings."""
+
+    if data.dtype.kind == 'U':
+        data = np.char.encode(data, 'utf-8')
+
+    n_rows = len(data)
+    width = data.dtype.itemsize
+    lengths = np.char.str_len(data).astype(np.int64)
+    matrix = np.ascontiguousarray(data).view(np.uint8).reshape(n_rows, width)
+
+    return matrix, lengths
+
+
+def _to_matrix(records):
+    """Returns the bytes of a structured array as a (rows, bytes) matrix."""
+
+    return records.view(np.uint8).reshape(len(records), records.dtype.itemsize)
+
+
+def _binary_column_parts(column, pg_type=None):
+    """Returns the PGCOPY binary representation of a column.
+
+    ``pg_type`` is the type of the column in the DB (see `_binary_type`).
+    The result is a list of ``(matrix, lengths)`` tuples in which ``matrix``
+    is a ``(n_rows, n_bytes)`` array of ``uint8`` and ``lengths`` is either
+    ``None``, if all the bytes are used, or an array with the number of
+    valid bytes at the beginning of each row of ``matrix``.
+
+    """
+
+    data = np.asarray(column)
+    n_rows = len(data)
+    shape = data.shape[1:]
+
+    value_dtype, oid = _binary_type(data.dtype, pg_type)
+
+    mask = getattr(column, 'mask', None)
+    mask = np.zeros(n_rows, bool) if mask is None else np.asarray(mask)
+    if np.any(mask) and len(shape) > 0:
+        raise ValueError('masked array columns cannot be loaded in '
+                         'binary format.')
+
+    # Scalar columns.
+    if len(shape) == 0:
+
+        if value_dtype is None:
+            strings, lengths = _encode_strings_binary(data)
+            prefix = np.where(mask, -1, lengths).astype('>i4')
+            lengths[mask] = 0
+            return [(_to_matrix(prefix.view([('length', '>i4')])), None),
+                    (strings, lengths)]
+
+        records = np.empty(n_rows, dtype=[('length', '>i4'),
+                                          ('value', value_dtype)])
+        records['length'] = value_dtype.itemsize
+        records['value'] = _as_binary_values(data, value_dtype)
+
+        if not np.any(mask):
+            return [(_to_matrix(records), None)]
+
+        records['length'][mask] = -1
+        lengths = np.where(mask, 4, records.dtype.itemsize)
+        return [(_to_matrix(records), lengths)]
+
+    # Array columns. All the cells have the same shape, so the array header is
+    # identical for all the rows. Empty arrays are sent with zero dimensions.
+    n_elements = int(np.prod(shape))
+    n_dims = len(shape) if n_elements > 0 else 0
+
+    header_dtype = [('length', '>i4'), ('ndim', '>i4'), ('flags', '>i4'),
+                    ('oid', '>i4'), ('dims', '>i4', (n_dims, 2))]
+
+    if value_dtype is not None:
+        element_dtype = [('length', '>i4'), ('value', value_dtype)]
+        records = np.empty(n_rows, dtype=header_dtype +
+                           [('elements', element_dtype, (n_elements, ))])
+        records['length'] = records.dtype.itemsize - 4
+        records['elements']['length'] = value_dtype.itemsize
+        records['elements']['value'] = _as_binary_values(
+            data.reshape(n_rows, n_elements), value_dtype)
+    else:
+        records = np.empty(n_rows, dtype=header_dtype)
+
+    records['ndim'] = n_dims
+    records['flags'] = 0
+    records['oid'] = oid
+    if n_dims > 0:
+        records['dims'][:, :, 0] = shape
+        records['dims'][:, :, 1] = 1
+
+    if value_dtype is not None:
+        return [(_to_matrix(records), None)]
+
+    # Arrays of strings: each element has its own length.
+    parts = [(_to_matrix(records), None)]
+    field_lengths = np.full(n_rows, records.dtype.itemsize - 4, np.int64)
+    for element in data.reshape(n_rows, n_elements).T:
+        strings, lengths = _encode_strings_binary(element)
+        field_lengths += 4 + lengths
+        prefix = lengths.astype('>i4').view([('length', '>i4')])
+        parts += [(_to_matrix(prefix), None), (strings, lengths)]
+
+    records['length'] = field_lengths
+
+    return parts
+
+
+def encode_binary_chunk(table, first_pk=1, constant_columns=None,
+                        column_types=None):
+    """Encodes a table in the PostgreSQL binary COPY format.
+
+    Each column is converted to a matrix of big-endian bytes from its Numpy
+    buffer. A ``pk`` column, starting at ``first_pk``, is prepended to each
+    row and the values of ``constant_columns`` are appended to it.
+    ``column_types`` is a dictionary of column names to their types in the
+    DB, as returned by `get_column_types`. Float columns are sent as
+    ``double precision`` unless their type is ``real``. Returns a `bytes`
+    object including the PGCOPY header and trailer.
+
+    Unlike the text format, which writes float32 values with float32
+    precision (e.g., 0.1), float32 values loaded into ``double precision``
+    columns keep their exact value (e.g., 0.10000000149011612).
+
+    """
+
+    n_rows = len(table)
+    constant_columns = constant_columns or []
+    column_types = column_types or {}
+
+    tuple_header = np.empty(n_rows, dtype=[('n_fields', '>i2'),
+                                           ('length', '>i4'),
+                                           ('pk', '>i4')])
+    tuple_header['n_fields'] = (len(table.colnames) + len(constant_columns) +
+                                1)
+    tuple_header['length'] = 4
+    tuple_header['pk'] = np.arange(first_pk, first_pk + n_rows)
+
+    parts = [(_to_matrix(tuple_header), None)]
+    for colname in table.colnames:
+        parts += _binary_column_parts(table[colname],
+                                      column_types.get(colname.lower()))
+
+    for name, value in constant_columns:
+        parts += _binary_column_parts(np.full(n_rows, value),
+                                      column_types.get(name.lower()))
+
+    rows = np.hstack([matrix for matrix, __ in parts])
+
+    # Removes the unused bytes at the end of variable-length fields.
+    if any(lengths is not None for __, lengths in parts):
+        valid = np.hstack([
+            np.ones(matrix.shape, bool) if lengths is None else
+            np.arange(matrix.shape[1]) < lengths[:, np.newaxis]
+            for matrix, lengths in parts])
+        rows = rows[valid]
+
+    return b''.join([_PGCOPY_HEADER, memoryview(rows).cast('B'),
+                     _PGCOPY_TRAILER])
+
+
+def _copy_chunk(cursor, copy_sql, chunk, first_pk, format='text',
+                constant_columns=None, column_types=None):
+    """Encodes a chunk of a table and sends it with ``copy_sql``.
+
+    Returns the size of the encoded data (in characters for the text format,
+    which is the number of bytes for ASCII data), the time spent encoding it,
+    and the time spent sending it.
+
+    """
+
+    t0 = time.time()
+
+    if format == 'binary':
+        data = encode_binary_chunk(
+            chunk, first_pk=first_pk, constant_columns=constant_columns,
+            column_types=column_types)
+        ss = io.BytesIO(data)
+    else:
+        data = encode_text_chunk(
+            chunk, first_pk=first_pk, constant_columns=constant_columns)
+        ss = StringIO(data)
+
+    t1 = time.time()
+    cursor.copy_expert(copy_sql, ss)
+
+    return len(data), t1 - t0, time.time() - t1
+
+
+def get_column_types(cursor, schema, table_name):
+    """Returns a dictionary of the column names of a table to their types.
+
+    The types are the names in ``pg_type`` (e.g., ``float4``). For array
+    columns, the type of the elements is returned.
+
+    """
+
+    cursor.execute('SELECT column_name, udt_name '
+                   'FROM information_schema.columns '
+                   'WHERE table_schema = %s AND table_name = %s;',
+                   (schema, table_name))
+
+    return dict((name, udt_name.lstrip('_'))
+                for name, udt_name in cursor.fetchall())
+
+
+def _get_copy_sql(schema, table_name, format):
+    """Returns the COPY statement for a table and format."""
+
+    if format not in ('text', 'binary'):
+        raise ValueError('invalid COPY format {0!r}.'.format(format))
+
+    return 'COPY {0}.{1} FROM STDIN WITH (FORMAT {2})'.format(
+        schema, table_name, format)
+
+
+def load_data(table, schema, table_name, engine, chunk_size=10000,
+              format='text', constant_columns=None, metrics=None):
+    """Loads a table into a DB table using COPY.
+
+    ``format`` can be ``'text'`` or ``'binary'``. The table is sliced in
+    chunks of ``chunk_size`` rows that are encoded and sent independently, so
+    memory-mapped tables are only read one chunk at a time. If ``metrics``
+    is set, each chunk is recorded as a ``load_data.chunk`` stage. Returns
+    the size of the data sent.
+
+    """
+
+    copy_sql = _get_copy_sql(schema, table_name, format)
 
     connection = engine.raw_connection()
     cursor = connection.cursor()
 
+    column_types = None
+    if format == 'binary':
+        column_types = get_column_types(cursor, schema, table_name)
+        connection.commit()
+
+    starts = range(0, len(table), chunk_size)
+
     # If the progressbar package is installed, uses it to create a progress bar
     if progressbar:
         bar = progressbar.ProgressBar()
-        iterable = bar(range(len(table)))
+        iterable = bar(starts)
     else:
-        iterable = range(len(table))
-
-    chunk = 0
-    tmp_list = []
-    for ii in iterable:
-
-        row = table[ii]
-
-        # Adds the pk
-        row_data = [str(ii + 1)]
-
-        for col_value in row:
-            if np.isscalar(col_value):
-                row_data.append(str(col_value))
-            else:
-                row_data.append(
-                    str(col_value.tolist())
-                    .replace('\n', '')
-                    .replace('[', '{').replace(']', '}'))
-
-        tmp_list.append('\t'.join(row_data))
-        chunk += 1
-
-        # If we have reached a chunk commit point, or this is the last item,
-        # copy and commits to the database.
-        last_item = ii == len(table) - 1
-        if chunk == chunk_size or (last_item and len(tmp_list) > 0):
-            ss = StringIO('\n'.join(tmp_list))
-            cursor.copy_from(ss, '{0}.{1}'.format(schema, table_name))
-            connection.commit()
-            tmp_list = []
-            chunk = 0
+        iterable = starts
+
+    n_bytes = 0
+
+    for start in iterable:
+        t0 = time.time()
+        chunk = table[start:start + chunk_size]
+        chunk_bytes, encode_time, copy_time = _copy_chunk(
+            cursor, copy_sql, chunk, start + 1, format=format,
+            constant_columns=constant_columns, column_types=column_types)
+        t1 = time.time()
+        connection.commit()
+        n_bytes += chunk_bytes
+
+        if metrics is not None:
+            metrics.record('load_data.chunk', time.time() - t0,
+                           rows=len(chunk), nbytes=chunk_bytes,
+                           level=logging.DEBUG, encode_time=encode_time,
+                           copy_time=copy_time,
+                           commit_time=time.time() - t1)
 
     cursor.close()
 
-    return
+    return n_bytes
+
+
+# The table being loaded by a worker process of load_data_parallel, and the
+# engine used to connect to the DB.
+_worker_table = None
+_worker_engine = None
+
+
+_GID_PREFIX = 'mangasampledb'
+
+
+class PreparedTransactionsError(RuntimeError):
+    """Raised when a parallel load leaves prepared transactions behind.
+
+    ``committed`` and ``prepared`` are the identifiers of the transactions
+    that were committed and of those that are still prepared.
+
+    """
+
+    def __init__(self, message, committed, prepared):
+
+        super(PreparedTransactionsError, self).__init__(message)
+
+        self.committed = committed
+        self.prepared = prepared
+
+
+def _make_gid(table_name, index):
+    """Returns the identifier of the prepared transaction of a worker.
+
+    The identifier contains the table name and the host and pid of the
+    process coordinating the load, so that `recover_prepared_transactions`
+    can tell whether the transaction has been orphaned.
+
+    """
+
+    host = re.sub(r'[^A-Za-z0-9.-]', '', socket.gethostname())[:60]
+
+    return ':'.join([_GID_PREFIX, table_name, host, str(os.getpid()),
+                     uuid.uuid4().hex[:8], str(index)])
+
+
+def _is_orphaned(gid):
+    """Returns True if the process that coordinated a load has died.
+
+    Returns None if the process ran in a different host.
+
+    """
+
+    host, pid = gid.split(':')[2:4]
+    if host != re.sub(r'[^A-Za-z0-9.-]', '', socket.gethostname())[:60]:
+        return None
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # The process exists but belongs to another user.
+        return False
+
+    return False
+
+
+def recover_prepared_transactions(engine, table_name=None, force=False):
+    """Rolls back the prepared transactions orphaned by parallel loads.
+
+    If the process coordinating `load_data_parallel` dies after its workers
+    have prepared their transactions, the transactions hold their locks
+    until they are committed or rolled back, and the table they loaded
+    cannot be dropped. This function rolls back the prepared transactions
+    created by `load_data_parallel` in the database of ``engine`` (only for
+    ``table_name``, if set) whose coordinating process, in this host, does
+    not exist anymore. Transactions coordinated from another host are only
+    rolled back if ``force=True``. Returns the identifiers of the
+    transactions rolled back.
+
+    """
+
+    connection = engine.raw_connection()
+    dbapi_connection = connection.connection
+
+    rolled_back = []
+
+    try:
+        for xid in dbapi_connection.tpc_recover():
+            # Transactions prepared with a string identifier have no
+            # format_id, and their identifier is in gtrid.
+            gid = xid.gtrid
+            if xid.format_id is not None or \
+                    xid.database != engine.url.database or \
+                    not gid.startswith(_GID_PREFIX + ':') or \
+                    len(gid.split(':')) != 6:
+                continue
+            if table_name is not None and gid.split(':')[1] != table_name:
+                continue
+
+            orphaned = _is_orphaned(gid)
+            if orphaned is None and not force:
+                warnings.warn('prepared transaction {0!r} was created in a '
+                              'different host. Use force=True to roll it '
+                              'back.'.format(gid), UserWarning)
+                continue
+            elif orphaned is False and not force:
+                continue
+
+            dbapi_connection.tpc_rollback(xid)
+            rolled_back.append(gid)
+            print('INFO: rolled back orphaned prepared transaction {0!r}.'
+                  .format(gid))
+
+    finally:
+        connection.close()
+
+    return rolled_back
+
+
+def _get_max_prepared_transactions(engine):
+    """Returns the max_prepared_transactions setting of the server."""
+
+    return int(engine.execute('SHOW max_prepared_transactions;').scalar())
+
+
+def _init_worker(table, engine):
+    """Stores the table to load and the engine in the worker process."""
+
+    global _worker_table, _worker_engine
+    _worker_table = table
+    _worker_engine = engine
+
+
+def _load_range(copy_sql, start, stop, gid, chunk_size=10000,
+                format='text', constant_columns=None, column_types=None):
+    """Loads a range of rows of the worker table as a prepared transaction.
+
+    Runs in a worker process of `load_data_parallel`, using a connection
+    from the engine of the load, so that its connect arguments and events
+    (e.g., ``statement_timeout``) apply. Returns ``gid`` once the
+    transaction has been prepared, the size of the data sent, and the total
+    time and the time spent encoding, sending, and preparing it.
+
+    """
+
+    t_start = time.time()
+
+    connection = _worker_engine.raw_connection()
+    dbapi_connection = connection.connection
+
+    n_bytes = 0
+    encode_time = 0.
+    copy_time = 0.
+
+    try:
+        dbapi_connection.tpc_begin(gid)
+        cursor = dbapi_connection.cursor()
+        for chunk_start in range(start, stop, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, stop)
+            chunk_bytes, chunk_encode, chunk_copy = _copy_chunk(
+                cursor, copy_sql, _worker_table[chunk_start:chunk_stop],
+                chunk_start + 1, format=format,
+                constant_columns=constant_columns,
+                column_types=column_types)
+            n_bytes += chunk_bytes
+            encode_time += chunk_encode
+            copy_time += chunk_copy
+        t0 = time.time()
+        dbapi_connection.tpc_prepare()
+        prepare_time = time.time() - t0
+        # Detaches the prepared transaction from the connection. Otherwise,
+        # the pool would roll it back when the connection is returned.
+        dbapi_connection.reset()
+    except Exception:
+        dbapi_connection.tpc_rollback()
+        raise
+    finally:
+        connection.close()
+
+    return (gid, n_bytes, time.time() - t_start, encode_time, copy_time,
+            prepare_time)
+
+
+def _finish_prepared(dbapi_connection, gids, commit=True):
+    """Commits or rolls back the prepared transactions of a parallel load.
+
+    If a commit fails before any transaction has been committed, all of
+    them are rolled back. If it fails later, the remaining transactions are
+    left prepared. Returns the committed transactions, those that are still
+    prepared, and the first error, if any.
+
+    """
+
+    committed = []
+    prepared = []
+    error = None
+
+    for gid in gids:
+
+        if commit and error is None:
+            try:
+                dbapi_connection.tpc_commit(gid)
+                committed.append(gid)
+                continue
+            except Exception as ee:
+                error = ee
+
+        # After a partial commit, the load cannot be undone.
+        if committed:
+            prepared.append(gid)
+            continue
+
+        try:
+            dbapi_connection.tpc_rollback(gid)
+        except Exception as ee:
+            error = error or ee
+            prepared.append(gid)
+
+    return committed, prepared, error
+
+
+def load_data_parallel(table, schema, table_name, engine, workers,
+                       chunk_size=10000, format='text',
+                       constant_columns=None, metrics=None):
+    """Loads a table into a DB table using several connections in parallel.
+
+    The table is split in ``workers`` contiguous ranges of rows. Each range is
+    encoded and copied by a worker process using its own connection from
+    ``engine``. The ``pk`` of each row is assigned from its position in the
+    table, so the result is identical to that of `load_data`.
+
+    The ranges are loaded as prepared transactions (two-phase commit) that
+    are only committed once all the workers have succeeded. If any of them
+    fails, all the prepared transactions are rolled back. This requires the
+    DBAPI driver to support two-phase commit (e.g., psycopg2) and the
+    server to allow at least ``workers`` prepared transactions. PostgreSQL
+    disables them by default (``max_prepared_transactions = 0``), so the
+    parameter must be set in ``postgresql.conf``. If it is too low, or if
+    the platform cannot fork processes, a warning is issued and the data
+    are loaded with `load_data` in a single transaction per chunk.
+
+    Committing the prepared transactions is not atomic: they are committed
+    one after the other. If a commit fails before any of them has been
+    committed, all of them are rolled back and the error is raised. If it
+    fails after some have been committed, the table is partially loaded and
+    a `PreparedTransactionsError` listing the committed and the still
+    prepared transactions is raised. The latter can be committed with
+    ``COMMIT PREPARED`` or rolled back with
+    ``recover_prepared_transactions(engine, table_name, force=True)``.
+
+    If the process running this function dies after the workers have
+    prepared their transactions, they keep holding their locks. They are
+    rolled back by `recover_prepared_transactions`, which `table_to_db`
+    calls before loading a table with several workers.
+
+    If ``metrics`` is set, each range is recorded as a ``load_data.worker``
+    stage and the final commit as ``load_data.tpc_commit``. Returns the size
+    of the data sent.
+
+    """
+
+    n_rows = len(table)
+    bounds = np.linspace(0, n_rows, workers + 1).astype(int)
+    ranges = [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])
+              if stop > start]
+
+    # The workers inherit the table and the engine, which cannot be pickled.
+    fallback = None
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        fallback = 'processes cannot be forked in this platform'
+    else:
+        max_prepared = _get_max_prepared_transactions(engine)
+        if max_prepared < len(ranges):
+            fallback = ('max_prepared_transactions={0} is lower than the '
+                        'number of workers ({1})'.format(max_prepared,
+                                                         len(ranges)))
+
+    if fallback is not None:
+        warnings.warn('{0}. Loading the data with a single connection.'
+                      .format(fallback), UserWarning)
+        return load_data(table, schema, table_name, engine,
+                         chunk_size=chunk_size, format=format,
+                         constant_columns=constant_columns, metrics=metrics)
+
+    copy_sql = _get_copy_sql(schema, table_name, format)
+
+    column_types = None
+    if format == 'binary':
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            column_types = get_column_types(cursor, schema, table_name)
+            cursor.close()
+        finally:
+            connection.close()
+
+    # Connections must not be shared with the forked processes.
+    engine.dispose()
+
+    mp_context = multiprocessing.get_context('fork')
+
+    prepared = []
+    errors = []
+    n_bytes = 0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                             initializer=_init_worker,
+                             initargs=(table, engine)) as executor:
+
+        futures = []
+        for ii, (start, stop) in enumerate(ranges):
+            print_verbose('Loading rows {0} to {1} in worker {2}.'
+                          .format(start, stop - 1, ii))
+            futures.append(executor.submit(
+                _load_range, copy_sql, int(start), int(stop),
+                _make_gid(table_name, ii), chunk_size=chunk_size,
+                format=format, constant_columns=constant_columns,
+                column_types=column_types))
+
+        for (start, stop), future in zip(ranges, futures):
+            try:
+                (gid, range_bytes, duration, encode_time, copy_time,
+                 prepare_time) = future.result()
+            except Exception as ee:
+                errors.append(ee)
+                continue
+            prepared.append(gid)
+            n_bytes += range_bytes
+            if metrics is not None:
+                metrics.record('load_data.worker', duration,
+                               rows=int(stop - start), nbytes=range_bytes,
+                               level=logging.DEBUG, encode_time=encode_time,
+                               copy_time=copy_time,
+                               prepare_time=prepare_time)
+
+    connection = engine.raw_connection()
+    dbapi_connection = connection.connection
+
+    try:
+        with measure(metrics, 'load_data.tpc_commit', rows=n_rows):
+            committed, still_prepared, error = _finish_prepared(
+                dbapi_connection, prepared, commit=not errors)
+    finally:
+        connection.close()
+
+    if still_prepared:
+        raise PreparedTransactionsError(
+            'the parallel load of {0}.{1} failed after committing {2} of '
+            '{3} ranges. The prepared transactions {4} must be committed '
+            'with COMMIT PREPARED or rolled back with '
+            'recover_prepared_transactions(engine, {1!r}, force=True).'
+            .format(schema, table_name, len(committed), len(ranges),
+                    ', '.join(map(repr, still_prepared))),
+            committed, still_prepared) from error
+
+    if errors:
+        raise errors[0]
+    elif error is not None:
+        raise error
+
+    return n_bytes
@@ -19,11 +19,21 @@ from __future__ import print_function
 import os
 import warnings
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import numpy as np
+
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from astropy import table
 
+from mangaSampleDB.utils.table_to_db import (encode_text_chunk,
+                                             _execute_autocommit)
+
 
 def _warning(message, category, *args, **kwargs):
     print('{0}: {1}'.format(category.__name__, message))
@@ -31,10 +41,181 @@ def _warning(message, category, *args, **kwargs):
 
 warnings.showwarning = _warning
 
-__all__ = ('loadMangaTargets')
+__all__ = ('loadMangaTargets', 'createMangaIdIndex')
+
+
+mangaIdIndexName = 'manga_target_mangaid_idx'
+
+
+def _checkMangaIdIndex(cursor):
+    """Returns None if the unique index on mangaid is usable, or the problem.
+
+    A concurrent build that fails leaves an invalid index behind, which
+    ``INSERT ... ON CONFLICT`` cannot use.
+
+    """
+
+    cursor.execute('SELECT idx.indisvalid, idx.indisunique '
+                   'FROM pg_index AS idx '
+                   'JOIN pg_class AS cls ON cls.oid = idx.indexrelid '
+                   'JOIN pg_namespace AS nsp ON nsp.oid = cls.relnamespace '
+                   'WHERE nsp.nspname = %s AND cls.relname = %s;',
+                   ('mangasampledb', mangaIdIndexName))
+    row = cursor.fetchone()
+
+    if row is None:
+        return 'does not exist'
+    elif not row[0]:
+        return 'is invalid, probably because its creation failed'
+    elif not row[1]:
+        return 'is not unique'
+
+    return None
+
+
+def _hasMangaIdIndex(cursor):
+    """Returns True if the valid unique index on mangaid exists."""
+
+    return _checkMangaIdIndex(cursor) is None
+
+
+def createMangaIdIndex(engine):
+    """Creates the unique index on manga_target.mangaid.
+
+    The index is part of the schema but is missing from DBs created before
+    it was added to it. This function must be run once on those DBs before
+    using ``loadMangaTargets(upsert=True)``. The index is built with
+    ``CREATE UNIQUE INDEX CONCURRENTLY``, so the table can be read and
+    written while it is created.
+
+    Parameters:
+        engine (SQLAlchemy |engine|):
+            The engine to use to connect to the DB.
+
+    Returns:
+        result (bool):
+            Returns ``True`` if the index was created, ``False`` if it
+            already existed.
+
+    Raises:
+        ValueError:
+            If manga_target contains repeated mangaids. The index is not
+            created.
+
+    .. |engine| replace:: Engine `<http://docs.sqlalchemy.org/en/latest/core/connections.html#sqlalchemy.engine.Engine>`_
+
+    """
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        if _hasMangaIdIndex(cursor):
+            print('INFO: index {0} already exists.'.format(mangaIdIndexName))
+            return False
+
+        cursor.execute('SELECT mangaid, count(*) '
+                       'FROM mangasampledb.manga_target '
+                       'GROUP BY mangaid HAVING count(*) > 1 '
+                       'ORDER BY mangaid;')
+        repeated = cursor.fetchall()
+
+        connection.rollback()
 
+    finally:
+        cursor.close()
+        connection.close()
 
-def loadMangaTargets(mangaTargetsExtFile, drpall_file, engine):
+    if len(repeated) > 0:
+        raise ValueError('mangasampledb.manga_target contains {0} repeated '
+                         'mangaids (e.g., {1}). Remove them before creating '
+                         'the index.'.format(
+                             len(repeated),
+                             ', '.join(row[0] for row in repeated[0:5])))
+
+    # A failed concurrent build leaves an invalid index behind. Removes it
+    # first, so that the index can be created again.
+    _execute_autocommit(engine, 'DROP INDEX CONCURRENTLY IF EXISTS '
+                                'mangasampledb.{0};'.format(mangaIdIndexName))
+    _execute_autocommit(engine, 'CREATE UNIQUE INDEX CONCURRENTLY {0} '
+                                'ON mangasampledb.manga_target (mangaid);'
+                                .format(mangaIdIndexName))
+
+    print('INFO: created index mangasampledb.{0}.'.format(mangaIdIndexName))
+
+    return True
+
+
+def _upsertMangaTargets(mangaIdColumns, engine, chunkSize=100000):
+    """Inserts the new mangaids using a staging table and ON CONFLICT.
+
+    The mangaids are stripped and copied in chunks into a temporary staging
+    table, so the memory used and the number of round-trips do not depend on
+    the number of targets already in the DB. The new mangaids are inserted in
+    the order in which they first appear in the input. The unique index on
+    mangaid, which must exist and be valid (see `createMangaIdIndex`),
+    guarantees that concurrent loaders do not create duplicates.
+
+    Returns the number of input mangaids, the number of distinct input
+    mangaids, and the number of mangaids inserted.
+
+    """
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    nMangaIDs = 0
+
+    try:
+        problem = _checkMangaIdIndex(cursor)
+        if problem is not None:
+            raise ValueError('the unique index mangasampledb.{0} on '
+                             'manga_target.mangaid {1}. (Re)create it with '
+                             'createMangaIdIndex (or loadMangaTargets '
+                             '--create-index) before using upsert.'
+                             .format(mangaIdIndexName, problem))
+
+        cursor.execute('CREATE TEMPORARY TABLE target_staging '
+                       '(row_order INTEGER, mangaid TEXT) ON COMMIT DROP;')
+
+        for column in mangaIdColumns:
+            for start in range(0, len(column), chunkSize):
+                mangaIDs = np.char.strip(
+                    np.asarray(column[start:start + chunkSize]))
+                chunk = encode_text_chunk(
+                    table.Table([mangaIDs], names=['mangaid']),
+                    first_pk=nMangaIDs + 1)
+                cursor.copy_expert('COPY target_staging FROM STDIN',
+                                   StringIO(chunk))
+                nMangaIDs += len(mangaIDs)
+
+        cursor.execute('SELECT count(DISTINCT mangaid) FROM target_staging;')
+        nDistinct = cursor.fetchone()[0]
+
+        cursor.execute(
+            'INSERT INTO mangasampledb.manga_target (mangaid) '
+            'SELECT mangaid FROM ('
+            'SELECT DISTINCT ON (mangaid) mangaid, row_order '
+            'FROM target_staging ORDER BY mangaid, row_order) AS first '
+            'ORDER BY row_order '
+            'ON CONFLICT (mangaid) DO NOTHING;')
+        nInserted = cursor.rowcount
+
+        connection.commit()
+
+    except Exception:
+        connection.rollback()
+        raise
+
+    finally:
+        cursor.close()
+        connection.close()
+
+    return nMangaIDs, nDistinct, nInserted
+
+
+def loadMangaTargets(mangaTargetsExtFile, drpall_file, engine, upsert=False,
+                     chunkSize=100000):
     """Loads a list of manga targets to mangasampledb.manga_target.
 
     Parameters:
@@ -47,6 +228,15 @@ def loadMangaTargets(mangaTargetsExtFile, drpall_file, engine):
             target selections).
         engine (SQLAlchemy |engine|):
             The engine to use to connect to the DB.
+        upsert (bool):
+            If ``True``, the input files are read with memory mapping and
+            the mangaids are copied in chunks of ``chunkSize`` to a staging
+            table. Only the new ones are inserted, using
+            ``INSERT ... ON CONFLICT DO NOTHING``. This requires the unique
+            index on manga_target.mangaid, which can be created with
+            `createMangaIdIndex`.
+        chunkSize (int):
+            The number of mangaids copied at a time if ``upsert=True``.
 
     Returns:
         result (bool):
@@ -58,6 +248,31 @@ def loadMangaTargets(mangaTargetsExtFile, drpall_file, engine):
 
     assert os.path.exists(mangaTargetsExtFile), 'file does not exit.'
 
+    if upsert:
+        targets = table.Table.read(mangaTargetsExtFile, memmap=True)
+        drpall = table.Table.read(drpall_file, memmap=True)
+
+        nMangaIDs, nDistinct, nInserted = _upsertMangaTargets(
+            [targets['MANGAID'], drpall['mangaid']], engine,
+            chunkSize=chunkSize)
+
+        if nDistinct != nMangaIDs:
+            warnings.warn('there are {0} repeated mangaids in your input '
+                          'file. Duplicates will be removed.'
+                          .format(nMangaIDs - nDistinct))
+
+        if nInserted != nMangaIDs:
+            warnings.warn('not inserting {0} targets because they '
+                          'are already in the DB.'
+                          .format(nMangaIDs - nInserted))
+
+        if nInserted > 0:
+            print('INFO: inserted {0} targets.'.format(nInserted))
+            return True
+        else:
+            print('INFO: not inserting any target.')
+            return False
+
     # Creates DB session
 
     Session = sessionmaker(bind=engine)
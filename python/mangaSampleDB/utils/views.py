@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+views.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Manages the materialized views ``mangasampledb.current_<catalogue>``, which
+join manga_target to the rows of the current version of a catalogue.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import warnings
+
+from sqlalchemy.engine.reflection import Inspector
+
+from mangaSampleDB.utils.table_to_db import _execute_autocommit
+
+
+def _warning(message, category, *args, **kwargs):
+    print('{0}: {1}'.format(category.__name__, message))
+
+
+warnings.showwarning = _warning
+
+__all__ = ('createCurrentView', 'refreshCurrentViews')
+
+
+def currentViewName(catname):
+    """Returns the name of the current view for a catalogue."""
+
+    return 'current_{0}'.format(catname)
+
+
+# Columns of the view that come from manga_target.
+targetColumns = ('mangaid', 'manga_target_pk')
+
+
+def getCatalogueColumns(cursor, catname):
+    """Returns the column names of a catalogue table, in order."""
+
+    cursor.execute('SELECT column_name FROM information_schema.columns '
+                   'WHERE table_schema = %s AND table_name = %s '
+                   'ORDER BY ordinal_position;', ('mangasampledb', catname))
+
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _catalogueSelectList(catname, columns):
+    """Returns the select list for the catalogue columns in the view.
+
+    Catalogue columns named like one of ``targetColumns`` are renamed to
+    ``catalogue_<column>``. If that name is also taken, the column is
+    skipped.
+
+    """
+
+    selected = []
+
+    for column in columns:
+        alias = column
+        if column in targetColumns:
+            alias = 'catalogue_{0}'.format(column)
+            if alias in columns:
+                warnings.warn('column {0} of {1} conflicts with the view '
+                              'columns. Skipping it.'.format(column, catname),
+                              UserWarning)
+                continue
+            warnings.warn('column {0} of {1} conflicts with the view '
+                          'columns. Renaming it to {2}.'
+                          .format(column, catname, alias), UserWarning)
+        selected.append('cat.{0} AS {1}'.format(_quote(column),
+                                                _quote(alias)))
+
+    return ', '.join(selected)
+
+
+def _quote(name):
+    """Quotes an identifier."""
+
+    return '"{0}"'.format(name.replace('"', '""'))
+
+
+def currentViewSQL(catname, columns):
+    """Returns the statements that create the current view of a catalogue.
+
+    The view contains a row for each pair of MaNGA target and catalogue row
+    in the relational table, if the catalogue row belongs to the current
+    version of the catalogue. It has the columns ``mangaid`` and
+    ``manga_target_pk`` followed by the ``columns`` of the catalogue, which
+    can be obtained with `getCatalogueColumns`. Catalogue columns with the
+    same name as the first two are renamed ``catalogue_<column>``. The view
+    is indexed on ``mangaid`` and has a unique index on
+    ``(manga_target_pk, pk)``, which allows refreshing it concurrently.
+
+    """
+
+    viewName = currentViewName(catname)
+
+    return [
+        'CREATE MATERIALIZED VIEW mangasampledb.{view} AS '
+        'SELECT DISTINCT ON (target.pk, cat.pk) '
+        'target.mangaid, target.pk AS manga_target_pk, {columns} '
+        'FROM mangasampledb.manga_target AS target '
+        'JOIN mangasampledb.manga_target_to_{catname} AS rel '
+        'ON rel.manga_target_pk = target.pk '
+        'JOIN mangasampledb.{catname} AS cat ON cat.pk = rel.{catname}_pk '
+        'JOIN mangasampledb.current_catalogue AS current '
+        'ON current.catalogue_pk = cat.catalogue_pk '
+        'ORDER BY target.pk, cat.pk;'.format(
+            view=viewName, catname=catname,
+            columns=_catalogueSelectList(catname, columns)),
+        'CREATE UNIQUE INDEX {view}_pk_idx ON mangasampledb.{view} '
+        '(manga_target_pk, pk);'.format(view=viewName),
+        'CREATE INDEX {view}_mangaid_idx ON mangasampledb.{view} (mangaid);'
+        .format(view=viewName),
+        'ANALYZE mangasampledb.{view};'.format(view=viewName)]
+
+
+def getCurrentViews(engine):
+    """Returns a dictionary of catalogue names to current view names."""
+
+    rows = engine.execute(
+        'SELECT matviewname FROM pg_matviews '
+        'WHERE schemaname = %s AND matviewname LIKE %s;',
+        ('mangasampledb', 'current\\_%')).fetchall()
+
+    return dict((row[0][len('current_'):], row[0]) for row in rows)
+
+
+def createCurrentView(engine, catname, overwrite=False):
+    """Creates the current view for a catalogue.
+
+    Requires the table ``manga_target_to_<catname>``. If the view already
+    exists and ``overwrite=False``, it is refreshed instead.
+
+    """
+
+    inspector = Inspector.from_engine(engine)
+    if 'manga_target_to_{0}'.format(catname) not in \
+            inspector.get_table_names(schema='mangasampledb'):
+        raise ValueError('catalogue {0} does not have a relational table.'
+                         .format(catname))
+
+    viewName = currentViewName(catname)
+
+    if catname in getCurrentViews(engine):
+        if not overwrite:
+            refreshCurrentViews(engine, catname)
+            return
+        warnings.warn('view {0} already exists. Overwriting it.'
+                      .format(viewName), UserWarning)
+        engine.execute('DROP MATERIALIZED VIEW mangasampledb.{0};'
+                       .format(viewName))
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        columns = getCatalogueColumns(cursor, catname)
+        for statement in currentViewSQL(catname, columns):
+            cursor.execute(statement)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+
+    print('INFO: created view mangasampledb.{0}'.format(viewName))
+
+
+def refreshCurrentViews(engine, catname=None, concurrently=True):
+    """Refreshes the current views.
+
+    If ``catname`` is set, only the view for that catalogue is refreshed, if
+    it exists. With ``concurrently=True``, the views are refreshed with
+    ``REFRESH MATERIALIZED VIEW CONCURRENTLY``, which does not block
+    readers.
+
+    """
+
+    views = getCurrentViews(engine)
+    if catname is not None:
+        views = dict((key, value) for key, value in views.items()
+                     if key == catname)
+
+    for viewName in views.values():
+        _execute_autocommit(
+            engine, 'REFRESH MATERIALIZED VIEW {0}mangasampledb.{1};'.format(
+                'CONCURRENTLY ' if concurrently else '', viewName))
+        print('INFO: refreshed view mangasampledb.{0}'.format(viewName))
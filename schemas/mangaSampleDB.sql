@@ -18,6 +18,9 @@ CREATE TABLE mangasampledb.manga_target
     (pk SERIAL PRIMARY KEY NOT NULL,
      mangaid TEXT NOT NULL);
 
+CREATE UNIQUE INDEX manga_target_mangaid_idx
+    ON mangasampledb.manga_target (mangaid);
+
 CREATE TABLE mangasampledb.catalogue
     (pk SERIAL PRIMARY KEY NOT NULL,
      catalogue_name TEXT NOT NULL,
@@ -37,7 +40,13 @@ CREATE TABLE mangasampledb.manga_target_to_manga_target
 CREATE TABLE mangasampledb.character
     (pk SERIAL PRIMARY KEY NOT NULL,
      name TEXT, picture BYTEA,
-     anime_pk INTEGER, manga_target_pk INTEGER);
+     anime_pk INTEGER, manga_target_pk INTEGER,
+     picture_pk INTEGER);
+
+CREATE TABLE mangasampledb.character_picture
+    (pk SERIAL PRIMARY KEY NOT NULL,
+     sha256 TEXT NOT NULL UNIQUE,
+     picture BYTEA);
 
 CREATE TABLE mangasampledb.anime
     (pk SERIAL PRIMARY KEY NOT NULL,
@@ -67,3 +76,8 @@ ALTER TABLE ONLY mangasampledb.character
     ADD CONSTRAINT anime_fk FOREIGN KEY (anime_pk)
     REFERENCES mangasampledb.anime(pk)
     ON UPDATE CASCADE ON DELETE CASCADE;
+
+ALTER TABLE ONLY mangasampledb.character
+    ADD CONSTRAINT picture_fk FOREIGN KEY (picture_pk)
+    REFERENCES mangasampledb.character_picture(pk)
+    ON UPDATE CASCADE ON DELETE SET NULL;
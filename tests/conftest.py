@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+conftest.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Fixtures for the tests. Tests that need a database use the server given by
+the MANGASAMPLEDB_TEST_DB, MANGASAMPLEDB_TEST_USER, MANGASAMPLEDB_TEST_HOST,
+and MANGASAMPLEDB_TEST_PORT environment variables, and are skipped if it
+cannot be reached. Each test session works in its own schema, which is
+dropped at the end. Tests that need the mangasampledb schema create it from
+schemas/mangaSampleDB.sql and drop it when they finish, so they are skipped
+if the test database already has one.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import uuid
+
+import pytest
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'python'))
+
+
+@pytest.fixture(scope='session')
+def engine():
+    """Returns an engine connected to the test database."""
+
+    from mangaSampleDB.utils.connection import create_connection
+
+    engine = create_connection(
+        os.environ.get('MANGASAMPLEDB_TEST_DB', 'manga_test'),
+        username=os.environ.get('MANGASAMPLEDB_TEST_USER', 'manga'),
+        host=os.environ.get('MANGASAMPLEDB_TEST_HOST', 'localhost'),
+        port=int(os.environ.get('MANGASAMPLEDB_TEST_PORT', 5432)))
+
+    try:
+        engine.connect().close()
+    except Exception as ee:
+        pytest.skip('cannot connect to the test database: {0}'.format(ee))
+
+    yield engine
+
+    engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def schema(engine):
+    """Creates a scratch schema for the session and returns its name."""
+
+    schemaName = 'test_{0}'.format(uuid.uuid4().hex[:8])
+    engine.execute('CREATE SCHEMA {0};'.format(schemaName))
+
+    yield schemaName
+
+    engine.execute('DROP SCHEMA {0} CASCADE;'.format(schemaName))
+
+
+schemaFile = os.path.join(os.path.dirname(__file__), '..', 'schemas',
+                          'mangaSampleDB.sql')
+
+
+@pytest.fixture
+def sampleDB(engine):
+    """Creates an empty mangasampledb schema for a test."""
+
+    from mangaSampleDB.lookup import invalidateCaches
+
+    if engine.execute('SELECT count(*) FROM pg_namespace '
+                      'WHERE nspname = %s;', ('mangasampledb', )).scalar():
+        pytest.skip('the test database already has a mangasampledb schema.')
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(open(schemaFile, 'rb').read())
+        cursor.execute('RESET search_path;')
+        connection.commit()
+    finally:
+        connection.close()
+
+    invalidateCaches()
+
+    yield engine
+
+    invalidateCaches()
+    engine.execute('DROP SCHEMA mangasampledb CASCADE;')
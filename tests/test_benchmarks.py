@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_benchmarks.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+from mangaSampleDB.benchmarks.runner import (compareReports,
+                                             formatComparison, formatReport)
+
+
+def _report(wallTime, rowsPerSecond):
+    return {'stages': {'loadMangaTargets': {
+        'rows': 100, 'wall_time': wallTime, 'wall_times': [wallTime],
+        'rows_per_second': rowsPerSecond, 'peak_rss_mb': 50.,
+        'baseline_rss_mb': 40.}}}
+
+
+def test_zero_wall_time():
+    """A stage that took no measurable time has no rows per second."""
+
+    report = json.loads(json.dumps(_report(0., None)))
+
+    lines = formatReport(report).splitlines()
+    assert lines[1].split() == ['loadMangaTargets', '100', '0.000', 'n/a',
+                                '50.0']
+
+    assert formatReport(_report(2., 50.)).splitlines()[1].split()[3] == \
+        '50.0'
+
+    comparison = compareReports(report, _report(2., 50.))
+    assert comparison[0]['rows_per_second_change'] is None
+    assert comparison[0]['wall_time_change'] is None
+    assert not comparison[0]['regression']
+
+    comparison = compareReports(_report(2., 50.), report)
+    assert comparison[0]['rows_per_second_change'] is None
+    assert comparison[0]['wall_time_change'] == -1.
+    assert '-100.0%' in formatComparison(comparison)
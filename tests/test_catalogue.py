@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_catalogue.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from astropy import table
+
+from mangaSampleDB.utils import catalogue as catalogueModule
+from mangaSampleDB.utils.catalogue import firstMatchIndices, ingestCatalogue
+
+
+nTargets = 100
+
+
+@pytest.fixture
+def files(sampleDB, tmpdir):
+    """Loads the targets and writes a catalogue and its match files.
+
+    Returns a function that writes a catalogue in which the ``value`` column
+    is ``offset`` plus the row number.
+
+    """
+
+    sampleDB.execute('INSERT INTO mangasampledb.manga_target (mangaid) '
+                     'SELECT \'1-\' || ii FROM generate_series(0, %s) AS ii;',
+                     (nTargets - 1, ))
+
+    match = table.Table([['1-{0}'.format(ii) for ii in range(nTargets)],
+                         np.arange(nTargets) * 3],
+                        names=['mangaid', 'nsaid'], dtype=['S20', int])
+    match.write(str(tmpdir.join('match.fits')))
+    tmpdir.join('match.txt').write('test match\n')
+
+    def writeCatalogue(offset):
+        nRows = 2 * nTargets
+        catalogue = table.Table(
+            [np.arange(nRows) * 3, np.arange(nRows) + offset],
+            names=['NSAID', 'VALUE'])
+        path = str(tmpdir.join('catalogue_{0}.fits'.format(offset)))
+        catalogue.write(path, overwrite=True)
+        return path
+
+    return writeCatalogue, (str(tmpdir.join('match.fits')),
+                            str(tmpdir.join('match.txt')))
+
+
+def _firstMatchLoop(keys, values):
+    """Finds the first match of each value as the original loop did."""
+
+    keys = np.array([key.decode() if isinstance(key, bytes) else key
+                     for key in keys])
+
+    indices = []
+    for value in values:
+        if isinstance(value, bytes):
+            value = value.decode()
+        if value not in keys:
+            indices.append(-1)
+        else:
+            indices.append(np.where(keys == value)[0][0])
+
+    return np.array(indices, dtype=int)
+
+
+@pytest.mark.parametrize('keys, values', [
+    ([5, 3, 5, 1, 3, 9], [3, 5, 7, 1, 9, 0, 10, 3]),
+    ([10, 20], [30, 5, 15]),
+    ([], [1, 2]),
+    ([1, 2], []),
+    (['1-3', '1-1', '1-3', '12-7'], [b'1-3', b'12-7', b'1-2', b'1-1']),
+    (np.array([b'a', b'c', b'b', b'a']), ['b', 'a', 'd', 'c'])])
+def test_first_match_indices(keys, values):
+    """The sorted index returns the first match, like the original loop."""
+
+    indices = firstMatchIndices(keys, values)
+
+    assert indices.dtype.kind == 'i'
+    assert indices.tolist() == _firstMatchLoop(keys, values).tolist()
+
+
+def test_first_match_indices_random():
+
+    rng = np.random.RandomState(5)
+    keys = rng.randint(0, 300, 500)
+    values = rng.randint(-10, 350, 1000)
+
+    assert firstMatchIndices(keys, values).tolist() == \
+        _firstMatchLoop(keys, values).tolist()
+
+
+def _objects(engine):
+    """Returns the relations and constraints in mangasampledb."""
+
+    relations = dict(engine.execute(
+        'SELECT relname, relpersistence FROM pg_class AS cls '
+        'JOIN pg_namespace AS nsp ON nsp.oid = cls.relnamespace '
+        'WHERE nsp.nspname = %s;', ('mangasampledb', )).fetchall())
+    constraints = set(row[0] for row in engine.execute(
+        'SELECT conname FROM pg_constraint AS con '
+        'JOIN pg_namespace AS nsp ON nsp.oid = con.connamespace '
+        'WHERE nsp.nspname = %s;', ('mangasampledb', )).fetchall())
+
+    return relations, constraints
+
+
+def _current(engine, catname):
+    return engine.execute(
+        'SELECT cat.version FROM mangasampledb.current_catalogue AS current '
+        'JOIN mangasampledb.catalogue AS cat '
+        'ON cat.pk = current.catalogue_pk '
+        'WHERE cat.catalogue_name = %s;', (catname, )).fetchall()
+
+
+def _values(engine):
+    return [row[0] for row in engine.execute(
+        'SELECT value FROM mangasampledb.current_testcat '
+        'ORDER BY manga_target_pk;').fetchall()]
+
+
+def test_swap_reload(sampleDB, files):
+    """Reloading with swap=True leaves logged tables with the final names."""
+
+    writeCatalogue, match = files
+
+    for version, offset in [('v1', 0), ('v1', 1000), ('v2', 2000)]:
+
+        ingestCatalogue(writeCatalogue(offset), 'testcat', version, sampleDB,
+                        match=match, swap=True)
+
+        relations, constraints = _objects(sampleDB)
+
+        for name in ['testcat', 'testcat_pkey', 'testcat_pk_seq',
+                     'testcat_nsaid_idx', 'testcat_catalogue_pk_idx',
+                     'manga_target_to_testcat', 'manga_target_to_testcat_pkey',
+                     'manga_target_to_testcat_pk_seq', 'current_testcat']:
+            assert name in relations
+            assert relations[name] == 'p'
+
+        for name in ['testcat_pkey', 'manga_target_to_testcat_pkey',
+                     'manga_target_to_testcat_manga_target_pk_fkey',
+                     'manga_target_to_testcat_testcat_pk_fkey']:
+            assert name in constraints
+
+        assert not any('shadow' in name for name in relations)
+        assert not any('shadow' in name for name in constraints)
+
+        assert _current(sampleDB, 'testcat') == [('v2', )] \
+            if version == 'v2' else [('v1', )]
+
+        # Only the current version is in the view, once per target.
+        values = _values(sampleDB)
+        assert len(values) == nTargets
+        assert values[0] == offset
+
+    # The swap replaces the table, which only has the rows of the last load.
+    assert sampleDB.execute('SELECT count(*) FROM mangasampledb.testcat;'
+                            ).scalar() == 2 * nTargets
+
+
+def test_swap_failure(sampleDB, files, monkeypatch):
+    """A failure during the swap leaves the old catalogue in place."""
+
+    writeCatalogue, match = files
+
+    ingestCatalogue(writeCatalogue(0), 'testcat', 'v1', sampleDB,
+                    match=match, swap=True)
+    relationsBefore, constraintsBefore = _objects(sampleDB)
+
+    # Fails after the tables have been renamed and the current version
+    # changed, while recreating the view.
+    def fail(cursor, catname):
+        raise RuntimeError('failed swap')
+
+    monkeypatch.setattr(catalogueModule, 'getCatalogueColumns', fail)
+
+    with pytest.raises(RuntimeError, match='failed swap'):
+        ingestCatalogue(writeCatalogue(1000), 'testcat', 'v2', sampleDB,
+                        match=match, swap=True)
+
+    relations, constraints = _objects(sampleDB)
+
+    # The shadow tables are left behind, unlogged, for inspection.
+    shadows = set(name for name in relations if 'shadow' in name)
+    assert 'testcat_shadow' in shadows
+    assert relations['testcat_shadow'] == 'u'
+    assert dict((name, persistence)
+                for name, persistence in relations.items()
+                if name not in shadows) == relationsBefore
+    assert set(name for name in constraints
+               if 'shadow' not in name) == constraintsBefore
+
+    assert _current(sampleDB, 'testcat') == [('v1', )]
+    assert _values(sampleDB)[0] == 0
+
+    # The record of the new version is only added by a successful swap.
+    assert sampleDB.execute('SELECT count(*) FROM mangasampledb.catalogue '
+                            'WHERE version = %s;', ('v2', )).scalar() == 0
+
+    # The next load removes the shadow tables.
+    monkeypatch.undo()
+    ingestCatalogue(writeCatalogue(2000), 'testcat', 'v2', sampleDB,
+                    match=match, swap=True)
+
+    relations, constraints = _objects(sampleDB)
+    assert not any('shadow' in name for name in relations)
+    assert _current(sampleDB, 'testcat') == [('v2', )]
+    assert _values(sampleDB)[0] == 2000
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_characters.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import pytest
+
+from mangaSampleDB.benchmarks.synthetic import makeCharacters
+from mangaSampleDB.utils import characters as charactersModule
+from mangaSampleDB.utils.characters import loadMangaCharacters
+
+
+def _count(engine, tableName):
+    return engine.execute('SELECT count(*) FROM mangasampledb.{0};'
+                          .format(tableName)).scalar()
+
+
+@pytest.mark.parametrize('dedupe', [False, True])
+def test_bulk_batches(sampleDB, tmpdir, monkeypatch, dedupe):
+    """Each batch is committed, so a failed load can be run again."""
+
+    listPath = str(tmpdir.join('characters.dat'))
+    imageDir = str(tmpdir.join('images'))
+    makeCharacters(listPath, imageDir, 7, imageSize=100)
+
+    readImage = charactersModule._readImage
+
+    def failingReadImage(imagePath):
+        if os.path.basename(imagePath) == 'image4.jpg':
+            raise IOError('cannot read image')
+        return readImage(imagePath)
+
+    monkeypatch.setattr(charactersModule, '_readImage', failingReadImage)
+
+    with pytest.raises(IOError, match='cannot read image'):
+        loadMangaCharacters(listPath, imageDir, sampleDB, bulk=True,
+                            batchSize=2, dedupe=dedupe, nThreads=1)
+
+    # The first two batches are kept, with the pictures they use.
+    assert _count(sampleDB, 'character') == 4
+    assert _count(sampleDB, 'character_picture') == (4 if dedupe else 0)
+
+    monkeypatch.setattr(charactersModule, '_readImage', readImage)
+
+    assert loadMangaCharacters(listPath, imageDir, sampleDB, bulk=True,
+                               batchSize=2, dedupe=dedupe)
+
+    assert _count(sampleDB, 'character') == 7
+    assert _count(sampleDB, 'character_picture') == (7 if dedupe else 0)
+    assert sampleDB.execute(
+        'SELECT count(DISTINCT name) FROM mangasampledb.character;'
+    ).scalar() == 7
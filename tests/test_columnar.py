@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_columnar.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Parses canned COPY output with a fake cursor, without a database.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+import sqlalchemy as sql
+from sqlalchemy.dialects import postgresql
+
+from mangaSampleDB.columnar import _copyColumns, _parseArrayLiteral
+
+
+class FakeCursor(object):
+    """Writes the COPY output to the sink in pieces of ``pieceSize``."""
+
+    def __init__(self, output, pieceSize):
+        self.output = output
+        self.pieceSize = pieceSize
+        self.closed = False
+
+    def mogrify(self, statement, params):
+        return statement.encode()
+
+    def copy_expert(self, statement, sink):
+        assert statement.startswith('COPY (SELECT')
+        for start in range(0, len(self.output), self.pieceSize):
+            sink.write(self.output[start:start + self.pieceSize])
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeEngine(object):
+
+    dialect = postgresql.dialect()
+
+    def __init__(self, output, pieceSize):
+        self.cursor = FakeCursor(output, pieceSize)
+
+    def raw_connection(self):
+        return FakeConnection(self.cursor)
+
+
+columns = [('id', sql.column('id', sql.Integer)),
+           ('arr1', sql.column('arr1', postgresql.ARRAY(sql.REAL))),
+           ('arr2', sql.column('arr2', postgresql.ARRAY(sql.Integer))),
+           ('names', sql.column('names', postgresql.ARRAY(sql.Text))),
+           ('flags', sql.column('flags', postgresql.ARRAY(sql.Boolean))),
+           ('value', sql.column('value', sql.Float))]
+
+# The first row is all NULL, so the shapes of the arrays are only known
+# from the next blocks. Backslashes are escaped in the COPY text format.
+output = ('1\t\\N\t\\N\t\\N\t\\N\t\\N\n'
+          '2\t{1.5,NULL,3}\t{{1,2},{3,4}}\t{"a,b","c\\\\"d",NULL,"NULL"}\t'
+          '{t,f}\t2.5\n'
+          '3\t{4,5,6}\t{{5,6},{7,8}}\t{x,"y z","tab\\tq","{}"}\t'
+          '{f,NULL}\t\\N\n')
+
+
+def _copy(output, pieceSize=7, blockSize=1, asTable=True, columns=columns):
+
+    engine = FakeEngine(output, pieceSize)
+    query = sql.select([expression for __, expression in columns])
+
+    result = _copyColumns(engine, query, columns, asTable=asTable,
+                          blockSize=blockSize)
+    assert engine.cursor.closed
+
+    return result
+
+
+@pytest.mark.parametrize('pieceSize, blockSize', [(7, 1), (1, 1),
+                                                  (1000, 1 << 24),
+                                                  (50, 60)])
+def test_copy_sink(pieceSize, blockSize):
+    """Arrays and NULLs are parsed the same way in any block size."""
+
+    result = _copy(output, pieceSize=pieceSize, blockSize=blockSize)
+
+    assert list(result['id']) == [1, 2, 3]
+
+    assert result['arr1'].dtype == np.dtype('f4')
+    assert result['arr1'].shape == (3, 3)
+    assert result['arr1'].mask[:, 0].tolist() == [True, False, False]
+    assert np.array_equal(result['arr1'].data[1:],
+                          [[1.5, np.nan, 3], [4, 5, 6]], equal_nan=True)
+
+    assert result['arr2'].shape == (3, 2, 2)
+    assert result['arr2'].data[1:].tolist() == [[[1, 2], [3, 4]],
+                                                [[5, 6], [7, 8]]]
+
+    assert result['names'].data[1:].tolist() == [['a,b', 'c"d', '', 'NULL'],
+                                                 ['x', 'y z', 'tab\tq', '{}']]
+
+    assert result['flags'].data[1:].tolist() == [[True, False],
+                                                 [False, False]]
+
+    assert result['value'].mask.tolist() == [True, False, True]
+    assert result['value'][1] == 2.5
+
+
+def test_copy_sink_array():
+    """Without a table, NULLs are NaN, zero or empty."""
+
+    result = _copy(output, asTable=False)
+
+    assert result.dtype['arr2'].shape == (2, 2)
+    assert np.isnan(result['arr1'][0]).all()
+    assert result['arr2'][0].tolist() == [[0, 0], [0, 0]]
+    assert result['names'][0].tolist() == ['', '', '', '']
+    assert np.isnan(result['value'][[0, 2]]).all()
+
+
+def test_copy_sink_empty():
+
+    result = _copy('', asTable=False)
+
+    assert len(result) == 0
+    assert result.dtype.names == tuple(name for name, __ in columns)
+
+
+@pytest.mark.parametrize('rows', [
+    ['{{1,2},{3}}'],
+    ['{1,2}', '{1,2,3}'],
+    ['{{1,2},{3,4}}', '{1,2,3,4}']])
+def test_copy_sink_shapes(rows):
+    """Arrays that are not rectangular or change shape are rejected."""
+
+    arrayColumns = [('arr', sql.column('arr', postgresql.ARRAY(sql.Integer)))]
+
+    with pytest.raises(ValueError, match='array'):
+        _copy(''.join(row + '\n' for row in rows), columns=arrayColumns)
+
+
+@pytest.mark.parametrize('literal, elements, shape', [
+    ('{}', [], (0, )),
+    ('{a,NULL,"NULL"}', ['a', None, 'NULL'], (3, )),
+    ('{{"a}","b\\\\c"},{"","d\\"e"}}', ['a}', 'b\\c', '', 'd"e'], (2, 2))])
+def test_parse_array_literal(literal, elements, shape):
+
+    assert _parseArrayLiteral(literal) == (elements, shape)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_crawler.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Runs the character crawler against a local stand-in for the site.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import collections
+import os
+
+import pytest
+
+from astropy import table
+
+aiohttp = pytest.importorskip('aiohttp')
+pytest.importorskip('bs4')
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from mangaSampleDB.utils.crawler import crawlCharacters  # noqa: E402
+
+
+NPAGES = 3
+
+# (identifier, name, manga, image). Each page has two characters.
+characters = {
+    1: [('alice', 'Alice Liddell', 'Wonderland', 'alice.jpg'),
+        ('bob', 'Bob Builder', 'Construction', 'bob.jpg')],
+    2: [('carol', 'Carol Danvers', 'Marvel', 'carol.jpg'),
+        ('broken', 'Broken Image', 'Marvel', 'broken.jpg')],
+    3: [('dave', 'Dave Lister', 'Red Dwarf', 'dave.jpg'),
+        ('alice', 'Alice Again', 'Wonderland', 'alice2.jpg')]}
+
+rowTemplate = ('<tr><td><a href="/characters/{0}"><img src="/images/{3}">'
+               '</a></td><td><a href="/characters/{0}">{1}</a></td>'
+               '<td><a href="/anime/x">{2}</a></td><td></td></tr>')
+
+
+class StandIn(object):
+    """A stand-in for the character list, with failures on demand."""
+
+    def __init__(self):
+
+        self.requests = collections.Counter()
+        self.failures = collections.Counter()
+
+    def makeApp(self):
+        """Returns a new application. Each event loop needs its own."""
+
+        app = web.Application()
+        app.router.add_get('/characters/all', self.page)
+        app.router.add_get('/images/{name}', self.image)
+
+        return app
+
+    async def page(self, request):
+
+        page = int(request.query['page'])
+        self.requests[page] += 1
+
+        if self.failures[page] > 0:
+            self.failures[page] -= 1
+            raise web.HTTPInternalServerError()
+
+        rows = ''.join(rowTemplate.format(*character)
+                       for character in characters[page])
+
+        return web.Response(
+            text='<table><tbody>{0}</tbody></table>'.format(rows),
+            content_type='text/html')
+
+    async def image(self, request):
+
+        name = request.match_info['name']
+        self.requests[name] += 1
+
+        if name == 'broken.jpg':
+            raise web.HTTPNotFound()
+
+        return web.Response(body=name.encode())
+
+
+def crawl(standIn, tmpdir):
+    """Crawls the stand-in and returns the character database."""
+
+    databaseName = str(tmpdir.join('characters.dat'))
+
+    async def run():
+        async with TestServer(standIn.makeApp()) as server:
+            baseUrl = str(server.make_url('')).rstrip('/')
+            await crawlCharacters(databaseName=databaseName,
+                                  imagesDir=str(tmpdir.join('images')),
+                                  baseUrl=baseUrl, nPages=NPAGES,
+                                  concurrency=2, retries=2, retryDelay=0.01,
+                                  verbose=False)
+
+    asyncio.run(run())
+
+    return table.Table.read(databaseName, format='ascii.fixed_width')
+
+
+def test_retry_on_failure(tmpdir):
+
+    standIn = StandIn()
+    standIn.failures[2] = 1
+
+    database = crawl(standIn, tmpdir)
+
+    assert standIn.requests[2] == 2
+    assert list(database['ID']) == [1, 2, 3, 4]
+    assert list(database['identifier']) == ['alice', 'bob', 'carol', 'dave']
+
+    # The broken image is retried, then the character is skipped without
+    # using an ID.
+    assert standIn.requests['broken.jpg'] == 2
+    assert not os.path.exists(str(tmpdir.join('images', 'broken.jpg')))
+    assert os.path.exists(str(tmpdir.join('images', 'dave.jpg')))
+
+
+def test_resume_from_checkpoint(tmpdir):
+
+    standIn = StandIn()
+    standIn.failures[2] = 2
+
+    database = crawl(standIn, tmpdir)
+
+    assert list(database['identifier']) == ['alice', 'bob', 'dave']
+    assert os.path.exists(str(tmpdir.join('characters.log')))
+
+    # Only the page that failed is fetched again.
+    database = crawl(standIn, tmpdir)
+
+    assert standIn.requests[1] == 1
+    assert standIn.requests[2] == 3
+    assert standIn.requests[3] == 1
+    assert list(database['ID']) == [1, 2, 3, 4]
+    assert list(database['identifier']) == ['alice', 'bob', 'dave', 'carol']
+    assert list(database['page']) == [1, 1, 3, 2]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_crossmatch.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+pytest.importorskip('scipy')
+
+from mangaSampleDB.utils.crossmatch import crossMatch  # noqa: E402
+
+
+def _separation(ra1, dec1, ra2, dec2):
+    """Returns the angular separation in arcsec, using the haversine."""
+
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+
+    hav = (np.sin((dec2 - dec1) / 2.) ** 2 +
+           np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2.) ** 2)
+
+    return np.degrees(2 * np.arcsin(np.sqrt(hav))) * 3600.
+
+
+def _bruteForce(ra, dec, catalogueRA, catalogueDec, radius):
+    """Matches each target to the nearest (and then first) object."""
+
+    indices = np.full(len(ra), -1)
+    separations = np.full(len(ra), np.inf)
+
+    for ii in range(len(ra)):
+        sep = _separation(ra[ii], dec[ii], catalogueRA, catalogueDec)
+        nearest = np.argmin(sep)
+        if sep[nearest] <= radius:
+            indices[ii] = nearest
+            separations[ii] = sep[nearest]
+
+    return indices, separations
+
+
+@pytest.fixture
+def points():
+    """Targets and nearby objects, half of them across RA=0/360."""
+
+    rng = np.random.RandomState(13)
+    nPoints = 100
+
+    ra = np.where(np.arange(nPoints) % 2 == 0,
+                  rng.uniform(-0.0005, 0.0005, nPoints) % 360.,
+                  rng.uniform(10., 10.01, nPoints))
+    dec = rng.uniform(-0.005, 0.005, nPoints)
+
+    # Objects within about two arcsec of the targets, in random order.
+    order = rng.permutation(nPoints)
+    catalogueRA = (ra[order] +
+                   rng.uniform(-2., 2., nPoints) / 3600.) % 360.
+    catalogueDec = dec[order] + rng.uniform(-2., 2., nPoints) / 3600.
+
+    return ra, dec, catalogueRA, catalogueDec
+
+
+@pytest.mark.parametrize('chunkSize', [1, 7, 50, 100, 1000])
+@pytest.mark.parametrize('radius', [0.5, 1., 3.])
+def test_brute_force(points, chunkSize, radius):
+    """The chunked KD-tree match is the same as a brute-force one."""
+
+    ra, dec, catalogueRA, catalogueDec = points
+
+    indices, separations = crossMatch(ra, dec, catalogueRA, catalogueDec,
+                                      radius=radius, chunkSize=chunkSize)
+    expectedIndices, expectedSeparations = _bruteForce(
+        ra, dec, catalogueRA, catalogueDec, radius)
+
+    # The offsets are at most 2.83 arcsec, so all targets match at 3.
+    assert np.any(expectedIndices >= 0)
+    assert np.any(expectedIndices < 0) == (radius < 3)
+    assert indices.tolist() == expectedIndices.tolist()
+    assert np.allclose(separations, expectedSeparations, rtol=0,
+                       atol=1e-6)
+
+
+def test_ra_wrap():
+    """Objects across RA=0/360 from a target are matched."""
+
+    indices, separations = crossMatch(
+        [359.9999, 0.0001], [0., 0.], [0.0001, 359.9999, 180.], [0., 0., 0.],
+        radius=1.)
+
+    assert indices.tolist() == [1, 0]
+    assert np.allclose(separations, [0., 0.], atol=1e-6)
+
+    indices, separations = crossMatch([359.9999], [0.], [0.0001], [0.],
+                                      radius=1.)
+
+    assert indices.tolist() == [0]
+    assert np.allclose(separations, [0.72], atol=1e-6)
+
+
+def test_radius_limit():
+    """Objects just inside the radius are matched and outside are not."""
+
+    radius = 2.
+    offsets = np.array([0.999, 1.001]) * radius / 3600.
+
+    indices, separations = crossMatch([45., 45.], [30., -30.],
+                                      [45., 45.], [30. + offsets[0],
+                                                   -30. + offsets[1]],
+                                      radius=radius)
+
+    assert indices.tolist() == [0, -1]
+    assert np.isclose(separations[0], 0.999 * radius, atol=1e-6)
+    assert np.isinf(separations[1])
+
+
+@pytest.mark.parametrize('chunkSize', [1, 2, 3, 10])
+def test_ties_across_chunks(chunkSize):
+    """Ties are resolved in favour of the first object, in any chunk."""
+
+    indices, __ = crossMatch([20.], [20.], [21., 20., 20., 20.],
+                             [20., 20. + 1 / 3600., 20. - 1 / 3600., 20.],
+                             radius=1.5, chunkSize=chunkSize)
+
+    assert indices.tolist() == [3]
+
+    indices, __ = crossMatch([20.], [20.], [21., 20., 20.],
+                             [20., 20. + 0.5 / 3600., 20. + 0.5 / 3600.],
+                             radius=1.5, chunkSize=chunkSize)
+
+    assert indices.tolist() == [1]
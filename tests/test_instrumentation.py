@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_instrumentation.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import types
+
+import pytest
+
+from mangaSampleDB.utils import instrumentation
+from mangaSampleDB.utils.instrumentation import (Metrics, addMetricsCallback,
+                                                 measure,
+                                                 removeMetricsCallback)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the time used by the metrics with one set by the tests."""
+
+    now = [100.]
+    monkeypatch.setattr(instrumentation, 'time', types.SimpleNamespace(
+        time=lambda: now[0]))
+
+    return now
+
+
+@pytest.fixture
+def events():
+    """Collects the events sent to the global callbacks."""
+
+    received = []
+    addMetricsCallback(received.append)
+    # Adding a callback twice does not send the events twice.
+    addMetricsCallback(received.append)
+
+    yield received
+
+    removeMetricsCallback(received.append)
+
+
+def test_nested_stages(clock, events):
+    """Nested stages are recorded when they end, with their own times."""
+
+    loadEvents = []
+    metrics = Metrics('load', callback=loadEvents.append)
+
+    with measure(metrics, 'outer', rows=10) as outer:
+        clock[0] += 1
+        for ii in range(2):
+            with measure(metrics, 'inner', level=logging.DEBUG) as inner:
+                clock[0] += 2
+                inner['rows'] = 4
+                inner['bytes'] = 1024 ** 2
+                inner['chunk'] = ii
+        outer['rows'] += 10
+
+    assert events == loadEvents
+    assert [(event['stage'], event['duration']) for event in events] == \
+        [('inner', 2.), ('inner', 2.), ('outer', 5.)]
+    assert events[0]['load'] == 'load'
+    assert events[1]['chunk'] == 1
+    assert events[1]['rows_per_second'] == 2.
+    assert events[2]['rows'] == 20
+    assert events[2]['rows_per_second'] == 4.
+
+    summary = metrics.finish()
+    assert list(summary) == ['inner', 'outer']
+    assert summary['inner'] == {'calls': 2, 'duration': 4., 'rows': 8,
+                                'bytes': 2 * 1024 ** 2,
+                                'rows_per_second': 2.}
+
+    assert events[-1]['event'] == 'summary'
+    assert events[-1]['stages'] == summary
+    assert events[-1]['duration'] == 5.
+    assert loadEvents[-1] == events[-1]
+
+    report = metrics.report().splitlines()
+    assert report[1].split() == ['inner', '2', '4.000', '8', '2.00', '2.0']
+    assert report[3].split() == ['total', '5.000']
+
+
+def test_stage_exception(clock, events):
+    """A stage that raises is recorded, and the exception propagates."""
+
+    metrics = Metrics('load')
+
+    with pytest.raises(ValueError):
+        with measure(metrics, 'failing'):
+            clock[0] += 3
+            raise ValueError('stage failed')
+
+    assert events[0]['stage'] == 'failing'
+    assert events[0]['duration'] == 3.
+    assert events[0]['rows'] is None
+    assert events[0]['rows_per_second'] is None
+
+    assert metrics.summary()['failing']['calls'] == 1
+    assert metrics.report().splitlines()[1].split()[-3:] == ['-', '-', '-']
+
+
+def test_no_metrics(events):
+    """Without metrics, measure yields the record but sends nothing."""
+
+    with measure(None, 'stage', rows=5) as record:
+        record['rows'] += 1
+
+    assert record == {'rows': 6, 'bytes': None}
+    assert events == []
+
+
+def test_zero_duration(clock, events):
+
+    metrics = Metrics('load')
+    metrics.record('instant', 0., rows=10)
+
+    assert events[0]['rows_per_second'] is None
+    assert metrics.summary()['instant']['rows_per_second'] is None
+
+
+def test_logging(clock, caplog):
+
+    metrics = Metrics('load')
+
+    with caplog.at_level(logging.INFO, logger='mangaSampleDB.ingestion'):
+        with measure(metrics, 'chunk', rows=1, level=logging.DEBUG):
+            clock[0] += 1
+        with measure(metrics, 'stage', rows=10):
+            clock[0] += 2
+
+    assert [record.getMessage() for record in caplog.records] == \
+        ['load: stage took 2.000 s (rows=10, bytes=None, rows/s=5.0)']
+    assert caplog.records[0].metrics['stage'] == 'stage'
+
+
+def test_remove_callback(clock):
+
+    received = []
+    addMetricsCallback(received.append)
+    removeMetricsCallback(received.append)
+    removeMetricsCallback(received.append)
+
+    Metrics('load').record('stage', 1.)
+
+    assert received == []
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_lookup.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import types
+
+import numpy as np
+import pytest
+
+from astropy import table
+
+from mangaSampleDB import lookup
+from mangaSampleDB.lookup import CatalogueCache, getTargets
+from mangaSampleDB.utils.catalogue import ingestCatalogue
+
+
+nTargets = 10
+
+
+@pytest.fixture
+def load(sampleDB, tmpdir):
+    """Returns a function that loads a version of the ``testcat`` catalogue.
+
+    Targets ``1-0`` to ``1-7`` are matched to the rows with the same
+    ``nsaid``, in which ``value`` is ``offset`` plus the ``nsaid``. Targets
+    ``1-8`` and ``1-9`` are not matched.
+
+    """
+
+    sampleDB.execute('INSERT INTO mangasampledb.manga_target (mangaid) '
+                     'SELECT \'1-\' || ii FROM generate_series(0, %s) AS ii;',
+                     (nTargets - 1, ))
+
+    matchFile = str(tmpdir.join('match.fits'))
+    table.Table([['1-{0}'.format(ii) for ii in range(8)], np.arange(8)],
+                names=['mangaid', 'nsaid'], dtype=['S20', int]).write(
+        matchFile)
+    tmpdir.join('match.txt').write('test match\n')
+    match = (matchFile, str(tmpdir.join('match.txt')))
+
+    def loadCatalogue(version, offset, swap=False, extra=False):
+        catalogue = table.Table([np.arange(nTargets),
+                                 np.arange(nTargets) + offset],
+                                names=['NSAID', 'VALUE'])
+        if extra:
+            catalogue['EXTRA'] = np.zeros(nTargets)
+        path = str(tmpdir.join('catalogue_{0}.fits'.format(offset)))
+        catalogue.write(path, overwrite=True)
+        ingestCatalogue(path, 'testcat', version, sampleDB, match=match,
+                        swap=swap, overwrite=not swap)
+
+    return loadCatalogue
+
+
+def _addMatch(engine, mangaid, nsaid):
+    """Matches a target to another row of the current catalogue."""
+
+    engine.execute(
+        'INSERT INTO mangasampledb.manga_target_to_testcat '
+        '(manga_target_pk, testcat_pk) '
+        'SELECT target.pk, cat.pk FROM mangasampledb.manga_target AS target, '
+        'mangasampledb.testcat AS cat '
+        'JOIN mangasampledb.current_catalogue AS current '
+        'ON current.catalogue_pk = cat.catalogue_pk '
+        'WHERE target.mangaid = %s AND cat.nsaid = %s;', (mangaid, nsaid))
+
+
+@pytest.mark.parametrize('copyThreshold', [0, 1000])
+def test_get_targets(sampleDB, load, copyThreshold):
+    """The COPY and unnest paths keep the input order and duplicates."""
+
+    load('v1', 100)
+    _addMatch(sampleDB, '1-0', 9)
+
+    mangaids = ['1-3', '1-9', 'nope', '1-3', ' 1-0', '1-5']
+
+    result = getTargets(mangaids, catalogue='testcat',
+                        columns=['nsaid', 'value'], engine=sampleDB,
+                        copyThreshold=copyThreshold)
+
+    assert list(result['mangaid']) == ['1-3', '1-9', 'nope', '1-3', '1-0',
+                                       '1-0', '1-5']
+    assert list(result['found']) == [True, True, False, True, True, True,
+                                     True]
+    assert list(result['matched']) == [True, False, False, True, True, True,
+                                       True]
+    assert result['value'].mask.tolist() == [False, True, True, False, False,
+                                             False, False]
+    assert list(result['value'][~result['value'].mask]) == [103, 103, 100,
+                                                            109, 105]
+    assert result['manga_target_pk'].mask.tolist()[2]
+
+    array = getTargets(mangaids, catalogue='testcat', engine=sampleDB,
+                       asTable=False, copyThreshold=copyThreshold)
+
+    assert array.dtype.names[:4] == ('mangaid', 'found', 'matched',
+                                     'manga_target_pk')
+    assert set(array.dtype.names[4:]) == set(['pk', 'catalogue_pk', 'nsaid',
+                                              'value'])
+    assert len(array) == 7
+
+
+def test_get_targets_reload(sampleDB, load):
+    """A reload that changes the columns is picked up in the same process."""
+
+    load('v1', 100, swap=True, extra=True)
+    assert 'extra' in getTargets(['1-1'], catalogue='testcat',
+                                 engine=sampleDB).colnames
+
+    load('v1', 200, swap=True)
+    result = getTargets(['1-1'], catalogue='testcat', engine=sampleDB)
+
+    assert 'extra' not in result.colnames
+    assert list(result['value']) == [201]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the time used by the caches with one set by the tests."""
+
+    now = [1000.]
+    monkeypatch.setattr(lookup, 'time', types.SimpleNamespace(
+        time=lambda: now[0]))
+
+    return now
+
+
+def _value(rows):
+    return [row['value'] for row in rows]
+
+
+def test_cache_lru(sampleDB, load):
+
+    load('v1', 100)
+
+    cache = CatalogueCache(sampleDB, 'testcat', maxSize=2)
+
+    assert _value(cache.get('1-1')) == [101]
+    assert _value(cache.get('1-2')) == [102]
+    assert _value(cache.get('1-1')) == [101]
+    assert cache.get('1-9') == []
+
+    # 1-2 was the least recently used.
+    assert len(cache) == 2
+    assert '1-1' in cache and '1-9' in cache and '1-2' not in cache
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    cache.get('1-2')
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_cache_ttl(sampleDB, load, clock):
+
+    load('v1', 100)
+
+    cache = CatalogueCache(sampleDB, 'testcat', ttl=10)
+
+    cache.get('1-1')
+    clock[0] += 5
+    cache.get('1-1')
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    clock[0] += 6
+    assert '1-1' not in cache
+    cache.get('1-1')
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_state(sampleDB, load, clock):
+    """The cache is invalidated when the current catalogue changes."""
+
+    load('v1', 100)
+
+    cache = CatalogueCache(sampleDB, 'testcat', checkInterval=60)
+    assert _value(cache.get('1-1')) == [101]
+
+    # A reload in this process invalidates the cache straight away.
+    load('v1', 200, swap=True)
+    assert _value(cache.get('1-1')) == [201]
+
+    load('v2', 300, swap=True)
+    assert _value(cache.get('1-1')) == [301]
+    assert cache.misses == 3
+
+    # A change by another process, which updates the row version of
+    # current_catalogue, is seen after checkInterval.
+    sampleDB.execute('UPDATE mangasampledb.testcat SET value = -1;')
+    sampleDB.execute('UPDATE mangasampledb.current_catalogue '
+                     'SET catalogue_pk = catalogue_pk;')
+
+    clock[0] += 30
+    assert _value(cache.get('1-1')) == [301]
+
+    clock[0] += 31
+    assert _value(cache.get('1-1')) == [-1]
+
+
+def test_cache_disk(sampleDB, load, tmpdir):
+    """Entries are shared through the SQLite file until the state changes."""
+
+    load('v1', 100)
+
+    cacheFile = str(tmpdir.join('cache', 'lookup.sqlite'))
+
+    cache = CatalogueCache(sampleDB, 'testcat', cacheFile=cacheFile)
+    assert _value(cache.get('1-1')) == [101]
+    cache.close()
+
+    other = CatalogueCache(sampleDB, 'testcat', cacheFile=cacheFile)
+    sampleDB.execute('UPDATE mangasampledb.testcat SET value = -1;')
+
+    assert _value(other.get('1-1')) == [101]
+    assert (other.hits, other.misses) == (1, 0)
+
+    load('v1', 200, swap=True)
+
+    assert _value(other.get('1-1')) == [201]
+    assert (other.hits, other.misses) == (1, 1)
+
+    # The old entries have been removed from the file.
+    assert other._disk.execute('SELECT count(*) FROM lookup;'
+                               ).fetchone()[0] == 1
+
+    other.clear()
+    assert len(other) == 0
+    assert other._disk.execute('SELECT count(*) FROM lookup;'
+                               ).fetchone()[0] == 0
+    other.close()
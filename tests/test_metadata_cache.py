@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_metadata_cache.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+import types
+
+import pytest
+import sqlalchemy as sql
+
+from mangaSampleDB import metadata_cache
+
+
+@pytest.fixture
+def fakeEngine(tmpdir, monkeypatch):
+    """An engine-like object, with a fixed fingerprint and cache dir."""
+
+    monkeypatch.setenv('MANGASAMPLEDB_CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.delenv('MANGASAMPLEDB_NO_METADATA_CACHE', raising=False)
+    monkeypatch.setattr(metadata_cache, 'schemaFingerprint',
+                        lambda engine, schema: 'fingerprint')
+
+    url = types.SimpleNamespace(host='localhost', port=5432, database='test')
+
+    return types.SimpleNamespace(url=url)
+
+
+def _save(engine):
+
+    metadata = sql.MetaData()
+    sql.Table('manga_target', metadata,
+              sql.Column('pk', sql.Integer, primary_key=True),
+              schema='mangasampledb')
+
+    __, path = metadata_cache.loadCachedMetadata(engine)
+    metadata_cache.saveCachedMetadata(metadata, path,
+                                      tableNames=['manga_target'])
+
+    return path
+
+
+def test_round_trip(fakeEngine):
+
+    path = _save(fakeEngine)
+
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.stat(os.path.dirname(path)).st_mode & 0o077 == 0
+
+    metadata, __ = metadata_cache.loadCachedMetadata(fakeEngine)
+
+    assert list(metadata.tables) == ['mangasampledb.manga_target']
+    assert metadata.info['tableNames'] == ['manga_target']
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='needs os.getuid')
+def test_ignore_unsafe_cache(fakeEngine, monkeypatch):
+    """A cache that others can write, or owned by others, is not loaded."""
+
+    path = _save(fakeEngine)
+
+    def load():
+        with pytest.warns(UserWarning, match='ignoring cached metadata'):
+            metadata, cachePath = metadata_cache.loadCachedMetadata(
+                fakeEngine)
+        assert metadata is None
+        assert cachePath == path
+
+    os.chmod(path, 0o644)
+    load()
+
+    os.chmod(path, 0o600)
+    uid = os.getuid()
+    monkeypatch.setattr(os, 'getuid', lambda: uid + 1)
+    load()
+
+    # Symbolic links are not followed.
+    monkeypatch.setattr(os, 'getuid', lambda: uid)
+    os.rename(path, path + '.target')
+    os.symlink(path + '.target', path)
+    load()
+
+    # Saving replaces the file with a safe one.
+    os.remove(path)
+    _save(fakeEngine)
+    assert metadata_cache.loadCachedMetadata(fakeEngine)[0] is not None
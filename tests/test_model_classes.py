@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_model_classes.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Imports ModelClasses with a stand-in for the SDSS DatabaseConnection that
+uses the test engine, and counts the queries it runs.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import importlib
+import sys
+import types
+
+import pytest
+
+from sqlalchemy import event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+from mangaSampleDB.utils.views import createCurrentView
+
+
+catalogueSQL = """
+CREATE TABLE mangasampledb.{0} (
+    pk serial PRIMARY KEY, catalogue_pk integer, {0}id integer,
+    petroth50_el real[], petro_mass_el real, sersic_mass real);
+CREATE TABLE mangasampledb.manga_target_to_{0} (
+    pk serial PRIMARY KEY,
+    manga_target_pk integer REFERENCES mangasampledb.manga_target(pk),
+    {0}_pk integer REFERENCES mangasampledb.{0}(pk));
+INSERT INTO mangasampledb.catalogue (catalogue_name, version)
+    VALUES ('{0}', 'v1');
+INSERT INTO mangasampledb.current_catalogue (catalogue_pk)
+    SELECT pk FROM mangasampledb.catalogue WHERE catalogue_name = '{0}';
+INSERT INTO mangasampledb.{0} (catalogue_pk, {0}id)
+    SELECT pk, 7 FROM mangasampledb.catalogue WHERE catalogue_name = '{0}';
+INSERT INTO mangasampledb.manga_target_to_{0} (manga_target_pk, {0}_pk)
+    SELECT target.pk, cat.pk FROM mangasampledb.manga_target AS target,
+    mangasampledb.{0} AS cat;
+"""
+
+
+@pytest.fixture
+def database(sampleDB):
+    """Adds the NSA and a lazily created catalogue with its current view."""
+
+    sampleDB.execute('INSERT INTO mangasampledb.manga_target (mangaid) '
+                     'VALUES (\'1-1\');')
+    for catname in ['nsa', 'sdss']:
+        sampleDB.execute(catalogueSQL.format(catname))
+    createCurrentView(sampleDB, 'sdss')
+
+    return sampleDB
+
+
+@pytest.fixture
+def importModelClasses(database, tmpdir, monkeypatch):
+    """Returns a function that imports ModelClasses from scratch.
+
+    The function returns the module and a list with the number of queries
+    run since the last import.
+
+    """
+
+    monkeypatch.setenv('MANGASAMPLEDB_CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.delenv('MANGASAMPLEDB_NO_METADATA_CACHE', raising=False)
+
+    class DatabaseConnection(object):
+
+        def __init__(self):
+            self.engine = database
+            self.Base = declarative_base(bind=database)
+
+    connectionModule = types.ModuleType('DatabaseConnection')
+    connectionModule.DatabaseConnection = DatabaseConnection
+
+    for name in ['sdss', 'sdss.internal', 'sdss.internal.database']:
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules,
+                        'sdss.internal.database.DatabaseConnection',
+                        connectionModule)
+
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    event.listen(database, 'before_cursor_execute', count)
+
+    def importModule():
+        sys.modules.pop('mangaSampleDB.ModelClasses', None)
+        module = importlib.import_module('mangaSampleDB.ModelClasses')
+        queries[0] = 0
+        return module, queries
+
+    yield importModule
+
+    event.remove(database, 'before_cursor_execute', count)
+    sys.modules.pop('mangaSampleDB.ModelClasses', None)
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_unknown_names(importModelClasses, cached):
+    """Unknown names raise AttributeError without querying the DB."""
+
+    if cached:
+        importModelClasses()
+    modelClasses, queries = importModelClasses()
+
+    assert (modelClasses.cachedMetadata is not None) == cached
+
+    for name in ['__wrapped__', '_private', 'lowercase', 'NoCatalogue',
+                 'NOCATALOGUE', 'MangaTargetToNOCATALOGUE', 'CurrentNSA',
+                 'CurrentNOCATALOGUE', 'Currentsdss', 'MangaTargetTo']:
+        with pytest.raises(AttributeError, match=name):
+            getattr(modelClasses, name)
+
+    assert not hasattr(modelClasses, 'NOCATALOGUE')
+    assert queries[0] == 0
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_lazy_classes(importModelClasses, cached):
+    """Catalogue classes are created, from the cache if possible, on access."""
+
+    if cached:
+        modelClasses, __ = importModelClasses()
+        modelClasses.SDSS, modelClasses.CurrentSDSS
+    modelClasses, queries = importModelClasses()
+
+    assert 'SDSS' not in vars(modelClasses)
+    assert 'SDSS' in dir(modelClasses)
+    assert 'CurrentSDSS' in dir(modelClasses)
+
+    SDSS = modelClasses.SDSS
+    CurrentSDSS = modelClasses.CurrentSDSS
+    MangaTargetToSDSS = modelClasses.MangaTargetToSDSS
+
+    # With the cache, the tables are not reflected again.
+    assert (queries[0] == 0) == cached
+
+    assert modelClasses.SDSS is SDSS
+    assert MangaTargetToSDSS.__table__.c.keys() == ['pk', 'manga_target_pk',
+                                                    'sdss_pk']
+
+    # The explicit classes use keep_existing, so they share the tables.
+    metadata = modelClasses.Base.metadata
+    assert modelClasses.MangaTarget.__table__ is \
+        metadata.tables['mangasampledb.manga_target']
+    assert SDSS.__table__ is metadata.tables['mangasampledb.sdss']
+
+    session = Session(modelClasses.db.engine)
+    try:
+        sdss = session.query(SDSS).one()
+        assert sdss.sdssid == 7
+        assert sdss.catalogue.catalogue_name == 'sdss'
+        assert [target.mangaid for target in sdss.mangaTargets] == ['1-1']
+        current = session.query(CurrentSDSS).one()
+        assert current.mangaTarget.mangaid == '1-1'
+        assert current.sdssid == 7
+    finally:
+        session.close()
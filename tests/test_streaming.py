@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_streaming.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+Runs streamQuery on an in-memory SQLite database whose cursors record when
+they are closed.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import sqlite3
+
+import pytest
+
+import sqlalchemy as sql
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from mangaSampleDB.streaming import streamQuery
+
+
+class FakeCursor(object):
+    """A cursor that records whether it is open."""
+
+    def __init__(self, cursor, cursors):
+        self._cursor = cursor
+        self.closed = False
+        cursors.append(self)
+
+    def close(self):
+        self.closed = True
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class FakeConnection(object):
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.cursors = []
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self._connection.cursor(*args, **kwargs),
+                          self.cursors)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+nRows = 50
+
+
+@pytest.fixture
+def model():
+    """Returns a model class bound to the database, and its connection."""
+
+    connection = FakeConnection(sqlite3.connect(':memory:',
+                                                check_same_thread=False))
+    engine = sql.create_engine('sqlite://', creator=lambda: connection,
+                               poolclass=StaticPool)
+
+    Base = declarative_base(bind=engine)
+
+    class Row(Base):
+        __tablename__ = 'row'
+        pk = sql.Column(sql.Integer, primary_key=True)
+        value = sql.Column(sql.Integer)
+
+    Base.metadata.create_all()
+    engine.execute(Row.__table__.insert(),
+                   [{'pk': ii, 'value': ii * 2} for ii in range(nRows)])
+    del connection.cursors[:]
+
+    yield Row, connection
+
+    engine.dispose()
+
+
+def _openCursors(connection):
+    return [cursor for cursor in connection.cursors if not cursor.closed]
+
+
+@pytest.mark.parametrize('tuples', [False, True])
+def test_stream_all(model, tuples):
+
+    Row, connection = model
+
+    rows = list(streamQuery(Row, Row.pk < 30, batchSize=7, tuples=tuples))
+
+    assert len(rows) == 30
+    if tuples:
+        assert rows[3] == (3, 6)
+    else:
+        assert (rows[3].pk, rows[3].value) == (3, 6)
+
+    assert len(connection.cursors) > 0
+    assert _openCursors(connection) == []
+
+
+@pytest.mark.parametrize('tuples', [False, True])
+def test_stream_early_exit(model, tuples):
+    """The cursor is closed when the consumer stops early."""
+
+    Row, connection = model
+
+    stream = streamQuery(Row, batchSize=7, tuples=tuples)
+    for ii, row in enumerate(stream):
+        if ii == 10:
+            break
+
+    assert len(_openCursors(connection)) == 1
+
+    stream.close()
+    assert _openCursors(connection) == []
+
+    # And when the consumer fails.
+    with pytest.raises(RuntimeError):
+        for row in streamQuery(Row, batchSize=7, tuples=tuples):
+            raise RuntimeError('consumer failed')
+
+    assert _openCursors(connection) == []
+
+
+def test_stream_query(model):
+    """A query keeps its session, which can be used afterwards."""
+
+    Row, connection = model
+
+    session = sessionmaker(bind=Row.__table__.metadata.bind)()
+    query = session.query(Row).order_by(Row.pk.desc())
+
+    stream = streamQuery(query, Row.value > 10, batchSize=3, tuples=True)
+    assert next(stream) == (nRows - 1, (nRows - 1) * 2)
+    stream.close()
+
+    assert _openCursors(connection) == []
+    assert session.query(Row).count() == nRows
+
+    session.close()
+
+
+def test_stream_arguments(model):
+
+    Row, __ = model
+
+    with pytest.raises(TypeError, match='unexpected keyword'):
+        next(streamQuery(Row, batch_size=10))
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_table_to_db.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import pytest
+
+from astropy import table
+
+from mangaSampleDB.utils.table_to_db import (
+    table_to_db, load_data, load_data_parallel, encode_text_chunk,
+    recover_prepared_transactions, PreparedTransactionsError,
+    _get_max_prepared_transactions, _make_gid)
+
+
+@pytest.fixture
+def data():
+    """A table with one column of each type the loader supports."""
+
+    rng = np.random.RandomState(0)
+    nRows = 1000
+
+    data = table.Table()
+    data['uint8'] = rng.randint(0, 255, nRows).astype(np.uint8)
+    data['int16'] = rng.randint(-2 ** 15, 2 ** 15, nRows).astype(np.int16)
+    data['int32'] = rng.randint(-2 ** 31, 2 ** 31, nRows).astype(np.int32)
+    data['int64'] = rng.randint(-2 ** 31, 2 ** 31, nRows).astype(np.int64)
+    data['float32'] = rng.normal(size=nRows).astype(np.float32)
+    data['float64'] = rng.normal(size=nRows)
+    data['special'] = np.array([np.nan, np.inf, -np.inf, 0.1] * (nRows // 4),
+                               dtype=np.float32)
+    data['bytes'] = np.array(['J{0:d}+{1:d}'.format(ii, ii % 7)
+                              for ii in range(nRows)], dtype='S12')
+    data['unicode'] = np.array(['obj {0}'.format(ii % 13)
+                                for ii in range(nRows)])
+    data['array1d'] = rng.normal(size=(nRows, 7)).astype(np.float32)
+    data['array2d'] = rng.normal(size=(nRows, 3, 4))
+    data['intarray'] = rng.randint(0, 100, (nRows, 5)).astype(np.int32)
+
+    return data
+
+
+def _encodeRowWise(data, first_pk=1):
+    """Encodes a table row by row, as the original load_data did."""
+
+    rows = []
+    for ii, row in enumerate(data):
+        rowData = [str(ii + first_pk)]
+        for value in row:
+            if np.isscalar(value):
+                rowData.append(str(value))
+            else:
+                rowData.append(str(value.tolist())
+                               .replace('\n', '')
+                               .replace('[', '{').replace(']', '}'))
+        rows.append('\t'.join(rowData))
+
+    return '\n'.join(rows)
+
+
+def _encodingTable(masked):
+    """A small table with the column types that need special encoding."""
+
+    data = table.Table(masked=masked)
+    data['float32'] = np.array([0.1, np.nan, np.inf, -1.5e-8, 3.],
+                               dtype=np.float32)
+    data['float64'] = np.array([0.1, np.nan, -np.inf, 1e300, 1 / 3.])
+    data['int'] = np.array([0, -1, 2 ** 31 - 1, 5, 7], dtype=np.int32)
+    data['uint8'] = np.array([0, 1, 255, 3, 4], dtype=np.uint8)
+    data['bool'] = np.array([True, False, True, True, False])
+    data['bytes'] = np.array([b'J1', b'', b'a b', b'x', b'yy'], dtype='S4')
+    data['unicode'] = np.array(['obj 1', 'b', '', 'c', 'dd'])
+    data['array'] = np.arange(15, dtype=np.float32).reshape(5, 3) / 7.
+    data['array2d'] = np.arange(20, dtype=np.int64).reshape(5, 2, 2)
+    data['nanarray'] = np.array([[np.nan, 0.1]] * 5)
+
+    if masked:
+        for colname in ['float32', 'float64', 'int', 'bool', 'bytes',
+                        'unicode']:
+            data[colname].mask = [False, True, False, False, True]
+
+    return data
+
+
+@pytest.mark.parametrize('masked', [False, True])
+@pytest.mark.parametrize('first_pk', [1, 101])
+def test_encode_text_chunk_row_wise(masked, first_pk):
+    """The columnar text encoder matches the original row-wise one."""
+
+    data = _encodingTable(masked)
+
+    assert encode_text_chunk(data, first_pk=first_pk) == \
+        _encodeRowWise(data, first_pk=first_pk)
+
+    for colname in data.colnames:
+        assert encode_text_chunk(data[[colname]], first_pk=first_pk) == \
+            _encodeRowWise(data[[colname]], first_pk=first_pk)
+
+
+def _differences(engine, schema, tableA, tableB, columns=None):
+    """Returns the number of rows that differ between two tables.
+
+    If ``columns`` is set, only those columns are compared.
+
+    """
+
+    if columns is None:
+        condition = 'a IS DISTINCT FROM b'
+    else:
+        condition = ' OR '.join('a.{0} IS DISTINCT FROM b.{0}'.format(column)
+                                for column in columns)
+
+    return engine.execute(
+        'SELECT count(*) FROM {0}.{1} AS a FULL JOIN {0}.{2} AS b '
+        'USING (pk) WHERE {3};'
+        .format(schema, tableA, tableB, condition)).scalar()
+
+
+def test_binary_text_round_trip(engine, schema, data):
+    """Both COPY formats store the same values, except float32 scalars."""
+
+    for format in ['text', 'binary']:
+        table_to_db(data, None, schema, 'round_trip_' + format,
+                    engine=engine, chunk_size=300, format=format,
+                    constant_columns=[('catalogue_pk', 3)])
+
+    sameColumns = [colname for colname in data.colnames
+                   if colname not in ['float32', 'special']]
+    assert _differences(engine, schema, 'round_trip_text',
+                        'round_trip_binary',
+                        columns=sameColumns + ['catalogue_pk']) == 0
+
+    rows = engine.execute('SELECT * FROM {0}.round_trip_binary ORDER BY pk;'
+                          .format(schema)).fetchall()
+
+    assert len(rows) == len(data)
+    assert [row.pk for row in rows] == list(range(1, len(data) + 1))
+    assert all(row.catalogue_pk == 3 for row in rows)
+
+    for colname in ['uint8', 'int16', 'int32', 'int64', 'float64']:
+        assert [row[colname] for row in rows] == data[colname].tolist()
+
+    # The columns are double precision, which stores float32 values exactly.
+    assert [row.float32 for row in rows] == \
+        data['float32'].astype(np.float64).tolist()
+    assert [row.special for row in rows[:4]][1:] == \
+        [np.inf, -np.inf, float(np.float32(0.1))]
+    assert np.isnan(rows[0].special)
+
+    assert [row.bytes for row in rows] == \
+        np.char.decode(data['bytes']).tolist()
+    assert [row.unicode for row in rows] == data['unicode'].tolist()
+
+    # Array cells are stored with the exact values, as double precision.
+    assert np.array_equal(np.array([row.array1d for row in rows]),
+                          data['array1d'].astype(np.float64))
+    assert np.array_equal(np.array([row.array2d for row in rows]),
+                          data['array2d'])
+    assert np.array_equal(np.array([row.intarray for row in rows]),
+                          data['intarray'])
+
+
+def test_binary_real_columns(engine, schema, data):
+    """Floats are sent as float4 to real columns."""
+
+    engine.execute('CREATE TABLE {0}.real_columns (pk integer, float32 real, '
+                   'float64 real, array1d real[]);'.format(schema))
+
+    load_data(data[['float32', 'float64', 'array1d']], schema,
+              'real_columns', engine, chunk_size=300, format='binary')
+
+    rows = _rows(engine, schema, 'real_columns')
+
+    assert len(rows) == len(data)
+    assert np.array_equal(np.array([row.float32 for row in rows],
+                                   dtype=np.float32), data['float32'])
+    assert np.array_equal(np.array([row.float64 for row in rows],
+                                   dtype=np.float32),
+                          data['float64'].astype(np.float32))
+    assert np.array_equal(np.array([row.array1d for row in rows],
+                                   dtype=np.float32), data['array1d'])
+
+
+def _rows(engine, schema, tableName):
+    return engine.execute('SELECT * FROM {0}.{1} ORDER BY pk;'
+                          .format(schema, tableName)).fetchall()
+
+
+@pytest.mark.parametrize('format', ['text', 'binary'])
+def test_parallel_load(engine, schema, data, format):
+    """A parallel load stores the same rows as a serial one."""
+
+    maxPrepared = _get_max_prepared_transactions(engine)
+    if maxPrepared < 2:
+        pytest.skip('the server does not allow prepared transactions.')
+
+    serial = 'serial_' + format
+    parallel = 'parallel_' + format
+
+    table_to_db(data, None, schema, serial, engine=engine, chunk_size=300,
+                format=format)
+    table_to_db(data, None, schema, parallel, engine=engine,
+                chunk_size=300, workers=2, format=format)
+
+    assert len(_rows(engine, schema, parallel)) == len(data)
+    assert _differences(engine, schema, serial, parallel) == 0
+
+
+def test_parallel_load_fallback(engine, schema, data):
+    """Too few prepared transactions fall back to a serial load."""
+
+    workers = _get_max_prepared_transactions(engine) + 1
+
+    with pytest.warns(UserWarning, match='max_prepared_transactions'):
+        table_to_db(data, None, schema, 'fallback', engine=engine,
+                    chunk_size=300, workers=workers)
+
+    assert len(_rows(engine, schema, 'fallback')) == len(data)
+
+
+def test_recover_prepared_transactions(engine, schema):
+    """Prepared transactions of a dead coordinator are rolled back."""
+
+    if _get_max_prepared_transactions(engine) < 1:
+        pytest.skip('the server does not allow prepared transactions.')
+
+    engine.execute('CREATE TABLE {0}.orphan (value integer);'.format(schema))
+
+    # A pid that is not in use, as left by a coordinator that died.
+    deadPid = 2 ** 22 + 1
+    while True:
+        try:
+            os.kill(deadPid, 0)
+            deadPid += 1
+        except ProcessLookupError:
+            break
+        except PermissionError:
+            deadPid += 1
+
+    gid = _make_gid('orphan', 0).split(':')
+    gid[3] = str(deadPid)
+    gid = ':'.join(gid)
+
+    connection = engine.raw_connection()
+    dbapi_connection = connection.connection
+    dbapi_connection.tpc_begin(gid)
+    dbapi_connection.cursor().execute(
+        'INSERT INTO {0}.orphan VALUES (1);'.format(schema))
+    dbapi_connection.tpc_prepare()
+    dbapi_connection.reset()
+    connection.close()
+
+    # Transactions of a live coordinator are kept.
+    liveGid = _make_gid('orphan', 1)
+    connection = engine.raw_connection()
+    dbapi_connection = connection.connection
+    dbapi_connection.tpc_begin(liveGid)
+    dbapi_connection.tpc_prepare()
+    dbapi_connection.reset()
+    connection.close()
+
+    try:
+        assert recover_prepared_transactions(engine, 'orphan') == [gid]
+        assert recover_prepared_transactions(engine, 'other') == []
+    finally:
+        recover_prepared_transactions(engine, 'orphan', force=True)
+
+    assert engine.execute('SELECT count(*) FROM {0}.orphan;'
+                          .format(schema)).scalar() == 0
+
+
+class _FailingDBAPIConnection(object):
+    """A DBAPI connection whose n-th tpc_commit fails."""
+
+    def __init__(self, connection, failures):
+        self._connection = connection
+        self._failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def tpc_commit(self, xid):
+        self._failures['calls'] += 1
+        if self._failures['calls'] == self._failures['fail']:
+            raise RuntimeError('commit failed')
+        return self._connection.tpc_commit(xid)
+
+
+class _FailingConnection(object):
+    """A pooled connection wrapping a `_FailingDBAPIConnection`."""
+
+    def __init__(self, connection, failures):
+        self._connection = connection
+        self.connection = _FailingDBAPIConnection(connection.connection,
+                                                  failures)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+@pytest.mark.parametrize('fail', [1, 2])
+def test_parallel_commit_failure(engine, schema, data, monkeypatch, fail):
+    """A failed commit rolls back the load or reports what is prepared."""
+
+    if _get_max_prepared_transactions(engine) < 3:
+        pytest.skip('the server does not allow enough prepared '
+                    'transactions.')
+
+    tableName = 'commit_failure_{0}'.format(fail)
+    engine.execute('CREATE TABLE {0}.{1} (pk integer, int32 integer);'
+                   .format(schema, tableName))
+
+    failures = {'calls': 0, 'fail': fail}
+    rawConnection = engine.raw_connection
+    monkeypatch.setattr(engine, 'raw_connection', lambda: _FailingConnection(
+        rawConnection(), failures))
+
+    if fail == 1:
+        # Nothing had been committed, so the whole load is rolled back.
+        with pytest.raises(RuntimeError, match='commit failed'):
+            load_data_parallel(data[['int32']], schema, tableName, engine,
+                               workers=3, chunk_size=100)
+        monkeypatch.undo()
+        assert recover_prepared_transactions(engine, tableName,
+                                             force=True) == []
+        assert len(_rows(engine, schema, tableName)) == 0
+        return
+
+    with pytest.raises(PreparedTransactionsError,
+                       match='after committing 1 of 3') as info:
+        load_data_parallel(data[['int32']], schema, tableName, engine,
+                           workers=3, chunk_size=100)
+    monkeypatch.undo()
+
+    assert len(info.value.committed) == 1
+    assert len(info.value.prepared) == 2
+    assert len(_rows(engine, schema, tableName)) == len(data) // 3
+
+    assert sorted(recover_prepared_transactions(
+        engine, tableName, force=True)) == sorted(info.value.prepared)
+    assert len(_rows(engine, schema, tableName)) == len(data) // 3
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_targets.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+
+from astropy import table
+
+from mangaSampleDB.utils.table_to_db import _execute_autocommit
+from mangaSampleDB.utils.targets import (createMangaIdIndex, loadMangaTargets,
+                                         mangaIdIndexName)
+
+
+@pytest.fixture
+def writeFiles(tmpdir):
+    """Returns a function that writes a targets and a drpall file."""
+
+    def write(name, mangaids, drpallMangaids):
+
+        targetsFile = str(tmpdir.join('{0}_targets.fits'.format(name)))
+        drpallFile = str(tmpdir.join('{0}_drpall.fits'.format(name)))
+
+        # The FITS strings are padded, so mangaids must be stripped.
+        table.Table([mangaids], names=['MANGAID'],
+                    dtype=['S12']).write(targetsFile)
+        table.Table([drpallMangaids], names=['mangaid'],
+                    dtype=['S12']).write(drpallFile)
+
+        return targetsFile, drpallFile
+
+    return write
+
+
+def _mangaids(engine):
+    return [row[0] for row in engine.execute(
+        'SELECT mangaid FROM mangasampledb.manga_target ORDER BY pk;')]
+
+
+@pytest.mark.parametrize('chunkSize', [1, 3, 100])
+def test_upsert_overlapping(sampleDB, writeFiles, chunkSize):
+    """Re-ingesting overlapping mangaids only inserts the new ones."""
+
+    first = writeFiles('first', ['1-3', '1-1', ' 1-2', '1-1'], ['1-2', '12-5'])
+
+    with pytest.warns(UserWarning, match='2 repeated mangaids'):
+        assert loadMangaTargets(*first, engine=sampleDB, upsert=True,
+                                chunkSize=chunkSize)
+
+    assert _mangaids(sampleDB) == ['1-3', '1-1', '1-2', '12-5']
+
+    second = writeFiles('second', ['1-4', '1-1', '12-5'], ['1-4', '1-5 '])
+
+    with pytest.warns(UserWarning, match='not inserting 3 targets'):
+        assert loadMangaTargets(*second, engine=sampleDB, upsert=True,
+                                chunkSize=chunkSize)
+
+    assert _mangaids(sampleDB) == ['1-3', '1-1', '1-2', '12-5', '1-4', '1-5']
+
+    # Nothing is inserted the second time.
+    with pytest.warns(UserWarning, match='already in the DB'):
+        assert not loadMangaTargets(*second, engine=sampleDB, upsert=True,
+                                    chunkSize=chunkSize)
+
+    assert len(_mangaids(sampleDB)) == 6
+
+
+def test_upsert_index(sampleDB, writeFiles):
+    """Upserting fails with a clear message if the index cannot be used."""
+
+    files = writeFiles('targets', ['1-1', '1-2'], ['1-3'])
+
+    sampleDB.execute('DROP INDEX mangasampledb.{0};'.format(mangaIdIndexName))
+
+    with pytest.raises(ValueError, match='does not exist'):
+        loadMangaTargets(*files, engine=sampleDB, upsert=True)
+
+    # A concurrent build that fails on duplicates leaves an invalid index.
+    sampleDB.execute('INSERT INTO mangasampledb.manga_target (mangaid) '
+                     'VALUES (\'1-9\'), (\'1-9\');')
+    with pytest.raises(Exception, match='could not create unique index'):
+        _execute_autocommit(sampleDB,
+                            'CREATE UNIQUE INDEX CONCURRENTLY {0} '
+                            'ON mangasampledb.manga_target (mangaid);'
+                            .format(mangaIdIndexName))
+
+    with pytest.raises(ValueError, match='is invalid'):
+        loadMangaTargets(*files, engine=sampleDB, upsert=True)
+
+    sampleDB.execute('DROP INDEX mangasampledb.{0};'.format(mangaIdIndexName))
+    sampleDB.execute('CREATE INDEX {0} ON mangasampledb.manga_target '
+                     '(mangaid);'.format(mangaIdIndexName))
+
+    with pytest.raises(ValueError, match='is not unique'):
+        loadMangaTargets(*files, engine=sampleDB, upsert=True)
+
+    # createMangaIdIndex replaces the index once the duplicates are removed.
+    sampleDB.execute('DELETE FROM mangasampledb.manga_target;')
+    assert createMangaIdIndex(sampleDB)
+
+    assert loadMangaTargets(*files, engine=sampleDB, upsert=True)
+    assert _mangaids(sampleDB) == ['1-1', '1-2', '1-3']
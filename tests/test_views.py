@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+
+test_views.py
+
+Created on 17 Oct 2026.
+Licensed under a 3-clause BSD license.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+
+from mangaSampleDB.utils.views import (createCurrentView, currentViewSQL,
+                                       getCurrentViews, refreshCurrentViews)
+
+
+@pytest.fixture
+def catalogues(sampleDB):
+    """Creates two versions of a catalogue and one of another.
+
+    The columns of ``conflict`` have the same names as the view columns.
+    Each target is matched to a row of both versions of ``conflict``, and
+    the first pair is repeated in the relational table.
+
+    """
+
+    sampleDB.execute(
+        'INSERT INTO mangasampledb.manga_target (mangaid) '
+        'VALUES (\'1-1\'), (\'1-2\');'
+        'INSERT INTO mangasampledb.catalogue (catalogue_name, version) '
+        'VALUES (\'conflict\', \'v1\'), (\'conflict\', \'v2\'), '
+        '(\'other\', \'v1\');'
+        'INSERT INTO mangasampledb.current_catalogue (catalogue_pk) '
+        'SELECT pk FROM mangasampledb.catalogue '
+        'WHERE version = \'v1\';')
+
+    sampleDB.execute(
+        'CREATE TABLE mangasampledb.conflict (pk serial PRIMARY KEY, '
+        'catalogue_pk integer, mangaid text, manga_target_pk integer, '
+        'catalogue_manga_target_pk integer, value real);'
+        'INSERT INTO mangasampledb.conflict (catalogue_pk, mangaid, '
+        'manga_target_pk, catalogue_manga_target_pk, value) '
+        'SELECT cat.pk, \'x\', 0, 0, cat.pk * 10 + target.pk '
+        'FROM mangasampledb.catalogue AS cat, mangasampledb.manga_target '
+        'AS target WHERE cat.catalogue_name = \'conflict\' '
+        'ORDER BY cat.pk, target.pk;'
+        'CREATE TABLE mangasampledb.manga_target_to_conflict '
+        '(pk serial PRIMARY KEY, manga_target_pk integer, '
+        'conflict_pk integer);'
+        'INSERT INTO mangasampledb.manga_target_to_conflict '
+        '(manga_target_pk, conflict_pk) '
+        'SELECT target.pk, cat.pk FROM mangasampledb.manga_target AS target '
+        'JOIN mangasampledb.conflict AS cat '
+        'ON mod(cat.value::integer, 10) = target.pk;'
+        'INSERT INTO mangasampledb.manga_target_to_conflict '
+        '(manga_target_pk, conflict_pk) '
+        'SELECT manga_target_pk, conflict_pk '
+        'FROM mangasampledb.manga_target_to_conflict WHERE pk = 1;')
+
+    sampleDB.execute(
+        'CREATE TABLE mangasampledb.other (pk serial PRIMARY KEY, '
+        'catalogue_pk integer, value real);'
+        'INSERT INTO mangasampledb.other (catalogue_pk, value) '
+        'SELECT pk, 1 FROM mangasampledb.catalogue '
+        'WHERE catalogue_name = \'other\';'
+        'CREATE TABLE mangasampledb.manga_target_to_other '
+        '(pk serial PRIMARY KEY, manga_target_pk integer, other_pk integer);'
+        'INSERT INTO mangasampledb.manga_target_to_other '
+        '(manga_target_pk, other_pk) '
+        'SELECT target.pk, 1 FROM mangasampledb.manga_target AS target;')
+
+    return sampleDB
+
+
+def _viewColumns(engine, viewName):
+    return [row[0] for row in engine.execute(
+        'SELECT attname FROM pg_attribute '
+        'WHERE attrelid = %s::regclass AND attnum > 0 ORDER BY attnum;',
+        ('mangasampledb.' + viewName, ))]
+
+
+def _values(engine, viewName='current_conflict'):
+    return [tuple(row) for row in engine.execute(
+        'SELECT mangaid, value FROM mangasampledb.{0} '
+        'ORDER BY mangaid;'.format(viewName))]
+
+
+def _makeCurrent(engine, version):
+    engine.execute(
+        'UPDATE mangasampledb.current_catalogue SET catalogue_pk = '
+        '(SELECT pk FROM mangasampledb.catalogue '
+        'WHERE catalogue_name = \'conflict\' AND version = %s) '
+        'WHERE catalogue_pk IN (SELECT pk FROM mangasampledb.catalogue '
+        'WHERE catalogue_name = \'conflict\');', (version, ))
+
+
+def test_current_view_sql_columns():
+    """The view columns are unique, renaming or skipping conflicts."""
+
+    columns = ['pk', 'mangaid', 'manga_target_pk',
+               'catalogue_manga_target_pk', 'value']
+
+    with pytest.warns(UserWarning) as record:
+        statements = currentViewSQL('conflict', columns)
+
+    messages = [str(warning.message) for warning in record]
+    assert any('Renaming it to catalogue_mangaid' in message
+               for message in messages)
+    assert any('manga_target_pk of conflict conflicts with the view '
+               'columns. Skipping it.' in message for message in messages)
+
+    assert '"catalogue_manga_target_pk"' in statements[0]
+    assert statements[0].count('AS "pk"') == 1
+    assert 'CREATE UNIQUE INDEX current_conflict_pk_idx' in statements[1]
+
+
+def test_create_current_view(catalogues):
+
+    with pytest.warns(UserWarning):
+        createCurrentView(catalogues, 'conflict')
+
+    columns = _viewColumns(catalogues, 'current_conflict')
+    assert len(columns) == len(set(columns))
+    assert columns == ['mangaid', 'manga_target_pk', 'pk', 'catalogue_pk',
+                       'catalogue_mangaid', 'catalogue_manga_target_pk',
+                       'value']
+
+    # The repeated pair is only in the view once, and only the current
+    # version is.
+    assert _values(catalogues) == [('1-1', 11.), ('1-2', 12.)]
+
+    assert getCurrentViews(catalogues) == {'conflict': 'current_conflict'}
+
+    with pytest.raises(ValueError, match='relational table'):
+        createCurrentView(catalogues, 'catalogue')
+
+
+@pytest.mark.parametrize('concurrently', [True, False])
+def test_refresh_current_views(catalogues, concurrently):
+
+    with pytest.warns(UserWarning):
+        createCurrentView(catalogues, 'conflict')
+    createCurrentView(catalogues, 'other')
+
+    _makeCurrent(catalogues, 'v2')
+    catalogues.execute('UPDATE mangasampledb.other SET value = 2;')
+
+    # Only the view of the catalogue is refreshed.
+    refreshCurrentViews(catalogues, 'conflict', concurrently=concurrently)
+
+    assert _values(catalogues) == [('1-1', 21.), ('1-2', 22.)]
+    assert _values(catalogues, 'current_other') == [('1-1', 1.), ('1-2', 1.)]
+
+    refreshCurrentViews(catalogues, concurrently=concurrently)
+    assert _values(catalogues, 'current_other') == [('1-1', 2.), ('1-2', 2.)]
+
+    # A catalogue without a view is ignored.
+    refreshCurrentViews(catalogues, 'catalogue', concurrently=concurrently)
+
+
+def test_create_existing_view(catalogues):
+    """An existing view is refreshed, or recreated with overwrite=True."""
+
+    with pytest.warns(UserWarning):
+        createCurrentView(catalogues, 'conflict')
+
+    _makeCurrent(catalogues, 'v2')
+    createCurrentView(catalogues, 'conflict')
+    assert _values(catalogues) == [('1-1', 21.), ('1-2', 22.)]
+
+    catalogues.execute('ALTER TABLE mangasampledb.conflict '
+                       'ADD COLUMN extra integer;')
+
+    with pytest.warns(UserWarning, match='already exists. Overwriting it'):
+        createCurrentView(catalogues, 'conflict', overwrite=True)
+
+    assert _viewColumns(catalogues, 'current_conflict')[-1] == 'extra'
+    assert _values(catalogues) == [('1-1', 21.), ('1-2', 22.)]
+
+
+def test_refresh_needs_unique_index(catalogues):
+    """The unique index is what allows refreshing the views concurrently."""
+
+    createCurrentView(catalogues, 'other')
+    catalogues.execute('DROP INDEX mangasampledb.current_other_pk_idx;')
+
+    with pytest.raises(Exception, match='concurrently'):
+        refreshCurrentViews(catalogues, 'other')
+
+    refreshCurrentViews(catalogues, 'other', concurrently=False)